@@ -5,3 +5,7 @@ from django.utils.translation import gettext_lazy as _
 class AclsConfig(AppConfig):
     name = 'acls'
     verbose_name = _('Acls')
+
+    def ready(self):
+        super().ready()
+        from . import signal_handlers
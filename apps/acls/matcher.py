@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+#
+from bisect import bisect_right
+from collections import defaultdict
+from ipaddress import ip_address
+
+from common.utils import get_logger
+from common.utils.ip import IPGroup, parse_ip_entry
+from common.utils.connection import VersionedLocalCache
+
+logger = get_logger(__file__)
+
+__all__ = [
+    'NamePatternIndex', 'IPIntervalIndex', 'LoginAssetACLMatcher',
+    'LoginACLMatcher', 'acl_matcher_cache',
+]
+
+MATCH_ALL = '*'
+
+
+class NamePatternIndex:
+    """
+    Which items match a name
+
+    Pattern `*` matches all, others match the name exactly, the same as the
+    json `__contains` lookups before, `*` is the only wildcard.
+    """
+
+    def __init__(self):
+        self.all = set()
+        self.exact = defaultdict(set)
+
+    def add(self, patterns, item):
+        for pattern in patterns or ():
+            if not isinstance(pattern, str):
+                continue
+            if pattern == MATCH_ALL:
+                self.all.add(item)
+            else:
+                self.exact[pattern].add(item)
+
+    def match(self, name):
+        matched = set(self.all)
+        matched.update(self.exact.get(name, ()))
+        return matched
+
+
+class IPIntervalIndex:
+    """
+    Which items contain an ip, the same rules as `common.utils.ip.contains_ip`
+
+    Networks and segments are parsed once into integer intervals by
+    `parse_ip_entry`, every entry also matches the same string. The
+    intervals of all items are split into sorted disjoint segments with the
+    items cover them, so a lookup is one bisect. A single group uses `IPGroup`.
+    """
+
+    def __init__(self):
+        self.all = set()
+        self.entries = defaultdict(set)
+        # { version: [(start, end, item), ] }
+        self._intervals = defaultdict(list)
+        # { version: ([segment_start, ], [frozenset(item), ]) }
+        self._segments = {}
+
+    def add(self, ip_group, item):
+        for entry in ip_group or ():
+            if not isinstance(entry, str):
+                continue
+            if entry == MATCH_ALL:
+                self.all.add(item)
+                continue
+            self.entries[entry].add(item)
+            for version, start, end in parse_ip_entry(entry) or ():
+                self._intervals[version].append((start, end, item))
+        self._segments = {}
+
+    def _build_segments(self, version):
+        events = []
+        for start, end, item in self._intervals[version]:
+            events.append((start, 1, item))
+            events.append((end + 1, -1, item))
+        events.sort(key=lambda e: e[0])
+
+        starts, covers = [], []
+        active = defaultdict(int)
+        i = 0
+        while i < len(events):
+            point = events[i][0]
+            while i < len(events) and events[i][0] == point:
+                __, change, item = events[i]
+                active[item] += change
+                if not active[item]:
+                    del active[item]
+                i += 1
+            starts.append(point)
+            covers.append(frozenset(active))
+        self._segments[version] = (starts, covers)
+        return starts, covers
+
+    def match(self, ip):
+        matched = set(self.all)
+        matched.update(self.entries.get(ip, ()))
+        try:
+            address = ip_address(ip)
+        except ValueError:
+            return matched
+
+        version = address.version
+        if not self._intervals.get(version):
+            return matched
+        segments = self._segments.get(version)
+        starts, covers = segments or self._build_segments(version)
+        i = bisect_right(starts, int(address)) - 1
+        if i >= 0:
+            matched.update(covers[i])
+        return matched
+
+
+class LoginAssetACLMatcher:
+    """
+    Compiled login asset acls of an org
+
+    :param acls: [acl, ] in priority order
+    """
+
+    def __init__(self, acls):
+        # [(id, is_active, action), ]
+        self.acls = []
+        self.users = NamePatternIndex()
+        self.hostnames = NamePatternIndex()
+        self.ips = IPIntervalIndex()
+        self.system_user_names = NamePatternIndex()
+        self.system_user_usernames = NamePatternIndex()
+        self.system_user_protocols = NamePatternIndex()
+
+        for i, acl in enumerate(acls):
+            self.acls.append((str(acl.id), acl.is_active, acl.action))
+            users = acl.users or {}
+            assets = acl.assets or {}
+            system_users = acl.system_users or {}
+            self.users.add(users.get('username_group'), i)
+            self.hostnames.add(assets.get('hostname_group'), i)
+            self.ips.add(assets.get('ip_group'), i)
+            self.system_user_names.add(system_users.get('name_group'), i)
+            self.system_user_usernames.add(system_users.get('username_group'), i)
+            self.system_user_protocols.add(system_users.get('protocol_group'), i)
+
+    def __len__(self):
+        return len(self.acls)
+
+    def match(self, user, asset, system_user, action=None, valid_only=False):
+        """ :return: [acl_id, ] in priority order """
+        if not self.acls:
+            return []
+        matched = self.users.match(user.username)
+        lookups = (
+            (self.hostnames, asset.hostname),
+            (self.ips, asset.ip),
+            (self.system_user_names, system_user.name),
+            (self.system_user_usernames, system_user.username),
+            (self.system_user_protocols, system_user.protocol),
+        )
+        for index, value in lookups:
+            if not matched:
+                return []
+            matched &= index.match(value)
+
+        ids = []
+        for i in sorted(matched):
+            acl_id, is_active, acl_action = self.acls[i]
+            if valid_only and not is_active:
+                continue
+            if action is not None and acl_action != action:
+                continue
+            ids.append(acl_id)
+        return ids
+
+
+class LoginACLMatcher:
+    """
+    Compiled login acls of all users
+
+    :param acls: [acl, ] in priority order
+    """
+
+    class Rule:
+        __slots__ = ('id', 'action', 'ips', 'time_periods')
+
+        def __init__(self, acl):
+            self.id = str(acl.id)
+            self.action = acl.action
+            rules = acl.rules or {}
+            self.ips = IPGroup.compile(rules.get('ip_group'))
+            self.time_periods = rules.get('time_period')
+
+    def __init__(self, acls):
+        # { user_id: [rule, ] }, only active acls
+        self.user_rules = defaultdict(list)
+        for acl in acls:
+            if not acl.is_active:
+                continue
+            self.user_rules[str(acl.user_id)].append(self.Rule(acl))
+
+    def get_rules(self, user_id):
+        return self.user_rules.get(str(user_id), [])
+
+
+class ACLMatcherLocalCache(VersionedLocalCache):
+    """
+    Compiled matchers in memory, keys:
+        `login_acl`: LoginACLMatcher
+        `login_asset_acl_<org_id>`: LoginAssetACLMatcher
+    """
+    LOGIN_ACL_KEY = 'login_acl'
+    LOGIN_ASSET_ACL_KEY = 'login_asset_acl_{}'
+
+    def __init__(self):
+        super().__init__('acls_matcher', loader=self.load_matcher)
+
+    @staticmethod
+    def load_matcher(key):
+        from orgs.utils import tmp_to_org
+        from .models import LoginACL, LoginAssetACL
+
+        if key == ACLMatcherLocalCache.LOGIN_ACL_KEY:
+            acls = LoginACL.objects.all().only('id', 'user_id', 'is_active', 'action', 'rules')
+            return LoginACLMatcher(list(acls))
+
+        org_id = key[len(ACLMatcherLocalCache.LOGIN_ASSET_ACL_KEY.format('')):]
+        with tmp_to_org(org_id):
+            acls = LoginAssetACL.objects.all()
+            return LoginAssetACLMatcher(list(acls))
+
+    def get_login_acl_matcher(self):
+        return self.get(self.LOGIN_ACL_KEY)
+
+    def get_login_asset_acl_matcher(self, org_id):
+        return self.get(self.LOGIN_ASSET_ACL_KEY.format(org_id))
+
+    def refresh(self, key):
+        """ Drop at once in this process, others after the debounce """
+        self.evict(key)
+        self.expire(key)
+
+
+acl_matcher_cache = ACLMatcherLocalCache()
@@ -1,8 +1,8 @@
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 from .base import BaseACL, BaseACLQuerySet
+from ..matcher import acl_matcher_cache
 from common.utils import get_request_ip, get_ip_city
-from common.utils.ip import contains_ip
 from common.utils.time_period import contains_time_period
 from common.utils.timezone import local_now_display
 
@@ -53,39 +53,46 @@ class LoginACL(BaseACL):
     def filter_acl(cls, user):
         return user.login_acls.all().valid().distinct()
 
+    @staticmethod
+    def get_user_rules(user):
+        """ Compiled active acls of the user in priority order """
+        return acl_matcher_cache.get_login_acl_matcher().get_rules(user.id)
+
     @staticmethod
     def allow_user_confirm_if_need(user, ip):
-        acl = LoginACL.filter_acl(user).filter(
-            action=LoginACL.ActionChoices.confirm
-        ).first()
+        rule = next((
+            r for r in LoginACL.get_user_rules(user)
+            if r.action == LoginACL.ActionChoices.confirm
+        ), None)
+        if not rule:
+            return False, None
+        acl = LoginACL.objects.filter(id=rule.id).first()
         acl = acl if acl and acl.reviewers.exists() else None
         if not acl:
             return False, acl
-        ip_group = acl.rules.get('ip_group')
-        time_periods = acl.rules.get('time_period')
-        is_contain_ip = contains_ip(ip, ip_group)
-        is_contain_time_period = contains_time_period(time_periods)
+        is_contain_ip = rule.ips.contains(ip)
+        is_contain_time_period = contains_time_period(rule.time_periods)
         return is_contain_ip and is_contain_time_period, acl
 
     @staticmethod
     def allow_user_to_login(user, ip):
-        acl = LoginACL.filter_acl(user).exclude(
-            action=LoginACL.ActionChoices.confirm
-        ).first()
-        if not acl:
+        rule = next((
+            r for r in LoginACL.get_user_rules(user)
+            if r.action != LoginACL.ActionChoices.confirm
+        ), None)
+        if not rule:
             return True, ''
-        ip_group = acl.rules.get('ip_group')
-        time_periods = acl.rules.get('time_period')
-        is_contain_ip = contains_ip(ip, ip_group)
-        is_contain_time_period = contains_time_period(time_periods)
+        is_contain_ip = rule.ips.contains(ip)
+        is_contain_time_period = contains_time_period(rule.time_periods)
+        action_allow = rule.action == LoginACL.ActionChoices.allow
 
         reject_type = ''
         if is_contain_ip and is_contain_time_period:
-            allow = acl.action_allow
+            allow = action_allow
             if not allow:
                 reject_type = 'ip' if is_contain_ip else 'time'
         else:
-            allow = not acl.action_allow
+            allow = not action_allow
             if not allow:
                 reject_type = 'ip' if not is_contain_ip else 'time'
 
@@ -1,9 +1,9 @@
 from django.db import models
-from django.db.models import Q
 from django.utils.translation import gettext_lazy as _
 from orgs.mixins.models import OrgModelMixin, OrgManager
+from orgs.utils import get_current_org
 from .base import BaseACL, BaseACLQuerySet
-from common.utils.ip import contains_ip
+from ..matcher import acl_matcher_cache
 
 
 class ACLManager(OrgManager):
@@ -39,44 +39,21 @@ class LoginAssetACL(BaseACL, OrgModelMixin):
         return self.name
 
     @classmethod
-    def filter(cls, user, asset, system_user, action):
-        queryset = cls.objects.filter(action=action)
-        queryset = cls.filter_user(user, queryset)
-        queryset = cls.filter_asset(asset, queryset)
-        queryset = cls.filter_system_user(system_user, queryset)
-        return queryset
-
-    @classmethod
-    def filter_user(cls, user, queryset):
-        queryset = queryset.filter(
-            Q(users__username_group__contains=user.username) |
-            Q(users__username_group__contains='*')
-        )
-        return queryset
+    def get_matcher(cls):
+        return acl_matcher_cache.get_login_asset_acl_matcher(get_current_org().id)
 
     @classmethod
-    def filter_asset(cls, asset, queryset):
-        queryset = queryset.filter(
-            Q(assets__hostname_group__contains=asset.hostname) |
-            Q(assets__hostname_group__contains='*')
-        )
-        ids = [q.id for q in queryset if contains_ip(asset.ip, q.assets.get('ip_group', []))]
-        queryset = cls.objects.filter(id__in=ids)
-        return queryset
+    def filter(cls, user, asset, system_user, action):
+        ids = cls.get_matcher().match(user, asset, system_user, action=action)
+        return cls.objects.filter(id__in=ids)
 
     @classmethod
-    def filter_system_user(cls, system_user, queryset):
-        queryset = queryset.filter(
-            Q(system_users__name_group__contains=system_user.name) |
-            Q(system_users__name_group__contains='*')
-        ).filter(
-            Q(system_users__username_group__contains=system_user.username) |
-            Q(system_users__username_group__contains='*')
-        ).filter(
-            Q(system_users__protocol_group__contains=system_user.protocol) |
-            Q(system_users__protocol_group__contains='*')
-        )
-        return queryset
+    def get_first_valid(cls, user, asset, system_user, action):
+        """ No query if no acl matched, the most cases """
+        ids = cls.get_matcher().match(user, asset, system_user, action=action, valid_only=True)
+        if not ids:
+            return None
+        return cls.objects.filter(id=ids[0]).first()
 
     @classmethod
     def create_login_asset_confirm_ticket(cls, user, asset, system_user, assignees, org_id):
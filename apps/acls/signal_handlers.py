@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+#
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from common.signals import django_ready
+from common.decorator import on_transaction_commit
+from common.utils import get_logger
+from orgs.models import Organization
+from .models import LoginACL, LoginAssetACL
+from .matcher import acl_matcher_cache
+
+logger = get_logger(__file__)
+
+
+@receiver([post_save, post_delete], sender=LoginAssetACL)
+def on_login_asset_acl_change(sender, instance, **kwargs):
+    org_ids = {str(instance.org_id), Organization.ROOT_ID}
+    for org_id in org_ids:
+        key = acl_matcher_cache.LOGIN_ASSET_ACL_KEY.format(org_id)
+        on_transaction_commit(acl_matcher_cache.refresh)(key)
+
+
+@receiver([post_save, post_delete], sender=LoginACL)
+def on_login_acl_change(sender, instance, **kwargs):
+    on_transaction_commit(acl_matcher_cache.refresh)(acl_matcher_cache.LOGIN_ACL_KEY)
+
+
+@receiver(django_ready)
+def subscribe_acl_matcher_change(sender, **kwargs):
+    logger.debug("Start subscribe for acl matcher change")
+    acl_matcher_cache.subscribe()
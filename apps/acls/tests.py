@@ -1,3 +1,106 @@
-from django.test import TestCase
+import random
 
-# Create your tests here.
+from django.test import SimpleTestCase
+
+from common.utils.ip import contains_ip
+from .matcher import NamePatternIndex, IPIntervalIndex
+
+
+class NamePatternIndexTestCase(SimpleTestCase):
+    def setUp(self):
+        self.index = NamePatternIndex()
+        self.index.add(['admin', 'root'], 1)
+        self.index.add(['*'], 2)
+        self.index.add(['admin*', 'web-01'], 3)
+        self.index.add(None, 4)
+        self.index.add(['admin', None, 5], 5)
+
+    def test_exact(self):
+        self.assertEqual(self.index.match('admin'), {1, 2, 5})
+        self.assertEqual(self.index.match('root'), {1, 2})
+        self.assertEqual(self.index.match('web-01'), {2, 3})
+
+    def test_star_is_the_only_wildcard(self):
+        # Same as the json `__contains` lookup, `admin*` is not a prefix
+        self.assertEqual(self.index.match('admin1'), {2})
+        self.assertEqual(self.index.match('administrator'), {2})
+        self.assertEqual(self.index.match('admin*'), {2, 3})
+        self.assertEqual(self.index.match('Admin'), {2})
+
+    def test_no_match(self):
+        self.assertEqual(self.index.match(''), {2})
+        self.assertEqual(self.index.match(None), {2})
+        self.assertEqual(NamePatternIndex().match('admin'), set())
+
+
+class IPIntervalIndexTestCase(SimpleTestCase):
+    groups = {
+        1: ['192.168.1.1'],
+        2: ['192.168.1.0/24', '10.1.1.1-10.1.1.20'],
+        3: ['10.1.1.10-10.1.1.30', 'db.example.com'],
+        4: ['*'],
+        5: ['2001:db8::/64', '2001:db8:1::1'],
+        6: ['10.1.1.20-10.1.1.1'],
+        7: [],
+    }
+
+    def setUp(self):
+        self.index = IPIntervalIndex()
+        for item, group in self.groups.items():
+            self.index.add(group, item)
+
+    def expected(self, ip):
+        return {item for item, group in self.groups.items() if contains_ip(ip, group)}
+
+    def test_match(self):
+        cases = [
+            ('192.168.1.1', {1, 2, 4}),
+            ('192.168.1.255', {2, 4}),
+            ('192.168.2.1', {4}),
+            ('10.1.1.1', {2, 4, 6}),
+            ('10.1.1.15', {2, 3, 4, 6}),
+            ('10.1.1.20', {2, 3, 4, 6}),
+            ('10.1.1.21', {3, 4}),
+            ('10.1.1.31', {4}),
+            ('db.example.com', {3, 4}),
+            ('2001:db8::1', {4, 5}),
+            ('2001:db8:1::1', {4, 5}),
+            ('2001:db9::1', {4}),
+            ('', {4}),
+        ]
+        for ip, items in cases:
+            self.assertEqual(self.index.match(ip), items, msg=ip)
+            self.assertEqual(self.index.match(ip), self.expected(ip), msg=ip)
+
+    def test_add_after_match(self):
+        self.assertEqual(self.index.match('172.16.0.1'), {4})
+        self.index.add(['172.16.0.0/12'], 8)
+        self.assertEqual(self.index.match('172.16.0.1'), {4, 8})
+
+    def test_random_groups_same_as_contains_ip(self):
+        rnd = random.Random(0)
+
+        def rand_ip():
+            return '10.0.{}.{}'.format(rnd.randint(0, 3), rnd.randint(0, 255))
+
+        entries = [
+            rand_ip,
+            lambda: '10.0.{}.0/{}'.format(rnd.randint(0, 3), rnd.choice([24, 25, 30])),
+            lambda: '{}-{}'.format(rand_ip(), rand_ip()),
+            lambda: 'host{}'.format(rnd.randint(0, 3)),
+            lambda: '2001:db8::{:x}-2001:db8::{:x}'.format(rnd.randint(0, 50), rnd.randint(0, 50)),
+        ]
+        groups = {
+            i: [rnd.choice(entries)() for __ in range(rnd.randint(0, 6))]
+            for i in range(100)
+        }
+        index = IPIntervalIndex()
+        for item, group in groups.items():
+            index.add(group, item)
+
+        ips = [rand_ip() for __ in range(300)]
+        ips += ['host{}'.format(i) for i in range(5)]
+        ips += ['2001:db8::{:x}'.format(i) for i in range(0, 60, 3)]
+        for ip in ips:
+            expected = {item for item, group in groups.items() if contains_ip(ip, group)}
+            self.assertEqual(index.match(ip), expected, msg=ip)
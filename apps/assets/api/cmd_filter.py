@@ -2,7 +2,7 @@
 #
 
 from rest_framework.response import Response
-from rest_framework.generics import CreateAPIView
+from rest_framework.generics import CreateAPIView, GenericAPIView
 from django.shortcuts import get_object_or_404
 
 from common.utils import reverse
@@ -13,6 +13,7 @@ from .. import serializers
 
 __all__ = [
     'CommandFilterViewSet', 'CommandFilterRuleViewSet', 'CommandConfirmAPI',
+    'CommandFilterCheckAPI',
 ]
 
 
@@ -83,3 +84,31 @@ class CommandConfirmAPI(CreateAPIView):
         serializer.is_valid(raise_exception=True)
         return serializer
 
+
+class CommandFilterCheckAPI(GenericAPIView):
+    """ Check a batch of commands with the rules of user, asset and system user """
+    serializer_class = serializers.CommandFilterCheckSerializer
+    rbac_perms = {
+        'POST': 'assets.view_commandfilterrule'
+    }
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = dict(serializer.validated_data)
+        commands = data.pop('commands')
+
+        matcher = CommandFilterRule.get_matcher(**data)
+        results = []
+        for command, matched in zip(commands, matcher.match_many(commands)):
+            if matched is None:
+                action, rule_id, matched_cmd = None, None, ''
+            else:
+                action, rule_id, matched_cmd = matched.action, matched.rule_id, matched.matched
+            results.append({
+                'command': command,
+                'action': action,
+                'rule_id': rule_id,
+                'matched': matched_cmd,
+            })
+        return Response(data=results)
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+#
+import re
+from functools import lru_cache
+from collections import namedtuple
+
+__all__ = [
+    'CommandFilterMatcher', 'MatchedRule', 'construct_command_regex', 'compile_regex_cached',
+]
+
+MatchedRule = namedtuple('MatchedRule', ('rule_id', 'action', 'matched'))
+
+
+def construct_command_regex(content):
+    regex = []
+    content = content.replace('\r\n', '\n')
+    for _cmd in content.split('\n'):
+        cmd = re.sub(r'\s+', ' ', _cmd)
+        cmd = re.escape(cmd)
+        cmd = cmd.replace('\\ ', r'\s+')
+
+        if ' ' in _cmd:
+            regex.append(cmd)
+            continue
+
+        if not cmd:
+            continue
+
+        if cmd[-1].isalpha():
+            regex.append(r'\b{0}\b'.format(cmd))
+        else:
+            regex.append(r'\b{0}'.format(cmd))
+    s = r'{}'.format('|'.join(regex))
+    return s
+
+
+@lru_cache(maxsize=10240)
+def compile_regex_cached(regex, ignore_case):
+    """ Raise re.error if the regex is invalid """
+    flags = re.IGNORECASE if ignore_case else 0
+    return re.compile(regex, flags)
+
+
+class CommandFilterMatcher:
+    """
+    Ordered matcher of a command filter rule set
+
+    Rules are sorted by priority, the first matched rule decides the action.
+    Most rules are command type, their regex is `\\bword\\b|\\bword2\\b`,
+    it matches only if one of the words of the command is in the rule. Those
+    rules are indexed by word, so a command only searches the rules its words
+    hit and the regex rules, instead of all rules.
+
+    :param rules: [(rule_id, regex, ignore_case, action), ] in match order
+    """
+    word_rule_regex = re.compile(r'\\b(\w+)\\b', re.ASCII)
+    command_word_regex = re.compile(r'\w+')
+
+    def __init__(self, rules):
+        self.rules = []
+        # Rules can't be indexed, search them always
+        self.regex_rules = []
+        # { word: [rule_index, ] }, word of ignore case rules is lower case
+        self.words_index = {}
+        self.ignore_case_words_index = {}
+
+        for rule_id, regex, ignore_case, action in rules:
+            try:
+                pattern = compile_regex_cached(regex, ignore_case)
+            except re.error:
+                continue
+            i = len(self.rules)
+            self.rules.append((rule_id, pattern, action))
+
+            words = self.get_rule_words(regex)
+            if words is None:
+                self.regex_rules.append(i)
+                continue
+            if ignore_case:
+                index = self.ignore_case_words_index
+                words = {w.lower() for w in words}
+            else:
+                index = self.words_index
+            for word in words:
+                index.setdefault(word, []).append(i)
+
+    @classmethod
+    def get_rule_words(cls, regex):
+        """ Words of the regex if it's `\\bword\\b|...`, else None """
+        if not regex:
+            return None
+        words = set()
+        for item in regex.split('|'):
+            matched = cls.word_rule_regex.fullmatch(item)
+            if not matched:
+                return None
+            words.add(matched.group(1))
+        return words
+
+    def __len__(self):
+        return len(self.rules)
+
+    def get_candidates(self, command):
+        if not command.isascii():
+            # Ignore case matching of non ascii chars is not simple lower,
+            # e.g. `\u212a` matches `k`, search all rules
+            return range(len(self.rules))
+
+        candidates = set(self.regex_rules)
+        for word in self.command_word_regex.findall(command):
+            candidates.update(self.words_index.get(word, ()))
+            candidates.update(self.ignore_case_words_index.get(word.lower(), ()))
+        return sorted(candidates)
+
+    def match(self, command, actions=None):
+        """
+        :param actions: only rules of these actions take effect, all if None
+        :return: MatchedRule or None
+        """
+        for i in self.get_candidates(command):
+            rule_id, pattern, action = self.rules[i]
+            if actions is not None and action not in actions:
+                continue
+            found = pattern.search(command)
+            if found:
+                return MatchedRule(rule_id, action, found.group())
+        return None
+
+    def match_many(self, commands, actions=None):
+        return [self.match(command, actions=actions) for command in commands]
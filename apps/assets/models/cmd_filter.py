@@ -2,9 +2,13 @@
 #
 import uuid
 import re
+import time
+import hashlib
+from collections import OrderedDict
 
 from django.db import models
 from django.db.models import Q
+from django.core.cache import cache
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils.translation import gettext_lazy as _
 
@@ -14,6 +18,10 @@ from ..models import SystemUser, Asset
 
 from common.utils import lazyproperty, get_logger, get_object_or_none
 from orgs.mixins.models import OrgModelMixin
+from orgs.utils import current_org
+from ..cmd_filter_matcher import (
+    CommandFilterMatcher, construct_command_regex, compile_regex_cached
+)
 
 logger = get_logger(__file__)
 
@@ -70,6 +78,14 @@ class CommandFilterRule(OrgModelMixin):
 
     ACTION_UNKNOWN = 10
 
+    RULES_VERSION_CACHE_KEY = 'ASSETS_CMD_FILTER_RULES_VERSION'
+    RULES_CACHE_KEY = 'ASSETS_CMD_FILTER_RULES_{}_{}'
+    RULES_CACHE_TTL = 3600
+    MATCHERS_MAX_SIZE = 1024
+    # LRU, { (user_id, user_group_id, system_user_id, asset_id, application_id, org_id, current_org_id):
+    #   (version, matcher) }
+    _matchers = OrderedDict()
+
     class ActionChoices(models.IntegerChoices):
         deny = 0, _('Deny')
         allow = 9, _('Allow')
@@ -111,26 +127,7 @@ class CommandFilterRule(OrgModelMixin):
 
     @classmethod
     def construct_command_regex(cls, content):
-        regex = []
-        content = content.replace('\r\n', '\n')
-        for _cmd in content.split('\n'):
-            cmd = re.sub(r'\s+', ' ', _cmd)
-            cmd = re.escape(cmd)
-            cmd = cmd.replace('\\ ', '\s+')
-
-            if ' ' in _cmd:
-                regex.append(cmd)
-                continue
-
-            if not cmd:
-                continue
-
-            if cmd[-1].isalpha():
-                regex.append(r'\b{0}\b'.format(cmd))
-            else:
-                regex.append(r'\b{0}'.format(cmd))
-        s = r'{}'.format('|'.join(regex))
-        return s
+        return construct_command_regex(content)
 
     @staticmethod
     def compile_regex(regex, ignore_case):
@@ -146,8 +143,9 @@ class CommandFilterRule(OrgModelMixin):
         return True, '', pattern
 
     def match(self, data):
-        succeed, error, pattern = self.compile_regex(self.pattern, self.ignore_case)
-        if not succeed:
+        try:
+            pattern = compile_regex_cached(self.pattern, self.ignore_case)
+        except re.error:
             return self.ACTION_UNKNOWN, ''
 
         found = pattern.search(data)
@@ -220,3 +218,73 @@ class CommandFilterRule(OrgModelMixin):
         else:
             rules = cls.objects.none()
         return rules
+
+    # Compiled rule set
+    @classmethod
+    def get_rules_version(cls):
+        cache.add(cls.RULES_VERSION_CACHE_KEY, int(time.time() * 1000), None)
+        return cache.get(cls.RULES_VERSION_CACHE_KEY)
+
+    @classmethod
+    def expire_rules_cache(cls):
+        try:
+            cache.incr(cls.RULES_VERSION_CACHE_KEY)
+        except ValueError:
+            cache.set(cls.RULES_VERSION_CACHE_KEY, int(time.time() * 1000), None)
+
+    @classmethod
+    def get_matcher(cls, user_id=None, user_group_id=None, system_user_id=None,
+                    asset_id=None, application_id=None, org_id=None):
+        """
+        Compiled matcher of the rules `get_queryset` returns, memoized in
+        process and the rules cached, both expired by the rules version.
+        `get_queryset` filters in the current org, so it's a part of the key.
+        """
+        kwargs = dict(
+            user_id=user_id, user_group_id=user_group_id, system_user_id=system_user_id,
+            asset_id=asset_id, application_id=application_id, org_id=org_id
+        )
+        key = tuple(str(v or '') for v in kwargs.values()) + (str(current_org.id),)
+        version = cls.get_rules_version()
+
+        item = cls._matchers.get(key)
+        if item and item[0] == version:
+            try:
+                cls._matchers.move_to_end(key)
+            except KeyError:
+                # Popped by another thread
+                pass
+            return item[1]
+
+        digest = hashlib.md5(':'.join(key).encode()).hexdigest()
+        cache_key = cls.RULES_CACHE_KEY.format(version, digest)
+        rules = cache.get(cache_key)
+        if rules is None:
+            queryset = cls.get_queryset(**kwargs).order_by('priority', 'action')
+            rules = [
+                (str(rule.id), rule.pattern, rule.ignore_case, rule.action)
+                for rule in queryset
+            ]
+            cache.set(cache_key, rules, cls.RULES_CACHE_TTL)
+
+        matcher = CommandFilterMatcher(rules)
+        cls._matchers[key] = (version, matcher)
+        while len(cls._matchers) > cls.MATCHERS_MAX_SIZE:
+            try:
+                cls._matchers.popitem(last=False)
+            except KeyError:
+                break
+        return matcher
+
+    @classmethod
+    def check_command(cls, command, **kwargs):
+        """
+        Same as checking `get_queryset(**kwargs)` rules one by one with `match`,
+        the first matched rule decides, a matched rule not allow denies
+
+        :return: (can_run, matched_command)
+        """
+        matched = cls.get_matcher(**kwargs).match(command)
+        if matched is None or matched.action == cls.ActionChoices.allow:
+            return True, None
+        return False, matched.matched
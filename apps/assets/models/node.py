@@ -3,10 +3,9 @@
 import re
 import time
 import uuid
+import struct
 import threading
 import os
-import time
-import uuid
 
 from collections import defaultdict
 from django.db import models, transaction
@@ -18,12 +17,14 @@ from django.db.transaction import atomic
 from django.core.cache import cache
 
 from common.utils.lock import DistributedLock
+from common.utils.connection import VersionedLocalCache
 from common.utils.common import timeit
 from common.db.models import output_as_string
 from common.utils import get_logger
 from orgs.mixins.models import OrgModelMixin, OrgManager
 from orgs.utils import get_current_org, tmp_to_org, tmp_to_root_org
 from orgs.models import Organization
+from ..node_mapping import NodeAssetIdsMapping
 
 
 __all__ = ['Node', 'FamilyMixin', 'compute_parent_key', 'NodeQuerySet']
@@ -206,6 +207,7 @@ class FamilyMixin:
         if not self.is_node:
             self.key = parent.key + ':fake'
             return
+        from ..signals import post_node_key_change
         children = self.get_all_children()
         old_key = self.key
         with transaction.atomic():
@@ -214,6 +216,9 @@ class FamilyMixin:
             for child in children:
                 child.key = child.key.replace(old_key, self.key, 1)
                 child.save()
+            post_node_key_change.send(
+                sender=self.__class__, instance=self, old_key=old_key, new_key=self.key
+            )
 
     def get_siblings(self, with_self=False):
         key = ':'.join(self.key.split(':')[:-1])
@@ -255,56 +260,49 @@ class FamilyMixin:
         return [*tuple(ancestors), self, *tuple(children)]
 
 
-class NodeAllAssetsMappingMixin:
-    # Use a new plan
+class NodeAllAssetIdsMappingLocalCache(VersionedLocalCache):
+    """
+    { org_id: NodeAssetIdsMapping } in memory, the mapping and its version
+    are in cache, changes are applied to the mapping in cache then broadcast
+    """
 
-    # { org_id: { node_key: [ asset1_id, asset2_id ] } }
-    orgid_nodekey_assetsid_mapping = defaultdict(dict)
-    locks_for_get_mapping_from_cache = defaultdict(threading.Lock)
+    def __init__(self):
+        super().__init__('node_all_asset_ids_mapping')
 
-    @classmethod
-    def get_lock(cls, org_id):
-        lock = cls.locks_for_get_mapping_from_cache[str(org_id)]
-        return lock
+    def get_version_cache_key(self, key):
+        return NodeAllAssetsMappingMixin._get_cache_key_for_node_all_asset_ids_mapping_version(key)
 
-    @classmethod
-    def get_node_all_asset_ids_mapping(cls, org_id):
-        _mapping = cls.get_node_all_asset_ids_mapping_from_memory(org_id)
-        if _mapping:
-            return _mapping
-
-        logger.debug(f'Get node asset mapping from memory failed, acquire thread lock: '
-                     f'thread={threading.get_ident()} '
-                     f'org_id={org_id}')
-        with cls.get_lock(org_id):
-            logger.debug(f'Acquired thread lock ok. check if mapping is in memory now: '
-                         f'thread={threading.get_ident()} '
-                         f'org_id={org_id}')
-            _mapping = cls.get_node_all_asset_ids_mapping_from_memory(org_id)
-            if _mapping:
-                logger.debug(f'Mapping is already in memory now: '
-                             f'thread={threading.get_ident()} '
-                             f'org_id={org_id}')
-                return _mapping
+    def load(self, key):
+        mapping, version = NodeAllAssetsMappingMixin \
+            .get_node_all_asset_ids_mapping_from_cache_or_generate_to_cache(key)
+        return mapping, version or 0
 
-            _mapping = cls.get_node_all_asset_ids_mapping_from_cache_or_generate_to_cache(org_id)
-            cls.set_node_all_asset_ids_mapping_to_memory(org_id, mapping=_mapping)
-        return _mapping
+    def commit(self, key, deltas):
+        if deltas is None:
+            return NodeAllAssetsMappingMixin.expire_node_all_asset_ids_mapping_from_cache(key)
+        return NodeAllAssetsMappingMixin.apply_node_all_asset_ids_mapping_delta_to_cache(key, deltas)
 
-    # from memory
-    @classmethod
-    def get_node_all_asset_ids_mapping_from_memory(cls, org_id):
-        mapping = cls.orgid_nodekey_assetsid_mapping.get(org_id, {})
-        return mapping
+    def apply_deltas(self, value, deltas):
+        for delta in deltas:
+            value = NodeAllAssetsMappingMixin.apply_node_all_asset_ids_mapping_delta(value, delta)
+        return value
+
+
+class NodeAllAssetsMappingMixin:
+    # Use a new plan
+
+    # { org_id: NodeAssetIdsMapping({ node_key: [ asset1_id, asset2_id ] }) }
+    node_all_asset_ids_mapping_cache = NodeAllAssetIdsMappingLocalCache()
 
     @classmethod
-    def set_node_all_asset_ids_mapping_to_memory(cls, org_id, mapping):
-        cls.orgid_nodekey_assetsid_mapping[org_id] = mapping
+    def get_node_all_asset_ids_mapping(cls, org_id):
+        return cls.node_all_asset_ids_mapping_cache.get(str(org_id))
 
+    # memory
     @classmethod
     def expire_node_all_asset_ids_mapping_from_memory(cls, org_id):
-        org_id = str(org_id)
-        cls.orgid_nodekey_assetsid_mapping.pop(org_id, None)
+        """ Only of this process, use `expire_node_all_asset_ids_mapping` to expire all """
+        cls.node_all_asset_ids_mapping_cache.evict(str(org_id))
 
     @classmethod
     def expire_all_orgs_node_all_asset_ids_mapping_from_memory(cls):
@@ -315,47 +313,211 @@ class NodeAllAssetsMappingMixin:
         for id in org_ids:
             cls.expire_node_all_asset_ids_mapping_from_memory(id)
 
+    @classmethod
+    def expire_node_all_asset_ids_mapping(cls, org_id):
+        """ Expire of all workers, debounced """
+        cls.node_all_asset_ids_mapping_cache.expire(str(org_id))
+
+    @classmethod
+    def publish_node_all_asset_ids_mapping_delta(cls, org_id, delta):
+        """ Apply the delta in cache and broadcast it to all workers, debounced """
+        cls.node_all_asset_ids_mapping_cache.publish_delta(str(org_id), delta)
+
     # get order: from memory -> (from cache -> to generate)
     @classmethod
     def get_node_all_asset_ids_mapping_from_cache_or_generate_to_cache(cls, org_id):
-        mapping = cls.get_node_all_asset_ids_mapping_from_cache(org_id)
+        """
+        :return: (mapping, version)
+        """
+        mapping, version = cls.get_node_all_asset_ids_mapping_and_version_from_cache(org_id)
         if mapping:
-            return mapping
+            return mapping, version
 
-        lock_key = f'KEY_LOCK_GENERATE_ORG_{org_id}_NODE_ALL_ASSET_ids_MAPPING'
-        with DistributedLock(lock_key):
+        with DistributedLock(cls._get_lock_key_for_node_all_asset_ids_mapping(org_id)):
 
-            _mapping = cls.get_node_all_asset_ids_mapping_from_cache(org_id)
+            _mapping, _version = cls.get_node_all_asset_ids_mapping_and_version_from_cache(org_id)
             if _mapping:
-                return _mapping
+                return _mapping, _version
 
             _mapping = cls.generate_node_all_asset_ids_mapping(org_id)
-            cls.set_node_all_asset_ids_mapping_to_cache(org_id=org_id, mapping=_mapping)
-            return _mapping
+            _version = cls.set_node_all_asset_ids_mapping_to_cache(org_id=org_id, mapping=_mapping)
+            return _mapping, _version
 
     @classmethod
-    def get_node_all_asset_ids_mapping_from_cache(cls, org_id):
+    def get_node_all_asset_ids_mapping_and_version_from_cache(cls, org_id):
         cache_key = cls._get_cache_key_for_node_all_asset_ids_mapping(org_id)
-        mapping = cache.get(cache_key)
+        version_key = cls._get_cache_key_for_node_all_asset_ids_mapping_version(org_id)
+        values = cache.get_many([cache_key, version_key])
+        mapping = cls._loads_node_all_asset_ids_mapping(values.get(cache_key))
+        version = values.get(version_key)
         logger.info(f'Get node asset mapping from cache {bool(mapping)}: '
                     f'thread={threading.get_ident()} '
-                    f'org_id={org_id}')
+                    f'org_id={org_id} '
+                    f'version={version}')
+        return mapping, version
+
+    @classmethod
+    def get_node_all_asset_ids_mapping_from_cache(cls, org_id):
+        mapping, __ = cls.get_node_all_asset_ids_mapping_and_version_from_cache(org_id)
         return mapping
 
     @classmethod
     def set_node_all_asset_ids_mapping_to_cache(cls, org_id, mapping):
+        """
+        Store the mapping and bump its version, the version is never reset,
+        so that workers can tell whether the mapping in memory is stale.
+        Must be called in the mapping lock.
+        """
         cache_key = cls._get_cache_key_for_node_all_asset_ids_mapping(org_id)
-        cache.set(cache_key, mapping, timeout=None)
+        cache.set(cache_key, mapping.to_bytes(), timeout=None)
+        return cls.node_all_asset_ids_mapping_cache.incr_shared_version(org_id)
+
+    @staticmethod
+    def _loads_node_all_asset_ids_mapping(data):
+        if not isinstance(data, bytes):
+            # Empty or the old pickled dict format, regenerate it
+            return None
+        try:
+            return NodeAssetIdsMapping.from_bytes(data)
+        except (ValueError, struct.error) as e:
+            logger.error(f'Load node asset mapping from cache error: {e}')
+            return None
 
     @classmethod
     def expire_node_all_asset_ids_mapping_from_cache(cls, org_id):
+        """ :return: new version """
         cache_key = cls._get_cache_key_for_node_all_asset_ids_mapping(org_id)
-        cache.delete(cache_key)
+        with DistributedLock(cls._get_lock_key_for_node_all_asset_ids_mapping(org_id)):
+            cache.delete(cache_key)
+            return cls.node_all_asset_ids_mapping_cache.incr_shared_version(org_id)
+
+    @classmethod
+    def apply_node_all_asset_ids_mapping_delta_to_cache(cls, org_id, deltas):
+        """
+        Apply the deltas to the mapping in cache
+
+        :return: new version, or None if there is no mapping in cache
+        """
+        with DistributedLock(cls._get_lock_key_for_node_all_asset_ids_mapping(org_id)):
+            mapping = cls.get_node_all_asset_ids_mapping_from_cache(org_id)
+            if not mapping:
+                return None
+            for delta in deltas:
+                mapping = cls.apply_node_all_asset_ids_mapping_delta(mapping, delta)
+            version = cls.set_node_all_asset_ids_mapping_to_cache(org_id, mapping)
+            return version
 
     @staticmethod
     def _get_cache_key_for_node_all_asset_ids_mapping(org_id):
         return 'ASSETS_ORG_NODE_ALL_ASSET_ids_MAPPING_{}'.format(org_id)
 
+    @staticmethod
+    def _get_cache_key_for_node_all_asset_ids_mapping_version(org_id):
+        return 'ASSETS_ORG_NODE_ALL_ASSET_ids_MAPPING_VERSION_{}'.format(org_id)
+
+    @staticmethod
+    def _get_lock_key_for_node_all_asset_ids_mapping(org_id):
+        return f'KEY_LOCK_GENERATE_ORG_{org_id}_NODE_ALL_ASSET_ids_MAPPING'
+
+    # delta
+    @classmethod
+    def compute_node_all_asset_ids_mapping_delta(cls, add=None, remove=None, rename=None):
+        """
+        Compute the delta after node asset relations changed, the relations
+        in db must already be changed.
+
+        :param add: { node_key: asset_ids } assets added to node directly
+        :param remove: { node_key: asset_ids } assets removed from node directly
+        :param rename: (old_key, new_key) node moved, all children keys changed
+        :return: {
+            'add': { node_key: [asset_id, ] },
+            'remove': { ancestor_key: [asset_id, ] },
+            'rename': [old_key, new_key]
+        }
+        """
+        from .asset import Asset
+
+        # Signals give uuids, db gives hex or dashed strings, use one form
+        normalize = NodeAssetIdsMapping.normalize_asset_id
+        delta = {'add': {}, 'remove': {}, 'rename': None}
+
+        for node_key, asset_ids in (add or {}).items():
+            delta['add'][node_key] = [normalize(i) for i in asset_ids]
+
+        remove = dict(remove or {})
+        if rename:
+            old_key, new_key = rename
+            delta['rename'] = [old_key, new_key]
+            parent_key = compute_parent_key(old_key)
+            if parent_key:
+                # Removed from old ancestors, and added to new ancestors
+                asset_ids = Asset.nodes.through.objects \
+                    .filter(Q(node__key__startswith=f'{new_key}:') | Q(node__key=new_key)) \
+                    .annotate(char_asset_id=output_as_string('asset_id')) \
+                    .values_list('char_asset_id', flat=True).distinct()
+                asset_ids = {normalize(i) for i in asset_ids}
+                remove[parent_key] = asset_ids
+                delta['add'][new_key] = list(asset_ids)
+
+        if not remove:
+            return delta
+
+        removed_asset_ids = set()
+        for asset_ids in remove.values():
+            removed_asset_ids.update(normalize(i) for i in asset_ids)
+
+        asset_remain_node_keys = defaultdict(set)
+        relations = Asset.nodes.through.objects \
+            .filter(asset_id__in=removed_asset_ids) \
+            .annotate(char_asset_id=output_as_string('asset_id')) \
+            .values_list('char_asset_id', 'node__key')
+        for asset_id, node_key in relations:
+            asset_remain_node_keys[normalize(asset_id)].add(node_key)
+
+        def is_asset_in_node(_asset_id, _node_key):
+            for k in asset_remain_node_keys[_asset_id]:
+                if k == _node_key or k.startswith(f'{_node_key}:'):
+                    return True
+            return False
+
+        for node_key, asset_ids in remove.items():
+            for ancestor_key in cls.get_node_ancestor_keys(node_key, with_self=True):
+                to_remove = [
+                    i for i in map(normalize, asset_ids)
+                    if not is_asset_in_node(i, ancestor_key)
+                ]
+                if not to_remove:
+                    break
+                exists = delta['remove'].setdefault(ancestor_key, [])
+                exists.extend(to_remove)
+                asset_ids = to_remove
+        return delta
+
+    @classmethod
+    def apply_node_all_asset_ids_mapping_delta(cls, mapping, delta):
+        """
+        Apply delta on a copy of mapping, only changed node keys get new arrays
+
+        :return: new mapping
+        """
+        new_mapping = mapping.copy()
+
+        rename = delta.get('rename')
+        if rename:
+            old_key, new_key = rename
+            new_mapping.rename_keys(old_key, new_key)
+
+        for node_key, asset_ids in delta.get('remove', {}).items():
+            new_mapping.discard(node_key, asset_ids)
+
+        changed = {}
+        for node_key, asset_ids in delta.get('add', {}).items():
+            for ancestor_key in cls.get_node_ancestor_keys(node_key, with_self=True):
+                changed.setdefault(ancestor_key, set()).update(asset_ids)
+        for node_key, asset_ids in changed.items():
+            new_mapping.update(node_key, asset_ids)
+        return new_mapping
+
     @classmethod
     def generate_node_all_asset_ids_mapping(cls, org_id):
         from .asset import Asset
@@ -392,6 +554,7 @@ class NodeAllAssetsMappingMixin:
             for ancestor_key in node_ancestor_keys:
                 mapping[ancestor_key].update(asset_ids)
 
+        mapping = NodeAssetIdsMapping.from_dict(mapping)
         t3 = time.time()
         logger.info('t1-t2(DB Query): {} s, t3-t2(Generate mapping): {} s'.format(t2-t1, t3-t2))
         return mapping
@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+#
+import sys
+import uuid
+import struct
+from array import array
+from operator import itemgetter
+
+__all__ = ['NodeAssetIdsMapping']
+
+
+class NodeAssetIdsMapping:
+    """
+    Compact `{ node_key: set(asset_id) }` mapping
+
+    Every asset id is assigned an integer index, the ids are stored as one
+    string of fixed length uuids, each node holds a sorted array of indexes.
+    The whole mapping serializes to one binary blob, and asset ids are only
+    decoded for the nodes looked up. Ids are kept in the dashed uuid form,
+    the hex form databases like MySQL return is converted.
+
+    Removed asset ids keep their index until the mapping is regenerated.
+    """
+    MAGIC = b'JNAM'
+    FORMAT_VERSION = 1
+    ASSET_ID_LENGTH = 36
+    ARRAY_TYPECODE = 'I'
+
+    _header = struct.Struct('<4sBII')
+    _node_header = struct.Struct('<HI')
+
+    def __init__(self, asset_ids_text='', nodes=None, asset_index=None):
+        # All asset ids joined, the id of index i is text[i*36:(i+1)*36]
+        self._asset_ids_text = asset_ids_text
+        # { node_key: array('I', [asset_index, ]) }
+        self._nodes = nodes if nodes is not None else {}
+        self._asset_index = asset_index
+        self._asset_ids = None
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def __contains__(self, node_key):
+        return node_key in self._nodes
+
+    def __repr__(self):
+        return '<{} nodes={} assets={}>'.format(
+            self.__class__.__name__, len(self._nodes), self.assets_amount
+        )
+
+    @property
+    def assets_amount(self):
+        return len(self._asset_ids_text) // self.ASSET_ID_LENGTH
+
+    @property
+    def asset_index(self):
+        """ { asset_id: index }, build on demand """
+        if self._asset_index is None:
+            self._asset_index = {
+                self._get_asset_id(i): i for i in range(self.assets_amount)
+            }
+        return self._asset_index
+
+    @property
+    def asset_ids(self):
+        """ [asset_id, ], decode on demand """
+        if self._asset_ids is None:
+            self._asset_ids = [self._get_asset_id(i) for i in range(self.assets_amount)]
+        return self._asset_ids
+
+    def _get_asset_id(self, i):
+        length = self.ASSET_ID_LENGTH
+        return self._asset_ids_text[i * length:(i + 1) * length]
+
+    def _to_asset_ids(self, indexes):
+        if not indexes:
+            return set()
+        if len(indexes) == 1:
+            return {self.asset_ids[next(iter(indexes))]}
+        return set(itemgetter(*indexes)(self.asset_ids))
+
+    def _to_indexes(self, asset_ids):
+        index = self.asset_index
+        indexes = (index.get(self.normalize_asset_id(i)) for i in asset_ids)
+        return {i for i in indexes if i is not None}
+
+    # Lookup
+    def keys(self):
+        return self._nodes.keys()
+
+    def get(self, node_key, default=None):
+        indexes = self._nodes.get(node_key)
+        if indexes is None:
+            return default
+        return self._to_asset_ids(indexes)
+
+    def count(self, node_key):
+        return len(self._nodes.get(node_key, ()))
+
+    # Change, always do on a copy, other threads may be reading
+    def copy(self):
+        obj = self.__class__(
+            asset_ids_text=self._asset_ids_text,
+            nodes=dict(self._nodes),
+            asset_index=self._asset_index,
+        )
+        obj._asset_ids = self._asset_ids
+        return obj
+
+    def rename_keys(self, old_key, new_key):
+        """ Node `old_key` moved to `new_key`, rename it and all children """
+        old_prefix = f'{old_key}:'
+        to_rename = [k for k in self._nodes if k == old_key or k.startswith(old_prefix)]
+        for k in to_rename:
+            self._nodes[new_key + k[len(old_key):]] = self._nodes.pop(k)
+
+    def discard(self, node_key, asset_ids):
+        indexes = self._nodes.get(node_key)
+        if not indexes:
+            return
+        removed = self._to_indexes(asset_ids)
+        self._nodes[node_key] = array(
+            self.ARRAY_TYPECODE, [i for i in indexes if i not in removed]
+        )
+
+    def update(self, node_key, asset_ids):
+        index = self.asset_index
+        asset_ids = [self.normalize_asset_id(i) for i in asset_ids]
+        new_ids = list(dict.fromkeys(i for i in asset_ids if i not in index))
+        if new_ids:
+            # Copy on write, the index may be shared with the origin mapping
+            index = dict(index)
+            for n, asset_id in enumerate(new_ids, start=self.assets_amount):
+                index[asset_id] = n
+            self._asset_ids_text += ''.join(new_ids)
+            self._asset_index = index
+            if self._asset_ids is not None:
+                self._asset_ids = self._asset_ids + new_ids
+
+        indexes = set(self._nodes.get(node_key, ()))
+        indexes.update(index[i] for i in asset_ids)
+        self._nodes[node_key] = array(self.ARRAY_TYPECODE, sorted(indexes))
+
+    # Build
+    @classmethod
+    def normalize_asset_id(cls, asset_id):
+        """ Dashed uuid string of an uuid, or its hex or dashed string """
+        if isinstance(asset_id, uuid.UUID):
+            return str(asset_id)
+        asset_id = str(asset_id)
+        if len(asset_id) == cls.ASSET_ID_LENGTH and asset_id.islower():
+            return asset_id
+        try:
+            return str(uuid.UUID(asset_id))
+        except ValueError:
+            raise ValueError(f'Invalid asset id: {asset_id}')
+
+    @classmethod
+    def from_dict(cls, mapping):
+        asset_index = {}
+        asset_ids = []
+        # { id as given: index }, an asset is in all ancestors, normalize once
+        given_index = {}
+        nodes = {}
+        for node_key, node_asset_ids in mapping.items():
+            indexes = []
+            for given_id in node_asset_ids:
+                i = given_index.get(given_id)
+                if i is None:
+                    asset_id = cls.normalize_asset_id(given_id)
+                    i = asset_index.get(asset_id)
+                    if i is None:
+                        i = len(asset_ids)
+                        asset_index[asset_id] = i
+                        asset_ids.append(asset_id)
+                    given_index[given_id] = i
+                indexes.append(i)
+            indexes.sort()
+            nodes[node_key] = array(cls.ARRAY_TYPECODE, indexes)
+        obj = cls(''.join(asset_ids), nodes, asset_index)
+        obj._asset_ids = asset_ids
+        return obj
+
+    def to_dict(self):
+        return {k: self.get(k) for k in self._nodes}
+
+    # Serialize
+    def to_bytes(self):
+        swap = sys.byteorder != 'little'
+        chunks = [
+            self._header.pack(self.MAGIC, self.FORMAT_VERSION, self.assets_amount, len(self._nodes)),
+            self._asset_ids_text.encode('ascii'),
+        ]
+        for node_key, indexes in self._nodes.items():
+            key = node_key.encode()
+            if swap:
+                indexes = array(self.ARRAY_TYPECODE, indexes)
+                indexes.byteswap()
+            chunks.append(self._node_header.pack(len(key), len(indexes)))
+            chunks.append(key)
+            chunks.append(indexes.tobytes())
+        return b''.join(chunks)
+
+    @classmethod
+    def from_bytes(cls, data):
+        view = memoryview(data)
+        magic, version, assets_amount, nodes_amount = cls._header.unpack_from(view, 0)
+        if magic != cls.MAGIC or version != cls.FORMAT_VERSION:
+            raise ValueError('Invalid node asset ids mapping data')
+
+        offset = cls._header.size
+        text_length = assets_amount * cls.ASSET_ID_LENGTH
+        asset_ids_text = bytes(view[offset:offset + text_length]).decode('ascii')
+        offset += text_length
+
+        swap = sys.byteorder != 'little'
+        item_size = array(cls.ARRAY_TYPECODE).itemsize
+        nodes = {}
+        for __ in range(nodes_amount):
+            key_length, count = cls._node_header.unpack_from(view, offset)
+            offset += cls._node_header.size
+            node_key = bytes(view[offset:offset + key_length]).decode()
+            offset += key_length
+            indexes = array(cls.ARRAY_TYPECODE)
+            indexes.frombytes(view[offset:offset + count * item_size])
+            if swap:
+                indexes.byteswap()
+            offset += count * item_size
+            nodes[node_key] = indexes
+        return cls(asset_ids_text, nodes)
@@ -108,3 +108,15 @@ class CommandConfirmSerializer(serializers.Serializer):
     @lazyproperty
     def org(self):
         return self.session.org
+
+
+class CommandFilterCheckSerializer(serializers.Serializer):
+    user_id = serializers.UUIDField(required=False, allow_null=True)
+    user_group_id = serializers.UUIDField(required=False, allow_null=True)
+    system_user_id = serializers.UUIDField(required=False, allow_null=True)
+    asset_id = serializers.UUIDField(required=False, allow_null=True)
+    application_id = serializers.UUIDField(required=False, allow_null=True)
+    commands = serializers.ListField(
+        child=serializers.CharField(allow_blank=True, trim_whitespace=False),
+        max_length=1000, label=_('Commands')
+    )
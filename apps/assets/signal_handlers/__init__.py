@@ -3,3 +3,4 @@ from .system_user import *
 from .authbook import *
 from .node_assets_amount import *
 from .node_assets_mapping import *
+from .cmd_filter import *
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+#
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from common.utils import get_logger
+from users.models import User
+from assets.models import CommandFilter, CommandFilterRule
+
+
+logger = get_logger(__file__)
+
+
+@receiver([post_save, post_delete], sender=CommandFilter)
+@receiver([post_save, post_delete], sender=CommandFilterRule)
+def on_cmd_filter_change(sender, **kwargs):
+    CommandFilterRule.expire_rules_cache()
+
+
+@receiver(m2m_changed, sender=CommandFilter.users.through)
+@receiver(m2m_changed, sender=CommandFilter.user_groups.through)
+@receiver(m2m_changed, sender=CommandFilter.assets.through)
+@receiver(m2m_changed, sender=CommandFilter.system_users.through)
+@receiver(m2m_changed, sender=CommandFilter.applications.through)
+@receiver(m2m_changed, sender=User.groups.through)
+def on_cmd_filter_relation_change(sender, action, **kwargs):
+    if not action.startswith('post'):
+        return
+    CommandFilterRule.expire_rules_cache()
@@ -1,16 +1,19 @@
 # -*- coding: utf-8 -*-
 #
 from operator import add, sub
-from django.db.models import Q, F
+from collections import defaultdict, Counter
+
+from django.core.cache import cache
+from django.db.models import F, Q
 from django.dispatch import receiver
 from django.db.models.signals import (
     m2m_changed
 )
 
-from orgs.utils import ensure_in_real_or_default_org, tmp_to_org
+from orgs.utils import ensure_in_real_or_default_org, tmp_to_org, current_org
 from common.const.signals import PRE_ADD, POST_REMOVE, PRE_CLEAR
 from common.utils import get_logger
-from assets.models import Asset, Node, compute_parent_key
+from assets.models import Asset, Node
 from assets.locks import NodeTreeUpdateLock
 
 
@@ -35,96 +38,143 @@ def on_node_asset_change(sender, action, instance, reverse, pk_set, **kwargs):
     with tmp_to_org(instance.org):
         if reverse:
             node: Node = instance
-            asset_pk_set = set(pk_set)
-            NodeAssetsAmountUtils.update_node_assets_amount(node, asset_pk_set, operator)
+            NodeAssetsAmountUtils.update_nodes_assets_amount({node.key}, set(pk_set), operator)
         else:
             asset_pk = instance.id
             node_keys = set(Node.objects.filter(id__in=pk_set).values_list('key', flat=True))
-            NodeAssetsAmountUtils.update_nodes_asset_amount(node_keys, asset_pk, operator)
+            NodeAssetsAmountUtils.update_nodes_assets_amount(node_keys, {asset_pk}, operator)
 
 
 class NodeAssetsAmountUtils:
+    """
+    Maintain `Node.assets_amount` by deltas
+
+    An asset is counted by a node if it is in the node or its offspring. When
+    the relations of a batch of assets and nodes change, the nodes covered by
+    the other relations of the assets don't change, the others change by one
+    for every asset. The relations of the batch assets are fetched in one
+    query, deltas are computed in memory and applied by one update of each
+    delta value.
+
+    The changed node keys are recorded as dirty with the deltas,
+    `reconcile_dirty_nodes_assets_amount` recounts only those nodes.
+    """
+    DIRTY_ORGS_CACHE_KEY = 'ASSETS_NODE_ASSETS_AMOUNT_DIRTY_ORGS'
+    DIRTY_KEYS_CACHE_KEY = 'ASSETS_NODE_ASSETS_AMOUNT_DIRTY_KEYS_{}'
 
     @classmethod
-    def _remove_ancestor_keys(cls, ancestor_key, tree_set):
-        while ancestor_key and ancestor_key in tree_set:
-            tree_set.remove(ancestor_key)
-            ancestor_key = compute_parent_key(ancestor_key)
-
-    @classmethod
-    def _is_asset_exists_in_node(cls, asset_pk, node_key):
-        exists = Asset.objects.filter(
-            Q(nodes__key__istartswith=f'{node_key}:') | Q(nodes__key=node_key)
-        ).filter(id=asset_pk).exists()
-        return exists
+    def get_assets_covered_keys(cls, asset_pk_set):
+        """
+        :return: { asset_id: set(node_key, ) } nodes counted the asset now
+        """
+        relations = Asset.nodes.through.objects.filter(
+            asset_id__in=asset_pk_set
+        ).values_list('asset_id', 'node__key')
+
+        covered = defaultdict(set)
+        for asset_id, node_key in relations:
+            keys = covered[asset_id]
+            if node_key in keys:
+                continue
+            keys.update(Node.get_node_ancestor_keys(node_key, with_self=True))
+        return covered
 
     @classmethod
-    @ensure_in_real_or_default_org
-    @NodeTreeUpdateLock()
-    def update_nodes_asset_amount(cls, node_keys, asset_pk, operator):
-        ancestor_keys = set()
+    def compute_nodes_assets_amount_delta(cls, node_keys, asset_pk_set, operator):
+        """
+        :param node_keys: nodes added to (before added) or removed from
+            (after removed) the assets
+        :return: { node_key: delta }
+        """
+        changed_keys = set()
         for key in node_keys:
-            ancestor_keys.update(Node.get_node_ancestor_keys(key))
-        node_keys -= ancestor_keys
+            changed_keys.update(Node.get_node_ancestor_keys(key, with_self=True))
 
-        to_update_keys = []
-        for key in node_keys:
-            exists = cls._is_asset_exists_in_node(asset_pk, key)
-            parent_key = compute_parent_key(key)
+        step = operator(0, 1)
+        covered = cls.get_assets_covered_keys(asset_pk_set)
+        delta = Counter()
+        for asset_pk in asset_pk_set:
+            for key in changed_keys - covered.get(asset_pk, set()):
+                delta[key] += step
+        return delta
 
-            if exists:
-                cls._remove_ancestor_keys(parent_key, ancestor_keys)
-                continue
-            else:
-                to_update_keys.append(key)
-                while parent_key and parent_key in ancestor_keys:
-                    exists = cls._is_asset_exists_in_node(asset_pk, parent_key)
-                    if exists:
-                        cls._remove_ancestor_keys(parent_key, ancestor_keys)
-                        break
-                    else:
-                        to_update_keys.append(parent_key)
-                        ancestor_keys.remove(parent_key)
-                        parent_key = compute_parent_key(parent_key)
-
-        Node.objects.filter(key__in=to_update_keys).update(
-            assets_amount=operator(F('assets_amount'), 1)
-        )
+    @classmethod
+    def apply_nodes_assets_amount_delta(cls, delta):
+        keys_by_amount = defaultdict(list)
+        for key, amount in delta.items():
+            if amount:
+                keys_by_amount[amount].append(key)
+
+        for amount, keys in keys_by_amount.items():
+            Node.objects.filter(key__in=keys).update(
+                assets_amount=F('assets_amount') + amount
+            )
 
     @classmethod
     @ensure_in_real_or_default_org
     @NodeTreeUpdateLock()
-    def update_node_assets_amount(cls, node: Node, asset_pk_set: set, operator=add):
+    def update_nodes_assets_amount(cls, node_keys, asset_pk_set, operator=add):
         """
-        При изменении отношения между узлом и несколькими активами обновите счетчик
-
-        :param node: экземпляр ноды
-        :param asset_pk_set: набор id ресурсов, это значение не будет изменено внутри
-        :param operator: операция
-        * -> Node
-        # -> Asset
-
-               * [3]
-              / \
-             *   * [2]
-            /     \
-           *       * [1]
-          /       / \
-         *   [a] #  # [b]
+        Update amount when relations between nodes and assets changed
 
+        :param node_keys: keys of the nodes
+        :param asset_pk_set: ids of the assets
+        :param operator: add or sub
         """
-        ancestor_keys = node.get_ancestor_keys(with_self=True)
-        ancestors = Node.objects.filter(key__in=ancestor_keys).order_by('-key')
-        to_update = []
-        for ancestor in ancestors:
-            asset_pk_set -= set(Asset.objects.filter(
-                id__in=asset_pk_set
-            ).filter(
-                Q(nodes__key__istartswith=f'{ancestor.key}:') |
-                Q(nodes__key=ancestor.key)
-            ).distinct().values_list('id', flat=True))
-            if not asset_pk_set:
-                break
-            ancestor.assets_amount = operator(F('assets_amount'), len(asset_pk_set))
-            to_update.append(ancestor)
-        Node.objects.bulk_update(to_update, fields=('assets_amount', 'parent_key'))
+        if not node_keys or not asset_pk_set:
+            return
+        delta = cls.compute_nodes_assets_amount_delta(node_keys, asset_pk_set, operator)
+        cls.apply_nodes_assets_amount_delta(delta)
+        cls.mark_keys_dirty(current_org.id, delta.keys())
+
+    # Reconcile
+    @classmethod
+    def get_redis_client(cls):
+        return cache.client.get_client(write=True)
+
+    @classmethod
+    def mark_keys_dirty(cls, org_id, node_keys):
+        if not node_keys:
+            return
+        org_id = str(org_id)
+        with cls.get_redis_client().pipeline() as p:
+            p.sadd(cls.DIRTY_KEYS_CACHE_KEY.format(org_id), *node_keys)
+            p.sadd(cls.DIRTY_ORGS_CACHE_KEY, org_id)
+            p.execute()
+
+    @classmethod
+    def _pop_members(cls, key):
+        with cls.get_redis_client().pipeline() as p:
+            p.smembers(key)
+            p.delete(key)
+            members, __ = p.execute()
+        return {m.decode() for m in members}
+
+    @classmethod
+    def pop_dirty_org_ids(cls):
+        return cls._pop_members(cls.DIRTY_ORGS_CACHE_KEY)
+
+    @classmethod
+    def pop_dirty_keys(cls, org_id):
+        return cls._pop_members(cls.DIRTY_KEYS_CACHE_KEY.format(org_id))
+
+    @classmethod
+    def count_node_assets_amount(cls, key):
+        return Asset.nodes.through.objects.filter(
+            Q(node__key=key) | Q(node__key__startswith=f'{key}:')
+        ).values('asset_id').distinct().count()
+
+    @classmethod
+    @ensure_in_real_or_default_org
+    @NodeTreeUpdateLock()
+    def reconcile_nodes_assets_amount(cls, node_keys):
+        """ Recount the amount of the nodes, one count query of each node """
+        nodes = Node.objects.filter(key__in=node_keys).only('id', 'key', 'assets_amount')
+        to_updates = []
+        for node in nodes:
+            assets_amount = cls.count_node_assets_amount(node.key)
+            if node.assets_amount != assets_amount:
+                logger.error(f'Node[{node.key}] assets amount error {node.assets_amount} != {assets_amount}')
+                node.assets_amount = assets_amount
+                to_updates.append(node)
+        Node.objects.bulk_update(to_updates, fields=('assets_amount',))
@@ -1,54 +1,62 @@
 # -*- coding: utf-8 -*-
 #
-import os
-import threading
-
 from django.db.models.signals import (
     m2m_changed, post_save, post_delete
 )
 from django.dispatch import receiver
-from django.utils.functional import LazyObject
 
 from common.signals import django_ready
-from common.utils.connection import RedisPubSub
 from common.utils import get_logger
+from common.decorator import on_transaction_commit
+from common.const.signals import POST_ADD, POST_REMOVE, POST_CLEAR
 from assets.models import Asset, Node
+from assets.signals import post_node_key_change
 from orgs.models import Organization
+from orgs.utils import tmp_to_org
 
 
 logger = get_logger(__file__)
 
 # clear node assets mapping for memory
 # ------------------------------------
-
-
-def get_node_assets_mapping_for_memory_pub_sub():
-    return RedisPubSub('fm.node_all_asset_ids_memory_mapping')
-
-
-class NodeAssetsMappingForMemoryPubSub(LazyObject):
-    def _setup(self):
-        self._wrapped = get_node_assets_mapping_for_memory_pub_sub()
-
-
-node_assets_mapping_for_memory_pub_sub = NodeAssetsMappingForMemoryPubSub()
+# Changes in the debounce window are coalesced, workers reload the mapping
+# lazily, see `VersionedLocalCache`
 
 
 def expire_node_assets_mapping_for_memory(org_id):
-    org_id = str(org_id)
-    root_org_id = Organization.ROOT_ID
-
-    Node.expire_node_all_asset_ids_mapping_from_cache(org_id)
-    Node.expire_node_all_asset_ids_mapping_from_cache(root_org_id)
-
-    node_assets_mapping_for_memory_pub_sub.publish(org_id)
+    org_ids = (str(org_id), Organization.ROOT_ID)
+    for _org_id in org_ids:
+        Node.expire_node_all_asset_ids_mapping(_org_id)
+
+
+def update_node_assets_mapping_for_memory(org_id, delta):
+    """
+    Apply delta to the mapping in cache of the org and the root org,
+    then broadcast it to all workers with the new version.
+    Fallback to expire if there is no mapping in cache.
+    """
+    org_ids = (str(org_id), Organization.ROOT_ID)
+    for _org_id in org_ids:
+        Node.publish_node_all_asset_ids_mapping_delta(_org_id, delta)
+
+
+def on_node_assets_mapping_delta(org_id, add=None, remove=None, rename=None):
+    try:
+        delta = Node.compute_node_all_asset_ids_mapping_delta(
+            add=add, remove=remove, rename=rename
+        )
+    except Exception as e:
+        logger.error(f'Compute node assets mapping delta error, expire it: {e}')
+        on_transaction_commit(expire_node_assets_mapping_for_memory)(org_id)
+        return
+    on_transaction_commit(update_node_assets_mapping_for_memory)(org_id, delta)
 
 
 @receiver(post_save, sender=Node)
 def on_node_post_create(sender, instance, created, update_fields, **kwargs):
-    if created:
-        need_expire = True
-    elif update_fields and 'key' in update_fields:
+    # New node has no assets, nothing to do with the mapping,
+    # node moves are handled by `post_node_key_change`
+    if not created and update_fields and 'key' in update_fields:
         need_expire = True
     else:
         need_expire = False
@@ -57,28 +65,38 @@ def on_node_post_create(sender, instance, created, update_fields, **kwargs):
         expire_node_assets_mapping_for_memory(instance.org_id)
 
 
+@receiver(post_node_key_change, sender=Node)
+def on_node_key_change(sender, instance, old_key, new_key, **kwargs):
+    on_node_assets_mapping_delta(instance.org_id, rename=(old_key, new_key))
+
+
 @receiver(post_delete, sender=Node)
 def on_node_post_delete(sender, instance, **kwargs):
     expire_node_assets_mapping_for_memory(instance.org_id)
 
 
 @receiver(m2m_changed, sender=Asset.nodes.through)
-def on_node_asset_change(sender, instance, **kwargs):
-    expire_node_assets_mapping_for_memory(instance.org_id)
+def on_node_asset_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == POST_CLEAR:
+        expire_node_assets_mapping_for_memory(instance.org_id)
+        return
+    if action not in (POST_ADD, POST_REMOVE) or not pk_set:
+        return
+
+    if reverse:
+        relations = {instance.key: pk_set}
+    else:
+        with tmp_to_org(instance.org):
+            node_keys = Node.objects.filter(id__in=pk_set).values_list('key', flat=True)
+        relations = {key: [instance.id] for key in node_keys}
+
+    if action == POST_ADD:
+        on_node_assets_mapping_delta(instance.org_id, add=relations)
+    else:
+        on_node_assets_mapping_delta(instance.org_id, remove=relations)
 
 
 @receiver(django_ready)
 def subscribe_node_assets_mapping_expire(sender, **kwargs):
     logger.debug("Start subscribe for expire node assets id mapping from memory")
-
-    def handle_node_relation_change(org_id):
-        root_org_id = Organization.ROOT_ID
-        Node.expire_node_all_asset_ids_mapping_from_memory(org_id)
-        Node.expire_node_all_asset_ids_mapping_from_memory(root_org_id)
-
-    def keep_subscribe_node_assets_relation():
-        node_assets_mapping_for_memory_pub_sub.subscribe(handle_node_relation_change)
-
-    t = threading.Thread(target=keep_subscribe_node_assets_relation)
-    t.daemon = True
-    t.start()
+    Node.node_all_asset_ids_mapping_cache.subscribe()
@@ -0,0 +1,4 @@
+from django.dispatch import Signal
+
+
+post_node_key_change = Signal(providing_args=('instance', 'old_key', 'new_key'))
@@ -1,13 +1,12 @@
 import os
 import time
-from openpyxl import Workbook
-from collections import defaultdict, OrderedDict
+from collections import OrderedDict
 
 from django.conf import settings
 from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers
 
-from assets.models import AuthBook
+from assets.models import AuthBook, SystemUser
 from assets.serializers import AccountSecretSerializer
 from assets.notifications import AccountBackupExecutionTaskMsg
 from applications.models import Account
@@ -17,6 +16,7 @@ from users.models import User
 from common.utils import get_logger
 from common.utils.timezone import local_now_display
 from common.utils.file import encrypt_and_compress_zip_file
+from .writers import get_backup_writer_class, remove_files
 
 logger = get_logger(__file__)
 
@@ -24,6 +24,14 @@ PATH = os.path.join(os.path.dirname(settings.BASE_DIR), 'tmp')
 
 
 class BaseAccountHandler:
+    """
+    Rows of accounts for backup, accounts are read in primary key chunks
+    and system users of them are loaded once, so memory is bounded
+    """
+    serializer_class = None
+    file_label = ''
+    chunk_size = 1000
+
     @classmethod
     def unpack_data(cls, serializer_data, data=None):
         if data is None:
@@ -62,58 +70,107 @@ class BaseAccountHandler:
             row_dict[header_name] = str(data[field])
         return row_dict
 
-
-class AssetAccountHandler(BaseAccountHandler):
-    @staticmethod
-    def get_filename(plan_name):
+    @classmethod
+    def get_filename(cls, plan_name):
+        """ :return: path without suffix """
         filename = os.path.join(
-            PATH, f'{plan_name}-{_("Asset")}-{local_now_display()}-{time.time()}.xlsx'
+            PATH, f'{plan_name}-{cls.file_label}-{local_now_display()}-{time.time()}'
         )
         return filename
 
     @classmethod
-    def create_data_map(cls):
-        data_map = defaultdict(list)
-        sheet_name = AuthBook._meta.verbose_name
+    def get_queryset(cls):
+        raise NotImplementedError
 
-        accounts = AuthBook.get_queryset().select_related('systemuser')
-        if not accounts.first():
-            return data_map
+    @classmethod
+    def get_sheet_name(cls, account):
+        raise NotImplementedError
 
-        header_fields = cls.get_header_fields(AccountSecretSerializer(accounts.first()))
-        for account in accounts:
-            account.load_auth()
-            row = cls.create_row(account, AccountSecretSerializer, header_fields)
-            if sheet_name not in data_map:
-                data_map[sheet_name].append(list(row.keys()))
-            data_map[sheet_name].append(list(row.values()))
+    @classmethod
+    def iter_accounts(cls):
+        queryset = cls.get_queryset().order_by('pk')
+        system_users = {}
+        last_pk = None
+        while True:
+            chunk_queryset = queryset
+            if last_pk is not None:
+                chunk_queryset = queryset.filter(pk__gt=last_pk)
+            accounts = list(chunk_queryset[:cls.chunk_size])
+            if not accounts:
+                break
 
-        logger.info('\n\033[33m- Всего было собрано {} учётных записей ресурсов\033[0m'.format(accounts.count()))
-        return data_map
+            system_user_ids = {
+                a.systemuser_id for a in accounts
+                if a.systemuser_id and a.systemuser_id not in system_users
+            }
+            if system_user_ids:
+                system_users.update({
+                    s.id: s for s in SystemUser.objects.filter(id__in=system_user_ids)
+                })
+            for account in accounts:
+                # Shared, the auth of a system user is decrypted once
+                system_user = system_users.get(account.systemuser_id)
+                if system_user is not None:
+                    account.systemuser = system_user
+                yield account
+            last_pk = accounts[-1].pk
+
+    @classmethod
+    def iter_rows(cls):
+        """ :return: (sheet_name, header, row) """
+        sheet_header_fields = {}
+        for account in cls.iter_accounts():
+            sheet_name = cls.get_sheet_name(account)
+            header_fields = sheet_header_fields.get(sheet_name)
+            if header_fields is None:
+                header_fields = cls.get_header_fields(cls.serializer_class(account))
+                sheet_header_fields[sheet_name] = header_fields
+            row = cls.create_row(account, cls.serializer_class, header_fields)
+            yield sheet_name, list(row.keys()), list(row.values())
+
+    @classmethod
+    def write_rows(cls, writer):
+        for sheet_name, header, row in cls.iter_rows():
+            writer.write_row(sheet_name, header, row)
+        return writer.rows_count
+
+
+class AssetAccountHandler(BaseAccountHandler):
+    serializer_class = AccountSecretSerializer
+    file_label = _('Asset')
+
+    @classmethod
+    def get_queryset(cls):
+        return AuthBook.get_queryset()
+
+    @classmethod
+    def get_sheet_name(cls, account):
+        return AuthBook._meta.verbose_name
+
+    @classmethod
+    def write_rows(cls, writer):
+        count = super().write_rows(writer)
+        logger.info('\n\033[33m- Всего было собрано {} учётных записей ресурсов\033[0m'.format(count))
+        return count
 
 
 class AppAccountHandler(BaseAccountHandler):
-    @staticmethod
-    def get_filename(plan_name):
-        filename = os.path.join(
-            PATH, f'{plan_name}-{_("Application")}-{local_now_display()}-{time.time()}.xlsx'
-        )
-        return filename
+    serializer_class = AppAccountSecretSerializer
+    file_label = _('Application')
 
     @classmethod
-    def create_data_map(cls):
-        data_map = defaultdict(list)
-        accounts = Account.get_queryset().select_related('systemuser')
-        for account in accounts:
-            account.load_auth()
-            app_type = account.type
-            sheet_name = AppType.get_label(app_type)
-            row = cls.create_row(account, AppAccountSecretSerializer)
-            if sheet_name not in data_map:
-                data_map[sheet_name].append(list(row.keys()))
-            data_map[sheet_name].append(list(row.values()))
-        logger.info('\n\033[33m- Всего собано {} учётных записей приложений\033[0m'.format(accounts.count()))
-        return data_map
+    def get_queryset(cls):
+        return Account.get_queryset().select_related('app')
+
+    @classmethod
+    def get_sheet_name(cls, account):
+        return AppType.get_label(account.type)
+
+    @classmethod
+    def write_rows(cls, writer):
+        count = super().write_rows(writer)
+        logger.info('\n\033[33m- Всего собано {} учётных записей приложений\033[0m'.format(count))
+        return count
 
 
 handler_map = {
@@ -137,24 +194,19 @@ class AccountBackupHandler:
         # Print task start date
         time_start = time.time()
         files = []
+        writer_class = get_backup_writer_class(settings.ACCOUNT_BACKUP_FILE_FORMAT)
         for account_type in self.execution.types:
             handler = handler_map.get(account_type)
             if not handler:
                 continue
 
-            data_map = handler.create_data_map()
-            if not data_map:
-                continue
-
-            filename = handler.get_filename(self.plan_name)
-
-            wb = Workbook(filename)
-            for sheet, data in data_map.items():
-                ws = wb.create_sheet(str(sheet))
-                for row in data:
-                    ws.append(row)
-            wb.save(filename)
-            files.append(filename)
+            writer = writer_class(handler.get_filename(self.plan_name))
+            try:
+                handler.write_rows(writer)
+            except Exception:
+                remove_files(writer.close())
+                raise
+            files.extend(writer.close())
         timedelta = round((time.time() - time_start), 2)
         logger.info('Действие завершено. Это заняло {} сек.'.format(timedelta))
         return files
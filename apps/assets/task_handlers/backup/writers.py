@@ -0,0 +1,117 @@
+import os
+import csv
+
+from openpyxl import Workbook
+
+__all__ = [
+    'XlsxBackupWriter', 'CsvBackupWriter', 'get_backup_writer_class', 'remove_files'
+]
+
+XLSX_MAX_ROWS = 1048576
+
+
+class BaseBackupWriter:
+    """
+    Write rows of sheets to files as they come, rows are not kept in memory
+
+    :param filename: path without suffix
+    """
+    suffix = ''
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.rows_count = 0
+
+    def write_row(self, sheet_name, header, row):
+        """ The header is written before the first row of a sheet """
+        raise NotImplementedError
+
+    def close(self):
+        """ :return: [filename, ] """
+        raise NotImplementedError
+
+
+class XlsxBackupWriter(BaseBackupWriter):
+    """
+    Write-only workbook, appended rows are written to temp files of the sheets
+    at once. A sheet is continued in a new one when it's full.
+    """
+    suffix = '.xlsx'
+
+    def __init__(self, filename):
+        super().__init__(filename)
+        self.workbook = Workbook(write_only=True)
+        # { sheet_name: [worksheet, rows, parts] }
+        self.sheets = {}
+
+    def get_worksheet(self, sheet_name, header):
+        sheet = self.sheets.get(sheet_name)
+        if sheet and sheet[1] < XLSX_MAX_ROWS:
+            sheet[1] += 1
+            return sheet[0]
+
+        parts = sheet[2] + 1 if sheet else 1
+        title = str(sheet_name) if parts == 1 else '{} {}'.format(sheet_name, parts)
+        worksheet = self.workbook.create_sheet(title)
+        worksheet.append(header)
+        self.sheets[sheet_name] = [worksheet, 2, parts]
+        return worksheet
+
+    def write_row(self, sheet_name, header, row):
+        self.get_worksheet(sheet_name, header).append(row)
+        self.rows_count += 1
+
+    def close(self):
+        if not self.sheets:
+            return []
+        filename = self.filename + self.suffix
+        self.workbook.save(filename)
+        return [filename]
+
+
+class CsvBackupWriter(BaseBackupWriter):
+    """ A csv file for a sheet """
+    suffix = '.csv'
+
+    def __init__(self, filename):
+        super().__init__(filename)
+        # { sheet_name: (filename, file, writer) }
+        self.sheets = {}
+
+    def get_writer(self, sheet_name, header):
+        sheet = self.sheets.get(sheet_name)
+        if sheet:
+            return sheet[2]
+        filename = '{}-{}{}'.format(self.filename, sheet_name, self.suffix)
+        f = open(filename, 'w', encoding='utf-8-sig', newline='')
+        writer = csv.writer(f)
+        writer.writerow(header)
+        self.sheets[sheet_name] = (filename, f, writer)
+        return writer
+
+    def write_row(self, sheet_name, header, row):
+        self.get_writer(sheet_name, header).writerow(row)
+        self.rows_count += 1
+
+    def close(self):
+        filenames = []
+        for filename, f, __ in self.sheets.values():
+            f.close()
+            filenames.append(filename)
+        return filenames
+
+
+writer_classes = {
+    'xlsx': XlsxBackupWriter,
+    'csv': CsvBackupWriter,
+}
+
+
+def get_backup_writer_class(file_format):
+    return writer_classes.get(file_format, XlsxBackupWriter)
+
+
+def remove_files(filenames):
+    for filename in filenames:
+        if os.path.exists(filename):
+            os.remove(filename)
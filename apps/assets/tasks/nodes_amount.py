@@ -29,7 +29,25 @@ def check_node_assets_amount_task(org_id=None):
             logger.error(error)
 
 
-@register_as_period_task(crontab='0 2 * * *')
+@register_as_period_task(interval=60*10)
 @shared_task
-def check_node_assets_amount_period_task():
-    check_node_assets_amount_task()
+def check_dirty_node_assets_amount_period_task():
+    """
+    Amount is maintained by deltas, only recount the nodes changed since last time
+    """
+    from assets.signal_handlers.node_assets_amount import NodeAssetsAmountUtils
+
+    org_ids = NodeAssetsAmountUtils.pop_dirty_org_ids()
+    for org_id in org_ids:
+        node_keys = NodeAssetsAmountUtils.pop_dirty_keys(org_id)
+        if not node_keys:
+            continue
+        org = Organization.get_instance(org_id)
+        if not org:
+            continue
+        try:
+            with tmp_to_org(org):
+                NodeAssetsAmountUtils.reconcile_nodes_assets_amount(node_keys)
+        except AcquireFailed:
+            # The tree is updating, check them next time
+            NodeAssetsAmountUtils.mark_keys_dirty(org_id, node_keys)
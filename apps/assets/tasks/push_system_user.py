@@ -1,13 +1,16 @@
 # ~*~ coding: utf-8 ~*~
-
+import json
 from itertools import groupby
+from collections import defaultdict
+
 from celery import shared_task
 from common.db.utils import get_object_if_need, get_objects
+from django.conf import settings
 from django.utils.translation import gettext as _, gettext_noop
-from django.db.models import Empty
+from django.db.models import Empty, Q
 
 from common.utils import encrypt_password, get_logger
-from assets.models import SystemUser, Asset
+from assets.models import SystemUser, Asset, AuthBook
 from orgs.utils import org_aware_func, tmp_to_root_org
 from . import const
 from .utils import clean_ansible_task_hosts, group_asset_by_platform
@@ -203,8 +206,58 @@ def get_push_system_user_tasks(system_user, platform="unixlike", username=None,
     return tasks
 
 
+def get_special_auth_asset_ids(system_user, assets, usernames):
+    """
+    Assets have their own auth of the usernames, others use the system user auth
+    """
+    asset_ids = [asset.id for asset in assets]
+    queryset = AuthBook.objects.filter(asset_id__in=asset_ids).filter(
+        Q(username__in=usernames, systemuser__isnull=True) | Q(systemuser=system_user)
+    )
+    return set(queryset.values_list('asset_id', flat=True).distinct())
+
+
+def group_assets_by_push_tasks(system_user, platform, assets, username, special_auth_asset_ids):
+    """
+    Assets with the same push tasks go to one ansible play
+
+    :return: [(tasks, [asset, ]), ]
+    """
+    base_auth = (system_user.password, system_user.private_key, system_user.public_key)
+    tasks_cache = {}
+    grouped = {}
+
+    for asset in assets:
+        system_user.password, system_user.private_key, system_user.public_key = base_auth
+        if asset.id in special_auth_asset_ids:
+            system_user.load_asset_special_auth(asset, username)
+        algorithm = 'des' if asset.platform.name == 'AIX' else 'sha512'
+
+        cache_key = (algorithm, system_user.password, system_user.public_key)
+        tasks = tasks_cache.get(cache_key)
+        if tasks is None:
+            tasks = get_push_system_user_tasks(
+                system_user, platform, username=username, algorithm=algorithm
+            )
+            tasks_cache[cache_key] = tasks
+        if not tasks:
+            continue
+        tasks_key = json.dumps(tasks, sort_keys=True)
+        grouped.setdefault(tasks_key, (tasks, []))[1].append(asset)
+
+    system_user.password, system_user.private_key, system_user.public_key = base_auth
+    return list(grouped.values())
+
+
 @org_aware_func("system_user")
 def push_system_user_util(system_user, assets, task_name, username=None):
+    """
+    Push the usernames to assets, assets of a platform with the same push
+    tasks are pushed by one ansible play, run in parallel by forks
+
+    :return: {'success': bool, 'contacted': {hostname: [username, ]},
+              'dark': {hostname: {username: detail}}}
+    """
     from ops.utils import update_or_create_ansible_task
     assets = clean_ansible_task_hosts(assets, system_user=system_user)
     if not assets:
@@ -222,14 +275,36 @@ def push_system_user_util(system_user, assets, task_name, username=None):
         assert username is None, 'Only Dynamic user can assign `username`'
         usernames = [system_user.username]
 
+    result = {'success': True, 'contacted': defaultdict(list), 'dark': defaultdict(dict)}
+
     def run_task(_tasks, _hosts):
         if not _tasks:
-            return
+            return {}
+        options = dict(const.TASK_OPTIONS)
+        options['forks'] = max(min(settings.PUSH_SYSTEM_USER_FORKS, len(_hosts)), 1)
         task, created = update_or_create_ansible_task(
             task_name=task_name, hosts=_hosts, tasks=_tasks, pattern='all',
-            options=const.TASK_OPTIONS, run_as_admin=True,
+            options=options, run_as_admin=True,
         )
-        task.run()
+        task_result = task.run()
+        if not isinstance(task_result, (list, tuple)):
+            # {'error': 'No adhoc'}, the hosts are not pushed
+            error = task_result.get('error', '') if isinstance(task_result, dict) else str(task_result)
+            logger.error('Push system user task error: {}'.format(error))
+            return {'dark': {host.hostname: error for host in _hosts}}
+        __, summary = task_result
+        return summary or {}
+
+    def gather_result(_username, _hosts, summary):
+        dark = summary.get('dark', {})
+        contacted = summary.get('contacted', {})
+        for host in _hosts:
+            hostname = host.hostname
+            if hostname in dark:
+                result['dark'][hostname][_username] = dark[hostname]
+                result['success'] = False
+            elif hostname in contacted:
+                result['contacted'][hostname].append(_username)
 
     for platform, _assets in platform_hosts:
         _assets = list(_assets)
@@ -238,15 +313,21 @@ def push_system_user_util(system_user, assets, task_name, username=None):
         print(_("Start push system user for platform: [{}]").format(platform))
         print(_("Hosts count: {}").format(len(_assets)))
 
+        special_auth_asset_ids = get_special_auth_asset_ids(system_user, _assets, usernames)
         for u in usernames:
-            for a in _assets:
-                system_user.load_asset_special_auth(a, u)
-                algorithm = 'des' if a.platform.name == 'AIX' else 'sha512'
-                tasks = get_push_system_user_tasks(
-                    system_user, platform, username=u,
-                    algorithm=algorithm
-                )
-                run_task(tasks, [a])
+            grouped = group_assets_by_push_tasks(
+                system_user, platform, _assets, u, special_auth_asset_ids
+            )
+            for tasks, hosts in grouped:
+                summary = run_task(tasks, hosts)
+                gather_result(u, hosts, summary)
+
+    result['contacted'] = dict(result['contacted'])
+    result['dark'] = dict(result['dark'])
+    print(_("Push result: success hosts {}, failed hosts {}").format(
+        len(result['contacted']), len(result['dark'])
+    ))
+    return result
 
 
 @shared_task(queue="ansible")
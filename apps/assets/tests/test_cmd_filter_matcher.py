@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+#
+import re
+import random
+import string
+
+from django.test import SimpleTestCase
+
+from assets.cmd_filter_matcher import CommandFilterMatcher, construct_command_regex
+
+DENY, ALLOW, CONFIRM = 0, 9, 2
+
+
+def old_match(rules, command):
+    """
+    How rules were checked before, `CommandFilterRule.match` one by one in
+    priority order, rules failed to compile are skipped
+    """
+    for rule_id, regex, ignore_case, action in rules:
+        try:
+            pattern = re.compile(regex, re.IGNORECASE if ignore_case else 0)
+        except re.error:
+            continue
+        found = pattern.search(command)
+        if found:
+            return rule_id, action, found.group()
+    return None
+
+
+def new_match(matcher, command):
+    matched = matcher.match(command)
+    return tuple(matched) if matched else None
+
+
+def command_rule(rule_id, content, action=DENY, ignore_case=True):
+    return rule_id, construct_command_regex(content), ignore_case, action
+
+
+def regex_rule(rule_id, regex, action=DENY, ignore_case=True):
+    return rule_id, regex, ignore_case, action
+
+
+class CommandFilterMatcherTestCase(SimpleTestCase):
+    def assertSameAsOld(self, rules, commands):
+        matcher = CommandFilterMatcher(rules)
+        for command in commands:
+            self.assertEqual(
+                new_match(matcher, command), old_match(rules, command),
+                msg=f'command={command!r}'
+            )
+
+    def test_first_matched_rule_wins(self):
+        rules = [
+            command_rule('1', 'ls', action=ALLOW),
+            command_rule('2', 'ls\nrm', action=DENY),
+            command_rule('3', 'rm', action=ALLOW),
+        ]
+        matcher = CommandFilterMatcher(rules)
+        self.assertEqual(new_match(matcher, 'ls -al'), ('1', ALLOW, 'ls'))
+        self.assertEqual(new_match(matcher, 'rm -rf /'), ('2', DENY, 'rm'))
+        self.assertIsNone(matcher.match('cat /etc/hosts'))
+
+    def test_regex_rules_keep_priority(self):
+        rules = [
+            regex_rule('1', r'^cat\s+/etc/shadow', action=DENY),
+            command_rule('2', 'cat', action=ALLOW),
+            regex_rule('3', r'passwd$', action=CONFIRM),
+        ]
+        self.assertSameAsOld(rules, [
+            'cat /etc/shadow', 'cat /etc/hosts', 'vi /etc/passwd', 'cat /etc/passwd', 'echo',
+        ])
+
+    def test_ignore_case(self):
+        rules = [
+            command_rule('1', 'reboot', ignore_case=False),
+            command_rule('2', 'Shutdown', ignore_case=True),
+        ]
+        self.assertSameAsOld(rules, ['reboot', 'REBOOT', 'shutdown -h now', 'SHUTDOWN', 'Reboot'])
+
+    def test_command_with_spaces_and_symbols(self):
+        rules = [
+            command_rule('1', 'rm   -rf\nchmod 777'),
+            command_rule('2', 'ls\n./run.sh\n:(){ :|:& };:'),
+            command_rule('3', 'mkfs.ext4'),
+        ]
+        self.assertSameAsOld(rules, [
+            'rm -rf /tmp', 'rm\t-rf /', 'chmod  777 a', './run.sh', 'sh ./run.sh -x',
+            ':(){ :|:& };:', 'mkfs.ext4 /dev/sda', 'mkfs ext4', 'lsblk',
+        ])
+
+    def test_non_ascii_command(self):
+        rules = [
+            command_rule('1', 'kill', ignore_case=True),
+            command_rule('2', 'удалить'),
+        ]
+        # `K` is KELVIN SIGN, it matches `k` when ignore case
+        self.assertSameAsOld(rules, ['\u212aill 1', 'удалить всё', 'УДАЛИТЬ', 'kill -9 1'])
+
+    def test_invalid_regex_is_skipped(self):
+        rules = [
+            regex_rule('1', r'(unclosed'),
+            command_rule('2', 'ls'),
+        ]
+        matcher = CommandFilterMatcher(rules)
+        self.assertEqual(len(matcher), 1)
+        self.assertSameAsOld(rules, ['ls', '(unclosed ls'])
+
+    def test_empty_rule(self):
+        rules = [command_rule('1', ''), command_rule('2', '\n\n'), command_rule('3', 'ls')]
+        self.assertSameAsOld(rules, ['', 'ls', 'cat'])
+
+    def test_actions_filter(self):
+        rules = [
+            command_rule('1', 'rm', action=CONFIRM),
+            command_rule('2', 'rm', action=DENY),
+        ]
+        matcher = CommandFilterMatcher(rules)
+        self.assertEqual(new_match(matcher, 'rm a'), ('1', CONFIRM, 'rm'))
+        self.assertEqual(tuple(matcher.match('rm a', actions=(DENY,))), ('2', DENY, 'rm'))
+        self.assertIsNone(matcher.match('rm a', actions=(ALLOW,)))
+
+    def test_match_many(self):
+        rules = [command_rule('1', 'ls', action=ALLOW), command_rule('2', 'rm')]
+        matcher = CommandFilterMatcher(rules)
+        results = matcher.match_many(['ls', 'rm', 'cd'])
+        self.assertEqual([tuple(r) if r else None for r in results], [
+            ('1', ALLOW, 'ls'), ('2', DENY, 'rm'), None
+        ])
+
+    def test_random_rules_same_as_old(self):
+        rnd = random.Random(0)
+
+        def word(length=3):
+            return ''.join(rnd.choice('abcdeXYZ') for __ in range(length))
+
+        rules = []
+        for i in range(300):
+            if i % 7 == 0:
+                rules.append(regex_rule(str(i), r'^{}\s+-\w'.format(word(2)), action=rnd.choice([DENY, ALLOW])))
+            else:
+                content = '\n'.join(word(rnd.randint(1, 3)) for __ in range(rnd.randint(1, 3)))
+                rules.append(command_rule(
+                    str(i), content, action=rnd.choice([DENY, ALLOW, CONFIRM]),
+                    ignore_case=rnd.random() > 0.5
+                ))
+        symbols = string.punctuation.replace('\\', '')
+        commands = [
+            ' '.join(word(rnd.randint(1, 3)) + rnd.choice(['', '-x', rnd.choice(symbols)])
+                     for __ in range(rnd.randint(1, 4)))
+            for __ in range(500)
+        ]
+        self.assertSameAsOld(rules, commands)
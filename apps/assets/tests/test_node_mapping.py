@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+#
+import uuid
+
+from django.test import SimpleTestCase
+
+from assets.node_mapping import NodeAssetIdsMapping
+
+
+def new_asset_ids(amount):
+    return [str(uuid.uuid4()) for __ in range(amount)]
+
+
+class NodeAssetIdsMappingTestCase(SimpleTestCase):
+    def setUp(self):
+        self.a1, self.a2, self.a3, self.a4 = new_asset_ids(4)
+        self.data = {
+            '1': {self.a1, self.a2, self.a3, self.a4},
+            '1:1': {self.a1, self.a2},
+            '1:1:1': {self.a1},
+            '1:2': {self.a3},
+            '1:3': set(),
+        }
+        self.mapping = NodeAssetIdsMapping.from_dict(self.data)
+
+    def test_from_dict_to_dict(self):
+        self.assertEqual(self.mapping.to_dict(), self.data)
+        self.assertEqual(len(self.mapping), 5)
+        self.assertEqual(self.mapping.assets_amount, 4)
+
+    def test_accept_uuid_asset_ids(self):
+        asset_id = uuid.uuid4()
+        mapping = NodeAssetIdsMapping.from_dict({'1': [asset_id]})
+        self.assertEqual(mapping.get('1'), {str(asset_id)})
+
+    def test_invalid_asset_id(self):
+        with self.assertRaises(ValueError):
+            NodeAssetIdsMapping.from_dict({'1': ['not-an-uuid']})
+
+    def test_get(self):
+        self.assertEqual(self.mapping.get('1:1'), {self.a1, self.a2})
+        self.assertEqual(self.mapping.get('1:3'), set())
+        self.assertIsNone(self.mapping.get('1:4'))
+        self.assertEqual(self.mapping.get('1:4', []), [])
+        self.assertEqual(self.mapping.count('1'), 4)
+        self.assertEqual(self.mapping.count('1:4'), 0)
+        self.assertIn('1:2', self.mapping)
+        self.assertNotIn('1:4', self.mapping)
+
+    def test_hex_asset_ids(self):
+        # MySQL returns char uuids in the hex form
+        mapping = NodeAssetIdsMapping.from_dict({
+            '1': [uuid.UUID(self.a1).hex, self.a2],
+            '1:1': [uuid.UUID(self.a1).hex.upper()],
+        })
+        self.assertEqual(mapping.get('1'), {self.a1, self.a2})
+        self.assertEqual(mapping.get('1:1'), {self.a1})
+        self.assertEqual(mapping.assets_amount, 2)
+
+        mapping.update('1:1', [uuid.UUID(self.a2).hex])
+        self.assertEqual(mapping.get('1:1'), {self.a1, self.a2})
+        mapping.discard('1', [uuid.UUID(self.a1).hex])
+        self.assertEqual(mapping.get('1'), {self.a2})
+        self.assertEqual(mapping.assets_amount, 2)
+
+    def test_bytes_round_trip(self):
+        data = self.mapping.to_bytes()
+        mapping = NodeAssetIdsMapping.from_bytes(data)
+        self.assertEqual(mapping.to_dict(), self.data)
+        self.assertEqual(mapping.get('1:1'), {self.a1, self.a2})
+
+    def test_from_bytes_invalid(self):
+        with self.assertRaises(ValueError):
+            NodeAssetIdsMapping.from_bytes(b'XXXX' + self.mapping.to_bytes()[4:])
+
+    def test_update_on_copy(self):
+        a5 = new_asset_ids(1)[0]
+        mapping = self.mapping.copy()
+        mapping.update('1:2', [a5, self.a1])
+        mapping.update('1:4', [a5])
+
+        self.assertEqual(mapping.get('1:2'), {self.a1, self.a3, a5})
+        self.assertEqual(mapping.get('1:4'), {a5})
+        self.assertEqual(mapping.assets_amount, 5)
+        # The origin is not changed
+        self.assertEqual(self.mapping.to_dict(), self.data)
+        self.assertEqual(self.mapping.assets_amount, 4)
+        self.assertNotIn(a5, self.mapping.asset_index)
+
+    def test_discard_on_copy(self):
+        mapping = self.mapping.copy()
+        mapping.discard('1', [self.a1, self.a3])
+        mapping.discard('1:4', [self.a1])
+
+        self.assertEqual(mapping.get('1'), {self.a2, self.a4})
+        self.assertNotIn('1:4', mapping)
+        self.assertEqual(self.mapping.get('1'), self.data['1'])
+
+    def test_rename_keys_on_copy(self):
+        mapping = self.mapping.copy()
+        mapping.rename_keys('1:1', '1:2:1')
+
+        self.assertEqual(mapping.get('1:2:1'), {self.a1, self.a2})
+        self.assertEqual(mapping.get('1:2:1:1'), {self.a1})
+        self.assertNotIn('1:1', mapping)
+        self.assertNotIn('1:1:1', mapping)
+        self.assertIn('1:1', self.mapping)
+
+    def test_round_trip_after_change(self):
+        a5 = new_asset_ids(1)[0]
+        mapping = self.mapping.copy()
+        mapping.update('1:3', [a5])
+        mapping.discard('1:1', [self.a2])
+        expected = mapping.to_dict()
+        self.assertEqual(NodeAssetIdsMapping.from_bytes(mapping.to_bytes()).to_dict(), expected)
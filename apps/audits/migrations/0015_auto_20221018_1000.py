@@ -0,0 +1,24 @@
+# Generated by Django 3.2.12 on 2022-10-18 10:00
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('audits', '0014_auto_20220505_1902'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ftplog',
+            name='date_start',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Date start'),
+        ),
+        migrations.AlterField(
+            model_name='userloginlog',
+            name='datetime',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Date login'),
+        ),
+    ]
@@ -9,27 +9,31 @@ from ops.celery.decorator import (
 )
 from .models import UserLoginLog, OperateLog, FTPLog
 from common.utils import get_log_keep_day
+from common.db.retention import RetentionPurger
 
 
 def clean_login_log_period():
     now = timezone.now()
     days = get_log_keep_day('LOGIN_LOG_KEEP_DAYS')
     expired_day = now - datetime.timedelta(days=days)
-    UserLoginLog.objects.filter(datetime__lt=expired_day).delete()
+    expired = UserLoginLog.objects.filter(datetime__lt=expired_day)
+    RetentionPurger('audits_login_log', expired).run()
 
 
 def clean_operation_log_period():
     now = timezone.now()
     days = get_log_keep_day('OPERATE_LOG_KEEP_DAYS')
     expired_day = now - datetime.timedelta(days=days)
-    OperateLog.objects.filter(datetime__lt=expired_day).delete()
+    expired = OperateLog.objects.filter(datetime__lt=expired_day)
+    RetentionPurger('audits_operate_log', expired).run()
 
 
 def clean_ftp_log_period():
     now = timezone.now()
     days = get_log_keep_day('FTP_LOG_KEEP_DAYS')
     expired_day = now - datetime.timedelta(days=days)
-    FTPLog.objects.filter(date_start__lt=expired_day).delete()
+    expired = FTPLog.objects.filter(date_start__lt=expired_day)
+    RetentionPurger('audits_ftp_log', expired).run()
 
 
 @register_as_period_task(interval=3600*24)
@@ -14,11 +14,12 @@ from rest_framework.viewsets import GenericViewSet
 from common.permissions import IsValidUser
 from .http import HttpResponseTemporaryRedirect
 from .const import KEY_CACHE_RESOURCE_IDS
+from .drf.importer import ImportTask
 from .utils import get_logger
 from .mixins import CommonApiMixin
 
 __all__ = [
-    'LogTailApi', 'ResourcesIDCacheApi', 'CommonGenericViewSet'
+    'LogTailApi', 'ResourcesIDCacheApi', 'CommonGenericViewSet', 'ImportTaskApi'
 ]
 
 logger = get_logger(__file__)
@@ -97,6 +98,16 @@ class ResourcesIDCacheApi(APIView):
         return Response({'spm': spm})
 
 
+class ImportTaskApi(APIView):
+    permission_classes = (IsValidUser,)
+
+    def get(self, request, *args, **kwargs):
+        task = ImportTask.get(kwargs.get('pk'))
+        if task is None or (task.user_id != str(request.user.id) and not request.user.is_superuser):
+            return Response({'error': 'Not found'}, status=404)
+        return Response(task.to_dict())
+
+
 @csrf_exempt
 def redirect_plural_name_api(request, *args, **kwargs):
     resource = kwargs.get("resource", "")
@@ -2,6 +2,7 @@
 #
 import json
 from django.db import models
+from django.db.models.query_utils import DeferredAttribute
 from django.utils.translation import gettext_lazy as _
 from django.utils.encoding import force_text
 from django.core.validators import MinValueValidator, MaxValueValidator
@@ -13,7 +14,7 @@ __all__ = [
     'JsonCharField', 'JsonTextField', 'JsonListCharField', 'JsonListTextField',
     'JsonDictCharField', 'JsonDictTextField', 'EncryptCharField',
     'EncryptTextField', 'EncryptMixin', 'EncryptJsonDictTextField',
-    'EncryptJsonDictCharField', 'PortField'
+    'EncryptJsonDictCharField', 'PortField', 'LazySecret'
 ]
 
 
@@ -108,19 +109,59 @@ class JsonTextField(JsonMixin, models.TextField):
     description = _("Marshal data to text field")
 
 
+class LazySecret:
+    """
+    Ciphertext of an encrypted field loaded from db, decrypted at first access
+
+    Model instances never expose it, `EncryptedAttribute` replaces it with the
+    plaintext when the attribute is read. `values()` and `values_list()`
+    return it, use `.value` to get the plaintext.
+    """
+    __slots__ = ('field', 'ciphertext', '_value', '_decrypted')
+
+    def __init__(self, field, ciphertext):
+        self.field = field
+        self.ciphertext = ciphertext
+        self._value = None
+        self._decrypted = False
+
+    @property
+    def value(self):
+        if not self._decrypted:
+            self._value = self.field.decrypt_value(self.ciphertext)
+            self._decrypted = True
+        return self._value
+
+    def __reduce__(self):
+        return self.__class__, (self.field, self.ciphertext)
+
+    def __repr__(self):
+        return '<LazySecret: {}>'.format(self.field)
+
+
+class EncryptedAttribute(DeferredAttribute):
+    """ Decrypt the value at first read, then keep the plaintext in instance """
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        value = super().__get__(instance, cls)
+        if isinstance(value, LazySecret):
+            value = value.value
+            instance.__dict__[self.field.attname] = value
+        return value
+
+
 class EncryptMixin:
     """
     EncryptMixin должен быть размещён выше по иерархии
     """
+    descriptor_class = EncryptedAttribute
 
     def decrypt_from_signer(self, value):
         return signer.unsign(value) or ''
 
-    def from_db_value(self, value, expression, connection, context=None):
-        if value is None:
-            return value
-        value = force_text(value)
-
+    def decrypt_value(self, value):
         plain_value = crypto.decrypt(value)
 
         if not plain_value:
@@ -128,12 +169,29 @@ class EncryptMixin:
 
         sp = super()
         if hasattr(sp, 'from_db_value'):
-            plain_value = sp.from_db_value(plain_value, expression, connection, context)
+            plain_value = sp.from_db_value(plain_value, None, None)
         return plain_value
 
+    def from_db_value(self, value, expression, connection, context=None):
+        if value is None:
+            return value
+        value = force_text(value)
+        if not value:
+            return self.decrypt_value(value)
+        return LazySecret(self, value)
+
+    def pre_save(self, model_instance, add):
+        # Not read since loaded, save the ciphertext as is
+        value = model_instance.__dict__.get(self.attname)
+        if isinstance(value, LazySecret):
+            return value
+        return super().pre_save(model_instance, add)
+
     def get_prep_value(self, value):
         if value is None:
             return value
+        if isinstance(value, LazySecret):
+            return value.ciphertext
 
         sp = super()
         if hasattr(sp, 'get_prep_value'):
@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+#
+import os
+import time
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.db.models import Case, When, Value, F, TextField
+from itsdangerous import JSONWebSignatureSerializer, BadSignature
+
+from common.utils import get_logger
+from common.utils.crypto import Crypto
+from .fields import EncryptMixin, LazySecret
+
+logger = get_logger(__file__)
+
+__all__ = [
+    'SecretReEncryptor', 'get_encrypt_columns', 'get_reencrypt_checkpoint',
+]
+
+CHECKPOINT_CACHE_KEY = 'COMMON_REENCRYPT_CHECKPOINT_{}_{}'
+CHECKPOINT_CACHE_TTL = 3600 * 24 * 30
+
+
+def get_encrypt_columns(model_labels=None):
+    """
+    Encrypted columns of all models, historical models included
+    :return: [(model, [field, ]), ]
+    """
+    columns = []
+    for model in apps.get_models():
+        opts = model._meta
+        if opts.proxy or not opts.managed:
+            continue
+        if model_labels and opts.label not in model_labels:
+            continue
+        # Fields of the parent table are handled by the parent model
+        fields = [f for f in opts.local_concrete_fields if isinstance(f, EncryptMixin)]
+        if fields:
+            columns.append((model, fields))
+    return columns
+
+
+def get_reencrypt_run_key(old_secret_key, algo):
+    """
+    Checkpoints of a run are kept by the target algorithm and the keys,
+    a rotation to another key or algorithm doesn't go on from them
+    """
+    data = '{}:{}:{}'.format(algo, old_secret_key or '', settings.SECRET_KEY)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()[:16]
+
+
+def get_reencrypt_checkpoint(model, run_key):
+    return cache.get(CHECKPOINT_CACHE_KEY.format(run_key, model._meta.label)) or {}
+
+
+def save_reencrypt_checkpoint(model, run_key, **checkpoint):
+    checkpoint['date_updated'] = time.time()
+    cache.set(CHECKPOINT_CACHE_KEY.format(run_key, model._meta.label), checkpoint, CHECKPOINT_CACHE_TTL)
+
+
+def clear_reencrypt_checkpoint(model, run_key):
+    cache.delete(CHECKPOINT_CACHE_KEY.format(run_key, model._meta.label))
+
+
+# Run in worker processes, the cryptoes are built once by the initializer
+_worker = {}
+
+
+def init_reencrypt_worker(old_secret_key, algo):
+    key = old_secret_key or settings.SECRET_KEY
+    _worker['source'] = Crypto(key=key)
+    _worker['target'] = Crypto(algo=algo)
+    _worker['signer'] = JSONWebSignatureSerializer(key, algorithm_name='HS256')
+    # Only the algorithm changes, a value with the target prefix is done
+    _worker['skip_target_algo'] = not old_secret_key
+
+
+def reencrypt_value(text):
+    """
+    :return: (status, ciphertext), status is one of `updated`, `skipped`, `failed`
+    """
+    source, target = _worker['source'], _worker['target']
+    algo, __ = target.split_prefix(text)
+    if algo and _worker['skip_target_algo'] and target.prefix_algos[algo] == target.algo:
+        return 'skipped', None
+
+    plain_text = source.decrypt(text)
+    if plain_text is None:
+        try:
+            plain_text = _worker['signer'].loads(text)
+        except BadSignature:
+            plain_text = None
+    if not isinstance(plain_text, str):
+        return 'failed', None
+    return 'updated', target.encrypt(plain_text)
+
+
+def reencrypt_values(items):
+    """
+    :param items: [(pk, attname, ciphertext), ]
+    :return: ([(pk, attname, old_ciphertext, ciphertext), ], skipped, failed)
+    """
+    results = []
+    skipped = failed = 0
+    for pk, attname, text in items:
+        status, ciphertext = reencrypt_value(text)
+        if status == 'updated':
+            results.append((pk, attname, text, ciphertext))
+        elif status == 'skipped':
+            skipped += 1
+        else:
+            failed += 1
+    return results, skipped, failed
+
+
+class SecretReEncryptor:
+    """
+    Re-encrypt encrypted columns with the current algorithm and key
+
+    Rows of a model are read in primary key chunks, ciphertexts are decrypted
+    by the old key and encrypted by `algo` (default `SECURITY_DATA_CRYPTO_ALGO`)
+    and the current `SECRET_KEY` in a process pool, then written back by one
+    UPDATE of the chunk, no model is saved and no signal is sent. A value
+    is only written if it is still the ciphertext read, a value changed by
+    others meanwhile is left as it is and counted as skipped.
+
+    The last primary key of every model is saved as checkpoint in cache after
+    a chunk committed, keyed by the algorithm and the keys. An interrupted
+    run goes on from the checkpoints, `restart` ignores them, a run finished
+    all models clears them. `dry_run` processes a sample chunk of every model without writing
+    and estimates the time of the whole run.
+
+    :param old_secret_key: key the values were encrypted with, if the key is
+        rotated. Values failed to decrypt are left as they are.
+    """
+    chunk_size = 2000
+    sample_chunks = 1
+
+    def __init__(self, model_labels=None, old_secret_key=None, algo=None,
+                 workers=None, chunk_size=None, dry_run=False, restart=False,
+                 output=None):
+        self.model_labels = model_labels
+        self.old_secret_key = old_secret_key
+        self.algo = algo or settings.SECURITY_DATA_CRYPTO_ALGO
+        self.workers = workers or os.cpu_count() or 1
+        if chunk_size is not None:
+            self.chunk_size = chunk_size
+        self.dry_run = dry_run
+        self.restart = restart
+        self.output = output or logger.info
+        self.executor = None
+        self.run_key = get_reencrypt_run_key(old_secret_key, self.algo)
+
+    def __str__(self):
+        return 'SecretReEncryptor(algo={})'.format(self.algo)
+
+    def run(self):
+        # Check the algorithm before start the workers
+        Crypto(algo=self.algo)
+        columns = get_encrypt_columns(self.model_labels)
+        start = time.time()
+        stats = []
+        try:
+            self.start_executor()
+            for model, fields in columns:
+                stats.append(self.run_model(model, fields))
+        finally:
+            self.stop_executor()
+
+        if self.dry_run:
+            estimated = sum(s['estimated_seconds'] for s in stats)
+            self.output('Estimated time: {:.1f}s, columns: {}'.format(estimated, len(columns)))
+        else:
+            # All done, a later run of the same keys starts over
+            for model, __ in columns:
+                clear_reencrypt_checkpoint(model, self.run_key)
+            self.output('Re-encrypt finished in {:.1f}s'.format(time.time() - start))
+        return stats
+
+    def start_executor(self):
+        init_args = (self.old_secret_key, self.algo)
+        if self.workers <= 1:
+            init_reencrypt_worker(*init_args)
+            return
+        # Forked workers only compute, don't share db connections with them
+        connections.close_all()
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=init_reencrypt_worker, initargs=init_args
+        )
+
+    def stop_executor(self):
+        if self.executor:
+            self.executor.shutdown()
+            self.executor = None
+
+    def process(self, items):
+        if not self.executor:
+            return reencrypt_values(items)
+
+        size = max(len(items) // self.workers, 1)
+        parts = [items[i:i + size] for i in range(0, len(items), size)]
+        results, skipped, failed = [], 0, 0
+        for part_results, part_skipped, part_failed in self.executor.map(reencrypt_values, parts):
+            results.extend(part_results)
+            skipped += part_skipped
+            failed += part_failed
+        return results, skipped, failed
+
+    @staticmethod
+    def get_chunk_items(rows, fields):
+        items = []
+        for row in rows:
+            pk = row[0]
+            for field, value in zip(fields, row[1:]):
+                # Empty values are not lazy, nothing to encrypt
+                if isinstance(value, LazySecret):
+                    items.append((pk, field.attname, value.ciphertext))
+        return items
+
+    @staticmethod
+    def write(model, fields, results):
+        """
+        :return: count of the values not written, changed since read
+        """
+        if not results:
+            return 0
+        fields_map = {field.attname: field for field in fields}
+        whens = {attname: [] for attname in fields_map}
+        pks = set()
+        for pk, attname, old_ciphertext, ciphertext in results:
+            # Wrapped as lazy, the field takes it as ciphertext, not encrypt it again
+            old_value = LazySecret(fields_map[attname], old_ciphertext)
+            whens[attname].append(
+                When(pk=pk, **{attname: old_value}, then=Value(ciphertext))
+            )
+            pks.add(pk)
+
+        updates = {
+            attname: Case(*attname_whens, default=F(attname), output_field=TextField())
+            for attname, attname_whens in whens.items() if attname_whens
+        }
+        queryset = model._base_manager.filter(pk__in=pks)
+        attnames = list(fields_map)
+        with transaction.atomic(using=queryset.db):
+            queryset.update(**updates)
+            # Rows are locked by the update until commit, read what is written
+            rows = {row[0]: dict(zip(attnames, row[1:])) for row in queryset.values_list('pk', *attnames)}
+
+        mismatched = 0
+        for pk, attname, __, ciphertext in results:
+            value = rows.get(pk, {}).get(attname)
+            if getattr(value, 'ciphertext', value) != ciphertext:
+                mismatched += 1
+        return mismatched
+
+    def run_model(self, model, fields):
+        label = model._meta.label
+        attnames = [field.attname for field in fields]
+        checkpoint = {}
+        if not self.restart and not self.dry_run:
+            checkpoint = get_reencrypt_checkpoint(model, self.run_key)
+        stat = {
+            'model': label, 'columns': attnames, 'rows': 0,
+            'updated': 0, 'skipped': 0, 'failed': 0,
+        }
+        if checkpoint.get('finished'):
+            self.output('{} finished before, skip'.format(label))
+            return dict(stat, **checkpoint)
+        if self.restart:
+            clear_reencrypt_checkpoint(model, self.run_key)
+        for key in ('rows', 'updated', 'skipped', 'failed'):
+            stat[key] = checkpoint.get(key, 0)
+
+        queryset = model._base_manager.order_by('pk')
+        last_pk = checkpoint.get('last_pk')
+        chunks = 0
+        start = time.time()
+        while True:
+            chunk_queryset = queryset
+            if last_pk is not None:
+                chunk_queryset = queryset.filter(pk__gt=last_pk)
+            rows = list(chunk_queryset.values_list('pk', *attnames)[:self.chunk_size])
+            if not rows:
+                break
+
+            results, skipped, failed = self.process(self.get_chunk_items(rows, fields))
+            mismatched = 0
+            if not self.dry_run:
+                mismatched = self.write(model, fields, results)
+            last_pk = rows[-1][0]
+            chunks += 1
+            stat['rows'] += len(rows)
+            stat['updated'] += len(results) - mismatched
+            stat['skipped'] += skipped + mismatched
+            stat['failed'] += failed
+
+            if self.dry_run:
+                if chunks >= self.sample_chunks:
+                    break
+                continue
+            save_reencrypt_checkpoint(model, self.run_key, last_pk=last_pk, **self.get_counts(stat))
+            self.output('{} rows: {}, updated: {}, failed: {}'.format(
+                label, stat['rows'], stat['updated'], stat['failed']
+            ))
+
+        cost = time.time() - start
+        if self.dry_run:
+            total = queryset.count()
+            rate = stat['rows'] / cost if cost and stat['rows'] else 0
+            stat['total'] = total
+            stat['estimated_seconds'] = total / rate if rate else 0
+            self.output('{} {} rows, sample {} rows/s, estimated {:.1f}s'.format(
+                label, total, int(rate), stat['estimated_seconds']
+            ))
+            return stat
+
+        save_reencrypt_checkpoint(
+            model, self.run_key, last_pk=last_pk, finished=True, **self.get_counts(stat)
+        )
+        self.output('{} finished in {:.1f}s, updated: {}, skipped: {}, failed: {}'.format(
+            label, cost, stat['updated'], stat['skipped'], stat['failed']
+        ))
+        return stat
+
+    @staticmethod
+    def get_counts(stat):
+        return {k: stat[k] for k in ('rows', 'updated', 'skipped', 'failed')}
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+#
+import os
+import time
+import datetime
+
+from django.core.cache import cache
+from django.db import models, transaction
+
+from common.utils import get_logger
+
+logger = get_logger(__file__)
+
+__all__ = ['RetentionPurger', 'purge_dated_dirs', 'get_retention_progress']
+
+PROGRESS_CACHE_KEY = 'COMMON_RETENTION_PROGRESS_{}'
+PROGRESS_CACHE_TTL = 3600 * 24 * 7
+
+
+def get_retention_progress(name):
+    return cache.get(PROGRESS_CACHE_KEY.format(name))
+
+
+def save_retention_progress(name, **progress):
+    progress['date_updated'] = time.time()
+    cache.set(PROGRESS_CACHE_KEY.format(name), progress, PROGRESS_CACHE_TTL)
+
+
+class RetentionPurger:
+    """
+    Delete expired rows in bounded chunks
+
+    `queryset.delete()` loads all rows to send delete signals and to cascade,
+    there are receivers of all models, so it never fast deletes. Here ids of
+    a chunk are selected by the expire condition (an indexed time field),
+    rows referencing them are deleted or set null by their `on_delete`, then
+    the chunk is deleted by raw DELETE in its own transaction, and sleep a
+    while before the next one. Delete signals are not sent.
+
+    Every chunk is committed, an interrupted purge goes on from where it
+    stopped when run again. Progress is saved in cache.
+    """
+    chunk_size = 5000
+    sleep_seconds = 0.2
+
+    def __init__(self, name, queryset, chunk_size=None, sleep_seconds=None):
+        self.name = name
+        self.queryset = queryset
+        self.model = queryset.model
+        if chunk_size is not None:
+            self.chunk_size = chunk_size
+        if sleep_seconds is not None:
+            self.sleep_seconds = sleep_seconds
+        self.deleted = 0
+
+    def __str__(self):
+        return 'RetentionPurger({})'.format(self.name)
+
+    def get_chunk_ids(self):
+        return list(self.queryset.values_list('pk', flat=True)[:self.chunk_size])
+
+    def run(self):
+        start = time.time()
+        chunks = 0
+        while True:
+            ids = self.get_chunk_ids()
+            if not ids:
+                break
+            with transaction.atomic(using=self.queryset.db):
+                self.deleted += self.delete_objects(self.model, ids)
+            chunks += 1
+            save_retention_progress(
+                self.name, status='running', deleted=self.deleted,
+                chunks=chunks, date_start=start
+            )
+            if len(ids) < self.chunk_size:
+                break
+            time.sleep(self.sleep_seconds)
+
+        save_retention_progress(
+            self.name, status='finished', deleted=self.deleted,
+            chunks=chunks, date_start=start
+        )
+        logger.info('{} deleted {} rows in {:.1f}s'.format(self, self.deleted, time.time() - start))
+        return self.deleted
+
+    @classmethod
+    def delete_objects(cls, model, ids):
+        """ :return: amount of `model` rows deleted """
+        if not ids:
+            return 0
+        cls.delete_related(model, ids)
+        queryset = model._base_manager.filter(pk__in=ids)
+        return queryset._raw_delete(queryset.db)
+
+    @classmethod
+    def delete_related(cls, model, ids):
+        opts = model._meta
+        # Through rows of many to many fields
+        for field in opts.many_to_many:
+            through = field.remote_field.through
+            if through._meta.auto_created:
+                lookup = '{}__in'.format(field.m2m_field_name())
+                queryset = through._base_manager.filter(**{lookup: ids})
+                queryset._raw_delete(queryset.db)
+
+        for rel in opts.related_objects:
+            related_model = rel.related_model
+            if rel.many_to_many:
+                through = rel.through
+                if through._meta.auto_created:
+                    lookup = '{}__in'.format(rel.field.m2m_reverse_field_name())
+                    queryset = through._base_manager.filter(**{lookup: ids})
+                    queryset._raw_delete(queryset.db)
+                continue
+
+            lookup = '{}__in'.format(rel.field.name)
+            queryset = related_model._base_manager.filter(**{lookup: ids})
+            if rel.on_delete is models.CASCADE:
+                related_ids = list(queryset.values_list('pk', flat=True))
+                cls.delete_objects(related_model, related_ids)
+            elif rel.on_delete is models.SET_NULL:
+                queryset.update(**{rel.field.name: None})
+
+
+def purge_dated_dirs(name, base_dir, expire_date, suffixes, date_format='%Y-%m-%d',
+                     sleep_seconds=0.05):
+    """
+    Remove files of the date partitioned directories older than `expire_date`
+
+    Layout: base_dir/<date>/<file>, directories are handled in date order,
+    files with the suffixes are removed and then the empty directory, so an
+    interrupted purge goes on from the oldest left. Files in other
+    directories are removed by their modified time.
+
+    :return: amount of files removed
+    """
+    if not os.path.isdir(base_dir):
+        return 0
+
+    dated_dirs = []
+    other_dirs = []
+    for entry in os.scandir(base_dir):
+        if not entry.is_dir():
+            continue
+        try:
+            date = datetime.datetime.strptime(entry.name, date_format).date()
+        except ValueError:
+            other_dirs.append(entry.path)
+            continue
+        if date < expire_date.date():
+            dated_dirs.append((date, entry.path))
+    dated_dirs.sort()
+
+    removed = 0
+    start = time.time()
+
+    def remove_files(path, expire_timestamp=None):
+        count = 0
+        for entry in os.scandir(path):
+            if not entry.is_file() or not entry.name.endswith(suffixes):
+                continue
+            if expire_timestamp and entry.stat().st_mtime >= expire_timestamp:
+                continue
+            try:
+                os.remove(entry.path)
+                count += 1
+            except OSError as e:
+                logger.error('Remove file error: {} {}'.format(entry.path, e))
+        return count
+
+    def remove_empty_dir(path):
+        try:
+            os.rmdir(path)
+        except OSError:
+            pass
+
+    for date, path in dated_dirs:
+        removed += remove_files(path)
+        remove_empty_dir(path)
+        save_retention_progress(
+            name, status='running', deleted=removed, date_start=start, last_dir=str(date)
+        )
+        time.sleep(sleep_seconds)
+
+    expire_timestamp = expire_date.timestamp()
+    removed += remove_files(base_dir, expire_timestamp)
+    for path in other_dirs:
+        for root, dirs, files in os.walk(path, topdown=False):
+            removed += remove_files(root, expire_timestamp)
+            if root != base_dir:
+                remove_empty_dir(root)
+
+    save_retention_progress(name, status='finished', deleted=removed, date_start=start)
+    logger.info('Purge {} removed {} files'.format(base_dir, removed))
+    return removed
@@ -2,7 +2,7 @@ from rest_framework.viewsets import GenericViewSet, ModelViewSet, ReadOnlyModelV
 from rest_framework_bulk import BulkModelViewSet
 
 from ..mixins.api import (
-    RelationMixin, AllowBulkDestroyMixin, CommonMixin
+    RelationMixin, AllowBulkDestroyMixin, CommonMixin, ChunkedImportMixin
 )
 
 
@@ -22,11 +22,12 @@ class JMSReadOnlyModelViewSet(CommonMixin, ReadOnlyModelViewSet):
     pass
 
 
-class JMSBulkModelViewSet(CommonMixin, AllowBulkDestroyMixin, BulkModelViewSet):
+class JMSBulkModelViewSet(CommonMixin, ChunkedImportMixin, AllowBulkDestroyMixin, BulkModelViewSet):
     pass
 
 
 class JMSBulkRelationModelViewSet(CommonMixin,
+                                  ChunkedImportMixin,
                                   RelationMixin,
                                   AllowBulkDestroyMixin,
                                   BulkModelViewSet):
@@ -0,0 +1,368 @@
+# -*- coding: utf-8 -*-
+#
+import os
+import time
+import uuid
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models.signals import pre_save, post_save
+from django.http import HttpRequest, QueryDict
+from django.utils.module_loading import import_string
+from rest_framework import serializers
+from rest_framework.mixins import CreateModelMixin, UpdateModelMixin
+from rest_framework.request import Request
+
+from common.utils import get_logger
+from jumpserver.utils import set_current_request
+from orgs.utils import tmp_to_org
+
+logger = get_logger(__file__)
+
+__all__ = [
+    'ImportTask', 'ChunkedFileImporter', 'get_import_file_dir', 'run_chunked_import',
+]
+
+
+def get_import_file_dir():
+    return os.path.join(settings.PROJECT_DIR, 'tmp', 'import')
+
+
+class ImportTask:
+    """
+    Progress of a chunked import, saved in cache
+
+    The file is imported by a celery task, a running task not updated for
+    `STALE_SECONDS` is taken as interrupted, e.g. the worker restarted
+    """
+    CACHE_KEY = 'COMMON_IMPORT_TASK_{}'
+    CACHE_TTL = 3600 * 24
+    ERRORS_MAX_SIZE = 1000
+    STALE_SECONDS = 600
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    SUCCESS = 'success'
+    FAILED = 'failed'
+
+    def __init__(self, id=None, user_id='', status=PENDING, processed=0,
+                 created=0, updated=0, failed=0, errors=None, error='',
+                 date_start=None, date_finished=None, date_updated=None):
+        self.id = str(id or uuid.uuid4())
+        self.user_id = str(user_id)
+        self.status = status
+        self.processed = processed
+        self.created = created
+        self.updated = updated
+        self.failed = failed
+        # [{'line': 2, 'errors': {...}}, ]
+        self.errors = errors or []
+        self.error = error
+        self.date_start = date_start
+        self.date_finished = date_finished
+        self.date_updated = date_updated
+
+    @classmethod
+    def get_cache_key(cls, task_id):
+        return cls.CACHE_KEY.format(task_id)
+
+    @classmethod
+    def get(cls, task_id):
+        data = cache.get(cls.get_cache_key(task_id))
+        if not data:
+            return None
+        task = cls(**data)
+        if task.is_stale():
+            task.finish(error='Import interrupted')
+        return task
+
+    def is_stale(self):
+        if self.status != self.RUNNING:
+            return False
+        return time.time() - (self.date_updated or 0) > self.STALE_SECONDS
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'status': self.status,
+            'processed': self.processed,
+            'created': self.created,
+            'updated': self.updated,
+            'failed': self.failed,
+            'errors': self.errors,
+            'error': self.error,
+            'date_start': self.date_start,
+            'date_finished': self.date_finished,
+            'date_updated': self.date_updated,
+        }
+
+    def save(self):
+        self.date_updated = time.time()
+        cache.set(self.get_cache_key(self.id), self.to_dict(), self.CACHE_TTL)
+
+    def add_error(self, line, errors):
+        self.failed += 1
+        if len(self.errors) < self.ERRORS_MAX_SIZE:
+            self.errors.append({'line': line, 'errors': errors})
+
+    def start(self):
+        self.status = self.RUNNING
+        self.date_start = time.time()
+        self.save()
+
+    def finish(self, error=''):
+        self.status = self.FAILED if error else self.SUCCESS
+        self.error = error
+        self.date_finished = time.time()
+        self.save()
+
+
+class ChunkedFileImporter:
+    """
+    Import rows of a csv/xlsx file chunk by chunk:
+    parse -> validate -> save a chunk in one transaction
+
+    Rows failed are recorded in the task, others go on. Chunks of simple
+    models, whose serializer and view don't customize saving, are saved by
+    `bulk_create`/`bulk_update` and save signals are sent for each object.
+    """
+    chunk_size = 500
+
+    def __init__(self, view, parser, file, task, partial=False):
+        self.view = view
+        self.request = view.request
+        self.parser = parser
+        self.file = file
+        self.task = task
+        self.is_update = self.request.method.lower() in ('put', 'patch')
+        self.partial = partial
+        self.field_names = []
+
+    def run(self, org):
+        self.task.start()
+        error = ''
+        try:
+            with tmp_to_org(org):
+                self.import_rows()
+        except Exception as e:
+            logger.error('Import file error: {}'.format(e), exc_info=True)
+            error = str(e)
+        finally:
+            self.task.finish(error=error)
+
+    def import_rows(self):
+        rows = self.parser.generate_file_rows(self.file)
+        self.field_names = self.parser.parse_field_names(rows, self.request)
+        # Line 1 is column titles
+        lines = enumerate(rows, start=2)
+        while True:
+            chunk = list(islice(lines, self.chunk_size))
+            if not chunk:
+                break
+            self.import_chunk(chunk)
+            self.task.processed += len(chunk)
+            self.task.save()
+
+    def get_instances(self, chunk_data):
+        if not self.is_update:
+            return {}
+        ids = [data['id'] for __, data in chunk_data if data.get('id')]
+        queryset = self.view.filter_queryset(self.view.get_queryset())
+        return {str(obj.pk): obj for obj in queryset.filter(pk__in=ids)}
+
+    def get_serializer(self, data, instance=None):
+        if self.is_update:
+            return self.view.get_serializer(instance, data=data, partial=self.partial)
+        return self.view.get_serializer(data=data)
+
+    def import_chunk(self, chunk):
+        chunk_data = []
+        for line, row in chunk:
+            if not any(row):
+                continue
+            try:
+                data = self.parser.generate_row_data(self.field_names, row)
+            except Exception as e:
+                self.task.add_error(line, str(e))
+                continue
+            chunk_data.append((line, data))
+
+        instances = self.get_instances(chunk_data)
+        items = []
+        for line, data in chunk_data:
+            instance = instances.get(str(data.get('id'))) if self.is_update else None
+            if self.is_update and instance is None:
+                self.task.add_error(line, 'Not found: {}'.format(data.get('id')))
+                continue
+            serializer = self.get_serializer(data, instance)
+            if not serializer.is_valid():
+                self.task.add_error(line, serializer.errors)
+                continue
+            items.append((line, data, instance, serializer))
+
+        if items:
+            self.save_items(items)
+
+    def save_items(self, items):
+        try:
+            with transaction.atomic():
+                serializers_ = [i[3] for i in items]
+                if self.can_bulk_save(serializers_):
+                    self.bulk_save(serializers_)
+                else:
+                    for serializer in serializers_:
+                        self.perform_save(serializer)
+            self.count_saved(len(items))
+            return
+        except Exception as e:
+            logger.debug('Save chunk error, save one by one: {}'.format(e))
+
+        # Find out the rows failed, the chunk transaction was rolled back
+        for line, data, instance, __ in items:
+            serializer = self.get_serializer(data, instance)
+            try:
+                with transaction.atomic():
+                    serializer.is_valid(raise_exception=True)
+                    self.perform_save(serializer)
+                self.count_saved(1)
+            except serializers.ValidationError as e:
+                self.task.add_error(line, e.detail)
+            except Exception as e:
+                self.task.add_error(line, str(e))
+
+    def count_saved(self, amount):
+        if self.is_update:
+            self.task.updated += amount
+        else:
+            self.task.created += amount
+
+    def perform_save(self, serializer):
+        if self.is_update:
+            self.view.perform_update(serializer)
+        else:
+            self.view.perform_create(serializer)
+
+    # Bulk save
+    def can_bulk_save(self, serializers_):
+        serializer = serializers_[0]
+        if not isinstance(serializer, serializers.ModelSerializer):
+            return False
+        view_cls = type(self.view)
+        serializer_cls = type(serializer)
+        if self.is_update:
+            if view_cls.perform_update is not UpdateModelMixin.perform_update:
+                return False
+            if serializer_cls.update is not serializers.ModelSerializer.update:
+                return False
+        else:
+            if view_cls.perform_create is not CreateModelMixin.perform_create:
+                return False
+            if serializer_cls.create is not serializers.ModelSerializer.create:
+                return False
+
+        from orgs.mixins.models import OrgModelMixin
+        model = serializer.Meta.model
+        # OrgManager.bulk_create does what OrgModelMixin.save does
+        if model.save not in (models.Model.save, OrgModelMixin.save):
+            return False
+        many_to_many = {f.name for f in model._meta.many_to_many}
+        for s in serializers_:
+            if many_to_many & set(s.validated_data):
+                return False
+        return True
+
+    def bulk_save(self, serializers_):
+        model = serializers_[0].Meta.model
+        db = model.objects.db
+        objs = []
+        for serializer in serializers_:
+            validated_data = serializer.validated_data
+            if self.is_update:
+                obj = serializer.instance
+                for attr, value in validated_data.items():
+                    setattr(obj, attr, value)
+            else:
+                obj = model(**validated_data)
+            objs.append(obj)
+
+        update_fields = None
+        for obj in objs:
+            pre_save.send(sender=model, instance=obj, raw=False, using=db, update_fields=update_fields)
+
+        if self.is_update:
+            fields = set()
+            for serializer in serializers_:
+                fields.update(serializer.validated_data.keys())
+            for field in model._meta.concrete_fields:
+                if getattr(field, 'auto_now', False):
+                    fields.add(field.name)
+                    for obj in objs:
+                        field.pre_save(obj, False)
+            fields.discard(model._meta.pk.name)
+            if fields:
+                model.objects.bulk_update(objs, list(fields))
+        else:
+            model.objects.bulk_create(objs)
+
+        created = not self.is_update
+        for serializer, obj in zip(serializers_, objs):
+            serializer.instance = obj
+            post_save.send(
+                sender=model, instance=obj, created=created,
+                update_fields=update_fields, raw=False, using=db
+            )
+
+
+def build_import_view(view_path, action, method, query_string, view_kwargs, user, remote_addr):
+    """
+    The view of the import request, with a request of the same user, method
+    and query, the serializers and view hooks work as in the request
+    """
+    http_request = HttpRequest()
+    http_request.method = method
+    http_request.GET = QueryDict(query_string)
+    http_request.META.update({'QUERY_STRING': query_string, 'REMOTE_ADDR': remote_addr})
+    http_request.session = {}
+    request = Request(http_request)
+    request.user = user
+
+    view = import_string(view_path)()
+    view.action_map = {method.lower(): action}
+    view.action = action
+    view.args = ()
+    view.kwargs = view_kwargs
+    view.format_kwarg = None
+    view.headers = {}
+    view.request = request
+    return view
+
+
+def run_chunked_import(task_id, filepath, view_path, parser_path, user_id, org_id,
+                       action, method, query_string='', view_kwargs=None,
+                       remote_addr='', partial=False):
+    from users.models import User
+
+    task = ImportTask.get(task_id) or ImportTask(id=task_id, user_id=user_id)
+    try:
+        user = User.objects.get(id=user_id)
+        with tmp_to_org(org_id):
+            view = build_import_view(
+                view_path, action, method, query_string, view_kwargs or {}, user, remote_addr
+            )
+            parser = import_string(parser_path)()
+            parser.set_serializer_from_view(view)
+        # Operate logs read the user and ip from the current request
+        set_current_request(view.request._request)
+        with open(filepath, 'rb') as f:
+            importer = ChunkedFileImporter(view, parser, f, task, partial=partial)
+            importer.run(org_id)
+    except Exception as e:
+        logger.error('Import file error: {}'.format(e), exc_info=True)
+        task.finish(error=str(e))
+    finally:
+        set_current_request(None)
+        if os.path.exists(filepath):
+            os.remove(filepath)
@@ -41,6 +41,10 @@ class BaseFileParser(BaseParser):
     def generate_rows(self, stream_data):
         raise NotImplemented
 
+    def generate_file_rows(self, f):
+        """ Rows of a file opened in binary mode, read all of it by default """
+        return self.generate_rows(self.get_stream_data(f))
+
     def get_column_titles(self, rows):
         return next(rows)
 
@@ -102,44 +106,52 @@ class BaseFileParser(BaseParser):
                 new_row_data[k] = v
         return new_row_data
 
+    def generate_row_data(self, fields_name, row):
+        row = self.process_row(row)
+        row_data = dict(zip(fields_name, row))
+        row_data = self.process_row_data(row_data)
+        return row_data
+
     def generate_data(self, fields_name, rows):
         data = []
         for row in rows:
             if not any(row):
                 continue
-            row = self.process_row(row)
-            row_data = dict(zip(fields_name, row))
-            row_data = self.process_row_data(row_data)
+            row_data = self.generate_row_data(fields_name, row)
             data.append(row_data)
         return data
 
-    def parse(self, stream, media_type=None, parser_context=None):
-        assert parser_context is not None, '`parser_context` should not be `None`'
-
-        view = parser_context['view']
-        request = view.request
-
+    def set_serializer_from_view(self, view):
         try:
-            meta = request.META
             self.serializer_cls = view.get_serializer_class()
             self.serializer_fields = self.serializer_cls().fields
         except Exception as e:
             logger.debug(e, exc_info=True)
             raise ParseError('The resource does not support imports!')
 
-        self.check_content_length(meta)
+    def parse_field_names(self, rows, request):
+        column_titles = self.get_column_titles(rows)
+        field_names = self.convert_to_field_names(column_titles)
+
+        column_title_field_pairs = list(zip(column_titles, field_names))
+        if not hasattr(request, 'jms_context'):
+            request.jms_context = {}
+        request.jms_context['column_title_field_pairs'] = column_title_field_pairs
+        return field_names
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        assert parser_context is not None, '`parser_context` should not be `None`'
+
+        view = parser_context['view']
+        request = view.request
+
+        self.set_serializer_from_view(view)
+        self.check_content_length(request.META)
 
         try:
             stream_data = self.get_stream_data(stream)
             rows = self.generate_rows(stream_data)
-            column_titles = self.get_column_titles(rows)
-            field_names = self.convert_to_field_names(column_titles)
-
-            column_title_field_pairs = list(zip(column_titles, field_names))
-            if not hasattr(request, 'jms_context'):
-                request.jms_context = {}
-            request.jms_context['column_title_field_pairs'] = column_title_field_pairs
-
+            field_names = self.parse_field_names(rows, request)
             data = self.generate_data(field_names, rows)
             return data
         except Exception as e:
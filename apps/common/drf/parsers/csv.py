@@ -1,6 +1,8 @@
 # ~*~ coding: utf-8 ~*~
 #
 
+import codecs
+
 import chardet
 import unicodecsv
 
@@ -10,6 +12,7 @@ from .base import BaseFileParser
 class CSVFileParser(BaseFileParser):
 
     media_type = 'text/csv'
+    encoding_detect_size = 64 * 1024
 
     @staticmethod
     def _universal_newlines(stream):
@@ -23,3 +26,16 @@ class CSVFileParser(BaseFileParser):
         csv_reader = unicodecsv.reader(lines, encoding=encoding)
         for row in csv_reader:
             yield row
+
+    def generate_file_rows(self, f):
+        # Read line by line, the encoding is detected by the head of the file
+        head = f.read(self.encoding_detect_size)
+        f.seek(0)
+        encoding = chardet.detect(head).get('encoding') or 'utf-8'
+        if encoding.lower() == 'ascii':
+            encoding = 'utf-8'
+        if head.startswith(codecs.BOM_UTF8):
+            encoding = 'utf-8-sig'
+        csv_reader = unicodecsv.reader(f, encoding=encoding)
+        for row in csv_reader:
+            yield row
@@ -1,4 +1,6 @@
 import pyexcel
+from openpyxl import load_workbook
+
 from .base import BaseFileParser
 
 
@@ -11,3 +13,13 @@ class ExcelFileParser(BaseFileParser):
         sheet = workbook.sheet_by_index(0)
         rows = sheet.rows()
         return rows
+
+    def generate_file_rows(self, f):
+        # Read only workbook loads rows as they are iterated
+        workbook = load_workbook(f, read_only=True, data_only=True)
+        try:
+            sheet = workbook.worksheets[0]
+            for row in sheet.iter_rows(values_only=True):
+                yield ['' if value is None else value for value in row]
+        finally:
+            workbook.close()
@@ -1,9 +1,13 @@
 import abc
 from datetime import datetime
+from itertools import islice
+
+from django.http import StreamingHttpResponse
 from rest_framework.renderers import BaseRenderer
 from rest_framework.utils import encoders, json
 
 from common.utils import get_logger
+from orgs.utils import get_current_org, tmp_to_org
 
 logger = get_logger(__file__)
 
@@ -11,6 +15,10 @@ logger = get_logger(__file__)
 class BaseFileRenderer(BaseRenderer):
     template = 'export'
     serializer = None
+    # Objects serialized one time in streaming mode
+    stream_chunk_size = 1000
+    stream_templates = ('export', 'update')
+    stream_error_row = 'Render error! The exported rows are incomplete'
 
     @staticmethod
     def _check_validation_data(data):
@@ -64,6 +72,9 @@ class BaseFileRenderer(BaseRenderer):
         results = json.loads(json.dumps(results, cls=encoders.JSONEncoder))
         return results
 
+    def process_stream_data(self, data):
+        return json.loads(json.dumps(data, cls=encoders.JSONEncoder))
+
     @staticmethod
     def generate_rows(data, render_fields):
         for item in data:
@@ -96,6 +107,14 @@ class BaseFileRenderer(BaseRenderer):
     def get_rendered_value(self):
         raise NotImplementedError
 
+    def flush_stream_value(self):
+        """ Bytes written since last flush in streaming mode """
+        return b''
+
+    def iter_stream_tail(self):
+        """ Bytes after all rows written in streaming mode """
+        yield self.get_rendered_value()
+
     def render(self, data, accepted_media_type=None, renderer_context=None):
         if data is None:
             return bytes()
@@ -132,3 +151,94 @@ class BaseFileRenderer(BaseRenderer):
 
         return value
 
+    # Streaming mode
+    @classmethod
+    def is_stream_supported(cls, request):
+        template = request.query_params.get('template', 'export')
+        return template in cls.stream_templates
+
+    @staticmethod
+    def iter_queryset_chunks(queryset, chunk_size, offset=0, limit=None):
+        """
+        Yield objects of the queryset chunk by chunk, only primary keys are read
+        with a server side cursor, objects of a chunk are fetched by them, so
+        the `prefetch_related` of the queryset still works
+        """
+        pk_queryset = queryset.values_list('pk', flat=True)
+        if limit is not None:
+            pk_queryset = pk_queryset[offset:offset + limit]
+        elif offset:
+            pk_queryset = pk_queryset[offset:]
+        pk_iter = pk_queryset.iterator(chunk_size=chunk_size)
+
+        while True:
+            pks = list(islice(pk_iter, chunk_size))
+            if not pks:
+                break
+            objs_mapper = {obj.pk: obj for obj in queryset.filter(pk__in=pks)}
+            yield [objs_mapper[pk] for pk in pks if pk in objs_mapper]
+
+    def generate_stream_value(self, queryset, view, rendered_fields, column_titles, org, **kwargs):
+        # Rows are generated after the view returned, keep the org of the request
+        self._stream_writer_ready = False
+        self._stream_tail_started = False
+        try:
+            with tmp_to_org(org):
+                yield from self._generate_stream_value(
+                    queryset, view, rendered_fields, column_titles, **kwargs
+                )
+        except Exception as e:
+            # Headers were sent, can't response error any more
+            logger.error('Stream render error: {}'.format(e), exc_info=True)
+            yield from self.iter_stream_error()
+
+    def iter_stream_error(self):
+        """ Mark the file incomplete by a last row, if the tail not sent yet """
+        if not self._stream_writer_ready or self._stream_tail_started:
+            return
+        try:
+            self.write_row([self.stream_error_row])
+            yield from self.iter_stream_tail()
+        except Exception as e:
+            logger.error('Stream render error row error: {}'.format(e), exc_info=True)
+
+    def _generate_stream_value(self, queryset, view, rendered_fields, column_titles, **kwargs):
+        self.initial_writer()
+        self.write_column_titles(column_titles)
+        self._stream_writer_ready = True
+        process_objects = getattr(view, 'process_stream_export_objects', None)
+        for objs in self.iter_queryset_chunks(queryset, self.stream_chunk_size, **kwargs):
+            if process_objects:
+                objs = process_objects(objs)
+            data = view.get_serializer(objs, many=True).data
+            data = self.process_stream_data(data)
+            self.write_rows(self.generate_rows(data, rendered_fields))
+            value = self.flush_stream_value()
+            if value:
+                yield value
+        self._stream_tail_started = True
+        yield from self.iter_stream_tail()
+
+    def get_streaming_response(self, queryset, view, request, offset=0, limit=None):
+        """
+        Render the queryset to `StreamingHttpResponse` in chunks, memory used
+        does not grow with the amount of rows
+
+        :return: response or None if the view not support
+        """
+        try:
+            self.template = request.query_params.get('template', 'export')
+            self.serializer = view.get_serializer()
+            rendered_fields = self.get_rendered_fields()
+            column_titles = self.get_column_titles(rendered_fields)
+        except Exception as e:
+            logger.debug(e, exc_info=True)
+            return None
+
+        stream = self.generate_stream_value(
+            queryset, view, rendered_fields, column_titles, get_current_org(),
+            offset=offset, limit=limit
+        )
+        response = StreamingHttpResponse(stream, content_type=self.media_type)
+        self.set_response_disposition(response)
+        return response
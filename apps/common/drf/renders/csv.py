@@ -28,3 +28,14 @@ class CSVFileRenderer(BaseFileRenderer):
     def get_rendered_value(self):
         value = self.buffer.getvalue()
         return value
+
+    def flush_stream_value(self):
+        value = self.buffer.getvalue()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        return value
+
+    def iter_stream_tail(self):
+        value = self.flush_stream_value()
+        if value:
+            yield value
@@ -1,3 +1,5 @@
+import tempfile
+
 from openpyxl import Workbook
 from openpyxl.writer.excel import save_virtual_workbook
 from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
@@ -12,12 +14,22 @@ class ExcelFileRenderer(BaseFileRenderer):
     wb = None
     ws = None
     row_count = 0
+    streaming = False
+    read_block_size = 64 * 1024
 
     def initial_writer(self):
-        self.wb = Workbook()
-        self.ws = self.wb.active
+        if self.streaming:
+            # Write only workbook keeps rows in temp file, not in memory
+            self.wb = Workbook(write_only=True)
+            self.ws = self.wb.create_sheet()
+        else:
+            self.wb = Workbook()
+            self.ws = self.wb.active
 
     def write_row(self, row):
+        if self.streaming:
+            self.ws.append([ILLEGAL_CHARACTERS_RE.sub(r'', v) for v in row])
+            return
         self.row_count += 1
         column_count = 0
         for cell_value in row:
@@ -28,3 +40,14 @@ class ExcelFileRenderer(BaseFileRenderer):
     def get_rendered_value(self):
         value = save_virtual_workbook(self.wb)
         return value
+
+    def get_streaming_response(self, *args, **kwargs):
+        self.streaming = True
+        return super().get_streaming_response(*args, **kwargs)
+
+    def iter_stream_tail(self):
+        # Xlsx is a zip file, can only be read after saved
+        with tempfile.TemporaryFile() as f:
+            self.wb.save(f)
+            f.seek(0)
+            yield from iter(lambda: f.read(self.read_block_size), b'')
@@ -0,0 +1,48 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from common.db.reencrypt import SecretReEncryptor, get_encrypt_columns
+
+
+class Command(BaseCommand):
+    help = 'Re-encrypt encrypted columns with the current crypto algorithm and secret key'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--old-secret-key', default=os.environ.get('OLD_SECRET_KEY'),
+            help='Secret key the values were encrypted with, if the key is rotated, '
+                 'default env OLD_SECRET_KEY'
+        )
+        parser.add_argument('--algo', help='Crypto algorithm, default SECURITY_DATA_CRYPTO_ALGO')
+        parser.add_argument('--model', action='append', dest='models', help='Model label, e.g. assets.AuthBook')
+        parser.add_argument('--workers', type=int, help='Processes to encrypt, default cpu count')
+        parser.add_argument('--chunk-size', type=int, help='Rows of a chunk')
+        parser.add_argument('--dry-run', action='store_true', help='Sample and estimate the time, write nothing')
+        parser.add_argument('--restart', action='store_true', help='Ignore the checkpoints')
+        parser.add_argument('--list', action='store_true', help='List the encrypted columns')
+
+    def handle(self, *args, **options):
+        if options['list']:
+            for model, fields in get_encrypt_columns(options['models']):
+                self.stdout.write('{}: {}'.format(model._meta.label, ', '.join(f.attname for f in fields)))
+            return
+
+        reencryptor = SecretReEncryptor(
+            model_labels=options['models'],
+            old_secret_key=options['old_secret_key'],
+            algo=options['algo'],
+            workers=options['workers'],
+            chunk_size=options['chunk_size'],
+            dry_run=options['dry_run'],
+            restart=options['restart'],
+            output=self.stdout.write,
+        )
+        try:
+            stats = reencryptor.run()
+        except Exception as e:
+            raise CommandError(e)
+
+        failed = sum(s['failed'] for s in stats)
+        if failed:
+            self.stderr.write('{} values failed to decrypt, left as they are'.format(failed))
@@ -5,3 +5,5 @@ from .filter import *
 from .permission import *
 from .queryset import *
 from .serializer import *
+from .export import *
+from .importer import *
@@ -10,6 +10,7 @@ from .serializer import SerializerMixin
 from .filter import ExtraFilterFieldsMixin
 from .action import RenderToJsonMixin
 from .queryset import QuerySetMixin
+from .export import StreamExportMixin
 
 
 __all__ = [
@@ -80,14 +81,16 @@ class RelationMixin:
         self.send_m2m_changed_signal(instance, 'post_remove')
 
 
-class CommonApiMixin(SerializerMixin, ExtraFilterFieldsMixin, RenderToJsonMixin):
+class CommonApiMixin(SerializerMixin, ExtraFilterFieldsMixin,
+                     RenderToJsonMixin, StreamExportMixin):
     pass
 
 
 class CommonMixin(SerializerMixin,
                   QuerySetMixin,
                   ExtraFilterFieldsMixin,
-                  RenderToJsonMixin):
+                  RenderToJsonMixin,
+                  StreamExportMixin):
     pass
 
 
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+#
+from django.db.models import QuerySet
+from rest_framework.request import Request
+
+from common.drf.renders.base import BaseFileRenderer
+
+__all__ = ['StreamExportMixin']
+
+
+class StreamExportMixin:
+    """
+    Export list to csv/xlsx with streaming response, instead of rendering
+    all serialized data in memory
+    """
+    stream_export = True
+
+    request: Request
+    paginator: object
+
+    def get_stream_export_renderer(self, request: Request):
+        if not self.stream_export:
+            return None
+        renderer = getattr(request, 'accepted_renderer', None)
+        if not isinstance(renderer, BaseFileRenderer):
+            return None
+        if not renderer.is_stream_supported(request):
+            return None
+        return renderer
+
+    def get_stream_export_offset_limit(self, request: Request):
+        paginator = self.paginator
+        if not hasattr(paginator, 'get_limit'):
+            return 0, None
+        return paginator.get_offset(request), paginator.get_limit(request)
+
+    @property
+    def is_stream_exporting(self):
+        return getattr(self, '_stream_export_response', None) is not None
+
+    def process_stream_export_objects(self, objs):
+        """
+        Objects of a chunk before they are serialized in streaming mode, views
+        which set attributes on the page in `paginate_queryset` do it here
+        """
+        return objs
+
+    def paginate_queryset(self, queryset):
+        # List actions serialize the page and response it by
+        # `get_paginated_response`, hook there to stream all of the queryset
+        renderer = self.get_stream_export_renderer(self.request)
+        is_stream_queryset = isinstance(queryset, QuerySet) and not queryset.query.is_sliced
+        if renderer is not None and is_stream_queryset:
+            offset, limit = self.get_stream_export_offset_limit(self.request)
+            response = renderer.get_streaming_response(
+                queryset, self, self.request, offset=offset, limit=limit
+            )
+            if response is not None:
+                self._stream_export_response = response
+                return []
+        return super().paginate_queryset(queryset)
+
+    def get_paginated_response(self, data):
+        response = getattr(self, '_stream_export_response', None)
+        if response is not None:
+            return response
+        return super().get_paginated_response(data)
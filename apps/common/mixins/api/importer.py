@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+#
+import os
+import time
+
+from rest_framework import status
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.exceptions import ParseError
+
+from common.drf.parsers.base import BaseFileParser, FileContentOverflowedError
+from common.drf.importer import ImportTask, get_import_file_dir
+from common.utils import get_request_ip
+from common.decorator import on_transaction_commit
+from orgs.utils import get_current_org
+
+__all__ = ['ChunkedImportMixin']
+
+
+class ChunkedImportMixin:
+    """
+    Import csv/xlsx file in background with `?chunked=1`, response the task
+    id at once, get the progress by `/api/v1/common/import-tasks/<id>/`
+
+    The uploaded file is saved to the import dir and imported by a celery task
+    """
+    chunked_import_max_length = 1024 * 1024 * 100
+    chunked_import_block_size = 64 * 1024
+
+    request: Request
+
+    def get_chunked_import_parser(self, request: Request):
+        if request.query_params.get('chunked') not in ('1', 'true'):
+            return None
+        parser = request.negotiator.select_parser(request, request.parsers)
+        if not isinstance(parser, BaseFileParser):
+            return None
+        return parser
+
+    @staticmethod
+    def remove_expired_import_files(file_dir):
+        expired = time.time() - ImportTask.CACHE_TTL
+        for name in os.listdir(file_dir):
+            path = os.path.join(file_dir, name)
+            if os.path.getmtime(path) < expired:
+                os.remove(path)
+
+    def save_chunked_import_file(self, request: Request, task: ImportTask):
+        file_dir = get_import_file_dir()
+        os.makedirs(file_dir, exist_ok=True)
+        self.remove_expired_import_files(file_dir)
+
+        filepath = os.path.join(file_dir, task.id)
+        max_length = self.chunked_import_max_length
+        length = 0
+        try:
+            with open(filepath, 'wb') as f:
+                for block in iter(lambda: request.stream.read(self.chunked_import_block_size), b''):
+                    length += len(block)
+                    if length > max_length:
+                        msg = FileContentOverflowedError.default_detail.format(max_length)
+                        raise FileContentOverflowedError(msg)
+                    f.write(block)
+        except Exception:
+            os.remove(filepath)
+            raise
+        return filepath
+
+    def start_chunked_import(self, request: Request, parser: BaseFileParser, partial=False):
+        from common.tasks import import_file_chunked
+
+        parser.set_serializer_from_view(self)
+        content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+        if content_length > self.chunked_import_max_length:
+            msg = FileContentOverflowedError.default_detail.format(self.chunked_import_max_length)
+            raise FileContentOverflowedError(msg)
+        if request.stream is None:
+            raise ParseError('Empty file')
+
+        task = ImportTask(user_id=request.user.id)
+        filepath = self.save_chunked_import_file(request, task)
+        task.save()
+
+        view_cls = type(self)
+        parser_cls = type(parser)
+        kwargs = {
+            'task_id': task.id,
+            'filepath': filepath,
+            'view_path': f'{view_cls.__module__}.{view_cls.__name__}',
+            'parser_path': f'{parser_cls.__module__}.{parser_cls.__name__}',
+            'user_id': str(request.user.id),
+            'org_id': str(get_current_org().id),
+            'action': self.action,
+            'method': request.method,
+            'query_string': request.META.get('QUERY_STRING', ''),
+            'view_kwargs': {k: str(v) for k, v in self.kwargs.items()},
+            'remote_addr': get_request_ip(request),
+            'partial': partial,
+        }
+        on_transaction_commit(import_file_chunked.delay)(**kwargs)
+        return Response(data={'task': task.id}, status=status.HTTP_202_ACCEPTED)
+
+    def create(self, request, *args, **kwargs):
+        parser = self.get_chunked_import_parser(request)
+        if parser is None:
+            return super().create(request, *args, **kwargs)
+        return self.start_chunked_import(request, parser)
+
+    def bulk_update(self, request, *args, **kwargs):
+        parser = self.get_chunked_import_parser(request)
+        if parser is None:
+            return super().bulk_update(request, *args, **kwargs)
+        partial = kwargs.pop('partial', False)
+        return self.start_chunked_import(request, parser, partial=partial)
@@ -54,3 +54,9 @@ def send_mail_attachment_async(subject, message, recipient_list, attachment_list
         return email.send()
     except Exception as e:
         logger.error("Sending mail attachment error: {}".format(e))
+
+
+@shared_task
+def import_file_chunked(**kwargs):
+    from .drf.importer import run_chunked_import
+    run_chunked_import(**kwargs)
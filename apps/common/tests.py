@@ -1,8 +1,14 @@
-from django.test import TestCase
+from ipaddress import ip_address, ip_network
+
+from django.test import TestCase, SimpleTestCase
 
 # Create your tests here.
 
 from .utils import random_string, signer
+from .utils.connection import VersionedLocalCache
+from .utils.ip import (
+    IPGroup, contains_ip, is_ip_address, is_ip_network, is_ip_segment, in_ip_segment
+)
 
 
 def test_signer_len():
@@ -13,3 +19,260 @@ def test_signer_len():
         results[i] = (len(encs)/len(s))
     results = sorted(results.items(), key=lambda x: x[1], reverse=True)
     print(results)
+
+
+class FakeSharedCache:
+    """ Shared versions and channel of `VersionedLocalCache` in memory """
+
+    def __init__(self):
+        self.versions = {}
+        self.messages = []
+        self.caches = []
+        self.publish_errors = 0
+
+    def publish(self, data):
+        if self.publish_errors:
+            self.publish_errors -= 1
+            raise ConnectionError('publish error')
+        self.messages.append(data)
+        for c in self.caches:
+            c.on_message(data)
+
+
+class FakeVersionedLocalCache(VersionedLocalCache):
+    def __init__(self, shared, data, debounce=60):
+        super().__init__('test', loader=self.load_value, apply_delta=self.add_value, debounce=debounce)
+        self.shared = shared
+        self.data = data
+        self.load_count = 0
+        self.apply_count = 0
+        self.commit_errors = 0
+        self._pub_sub = shared
+        shared.caches.append(self)
+
+    def load_value(self, key):
+        self.load_count += 1
+        return frozenset(self.data.get(key, ()))
+
+    def add_value(self, value, delta):
+        self.apply_count += 1
+        return value | {delta}
+
+    def get_shared_version(self, key):
+        return self.shared.versions.get(key, 0)
+
+    def incr_shared_version(self, key):
+        self.shared.versions[key] = self.shared.versions.get(key, 0) + 1
+        return self.shared.versions[key]
+
+    def commit(self, key, deltas):
+        if self.commit_errors:
+            self.commit_errors -= 1
+            raise ConnectionError('commit error')
+        if deltas is not None:
+            self.data.setdefault(key, set()).update(deltas)
+        return super().commit(key, deltas)
+
+
+class VersionedLocalCacheTestCase(SimpleTestCase):
+    def setUp(self):
+        self.shared = FakeSharedCache()
+        self.data = {'k': {1}}
+        self.writer = FakeVersionedLocalCache(self.shared, self.data)
+        self.reader = FakeVersionedLocalCache(self.shared, self.data)
+
+    def tearDown(self):
+        for c in self.shared.caches:
+            if c._timer is not None:
+                c._timer.cancel()
+
+    def test_debounce_coalesce(self):
+        self.writer.publish_delta('k', 2)
+        self.writer.publish_delta('k', 3)
+        self.writer.publish_delta('other', 4)
+        self.assertEqual(self.shared.messages, [])
+        self.assertIsNotNone(self.writer._timer)
+
+        self.writer.flush()
+        self.assertEqual(self.shared.messages, [
+            {'key': 'k', 'version': 1, 'deltas': [2, 3]},
+            {'key': 'other', 'version': 1, 'deltas': [4]},
+        ])
+        self.assertIsNone(self.writer._timer)
+
+    def test_expire_covers_deltas(self):
+        self.writer.publish_delta('k', 2)
+        self.writer.expire('k')
+        self.writer.publish_delta('k', 3)
+        self.writer.flush()
+        self.assertEqual(self.shared.messages, [{'key': 'k', 'version': 1, 'deltas': None}])
+
+    def test_writer_apply_at_once(self):
+        self.assertEqual(self.writer.get('k'), {1})
+        self.writer.publish_delta('k', 2)
+        self.assertEqual(self.writer.get('k'), {1, 2})
+        self.assertEqual(self.writer.get_local_version('k'), 0)
+
+        self.writer.flush()
+        # The message looped back is not applied again
+        self.assertEqual(self.writer.get('k'), {1, 2})
+        self.assertEqual(self.writer.get_local_version('k'), 1)
+        self.assertEqual(self.writer.apply_count, 1)
+        self.assertEqual(self.writer.load_count, 1)
+
+    def test_writer_expire_at_once(self):
+        self.writer.get('k')
+        self.writer.expire('k')
+        self.assertIsNone(self.writer.get_local_version('k'))
+
+    def test_delta_apply(self):
+        self.assertEqual(self.reader.get('k'), {1})
+        self.writer.publish_delta('k', 2)
+        self.assertEqual(self.reader.get('k'), {1})
+
+        self.writer.flush()
+        self.assertEqual(self.reader.get('k'), {1, 2})
+        self.assertEqual(self.reader.get_local_version('k'), 1)
+        self.assertEqual(self.reader.load_count, 1)
+
+    def test_version_gap_reload(self):
+        self.assertEqual(self.reader.get('k'), {1})
+        # A message was missed
+        self.data['k'].add(2)
+        self.shared.versions['k'] = 1
+        self.writer.publish_delta('k', 3)
+        self.writer.flush()
+
+        self.assertIsNone(self.reader.get_local_version('k'))
+        self.assertEqual(self.reader.apply_count, 0)
+        self.assertEqual(self.reader.get('k'), {1, 2, 3})
+        self.assertEqual(self.reader.get_local_version('k'), 2)
+        self.assertEqual(self.reader.load_count, 2)
+
+    def test_commit_error_retry_as_expire(self):
+        self.reader.get('k')
+        self.writer.get('k')
+        self.writer.commit_errors = 1
+        self.writer.publish_delta('k', 2)
+        self.writer.flush()
+
+        self.assertEqual(self.shared.messages, [])
+        self.assertIsNone(self.writer.get_local_version('k'))
+        self.assertEqual(self.writer._pending, {'k': None})
+        self.assertIsNotNone(self.writer._timer)
+
+        self.writer._timer.cancel()
+        self.writer.flush()
+        self.assertEqual(self.shared.messages, [{'key': 'k', 'version': 1, 'deltas': None}])
+        self.assertIsNone(self.reader.get_local_version('k'))
+
+    def test_publish_error_retry_as_expire(self):
+        self.reader.get('k')
+        self.shared.publish_errors = 1
+        self.writer.publish_delta('k', 2)
+        self.writer.flush()
+
+        self.assertEqual(self.shared.messages, [])
+        self.assertEqual(self.writer._pending, {'k': None})
+        self.writer._timer.cancel()
+        self.writer.flush()
+        self.assertEqual(self.shared.messages, [{'key': 'k', 'version': 2, 'deltas': None}])
+        self.assertIsNone(self.reader.get_local_version('k'))
+        self.assertEqual(self.reader.get('k'), {1, 2})
+
+
+def old_contains_ip(ip, ip_group):
+    """ How `contains_ip` checked the entries one by one before `IPGroup` """
+    if '*' in ip_group:
+        return True
+
+    for _ip in ip_group:
+        if is_ip_address(_ip):
+            if ip == _ip:
+                return True
+        elif is_ip_network(_ip) and is_ip_address(ip):
+            if ip_address(ip) in ip_network(_ip):
+                return True
+        elif is_ip_segment(_ip) and is_ip_address(ip):
+            if in_ip_segment(ip, _ip):
+                return True
+        else:
+            if ip == _ip:
+                return True
+    return False
+
+
+class ContainsIPTestCase(SimpleTestCase):
+    # (ip, ip_group, expected)
+    cases = [
+        # *
+        ('192.168.10.1', ['*'], True),
+        ('db.example.com', ['10.0.0.1', '*'], True),
+        ('192.168.10.1', [], False),
+        # Single address, compared as string
+        ('192.168.10.1', ['192.168.10.1'], True),
+        ('192.168.10.2', ['192.168.10.1'], False),
+        ('2001:db8:2de::e13', ['2001:db8:2de::e13'], True),
+        ('2001:db8:2de:0::e13', ['2001:db8:2de::e13'], False),
+        # CIDR
+        ('192.168.1.0', ['192.168.1.0/24'], True),
+        ('192.168.1.100', ['192.168.1.0/24'], True),
+        ('192.168.1.255', ['192.168.1.0/24'], True),
+        ('192.168.2.1', ['192.168.1.0/24'], False),
+        ('192.168.1.5', ['192.168.1.1/24'], False),
+        ('192.168.1.1/24', ['192.168.1.1/24'], True),
+        ('2001:db8:1a:1110::1', ['2001:db8:1a:1110::/64'], True),
+        ('2001:db8:1a:1111::1', ['2001:db8:1a:1110::/64'], False),
+        ('10.0.0.1', ['::/0'], False),
+        ('::1', ['0.0.0.0/0'], False),
+        # Range
+        ('10.1.1.1', ['10.1.1.1-10.1.1.20'], True),
+        ('10.1.1.20', ['10.1.1.1-10.1.1.20'], True),
+        ('10.1.1.0', ['10.1.1.1-10.1.1.20'], False),
+        ('10.1.1.21', ['10.1.1.1-10.1.1.20'], False),
+        ('10.1.1.10', ['10.1.1.20-10.1.1.1'], True),
+        ('10.1.1.21', ['10.1.1.20-10.1.1.1'], False),
+        ('2001:db8::5', ['2001:db8::1-2001:db8::a'], True),
+        ('2001:db8::b', ['2001:db8::a-2001:db8::1'], False),
+        # Ranges compare the integer value, whatever the version
+        ('::a01:10a', ['10.1.1.1-10.1.1.20'], True),
+        ('10.0.0.5', ['10.0.0.1-2001:db8::1'], True),
+        ('2001:db8::', ['10.0.0.1-2001:db8::1'], True),
+        ('2001:db8::2', ['10.0.0.1-2001:db8::1'], False),
+        # Hostnames
+        ('db.example.com', ['db.example.com'], True),
+        ('DB.example.com', ['db.example.com'], False),
+        ('example.com', ['db.example.com'], False),
+        ('my-host', ['my-host'], True),
+        ('db.example.com', ['10.0.0.0/8', '10.0.0.1-10.0.0.9'], False),
+        ('10.1.1.1-10.1.1.20', ['10.1.1.1-10.1.1.20'], True),
+        ('10.0.0.1-', ['10.0.0.1-'], True),
+        ('10.0.0.1', ['10.0.0.1-'], False),
+        # Invalid ip
+        ('', ['10.0.0.0/8'], False),
+        ('10.0.0.256', ['10.0.0.0/8', '10.0.0.0-10.0.1.0'], False),
+        # Mixed
+        ('10.2.0.3', ['192.168.10.1', '10.1.0.0/16', '10.2.0.1-10.2.0.9', 'db'], True),
+        ('10.3.0.3', ['192.168.10.1', '10.1.0.0/16', '10.2.0.1-10.2.0.9', 'db'], False),
+    ]
+
+    def test_cases(self):
+        for ip, ip_group, expected in self.cases:
+            msg = '{} in {}'.format(ip, ip_group)
+            self.assertEqual(old_contains_ip(ip, ip_group), expected, msg=msg)
+            self.assertEqual(contains_ip(ip, ip_group), expected, msg=msg)
+            self.assertEqual(ip in IPGroup(ip_group), expected, msg=msg)
+
+    def test_hostname_with_dashes(self):
+        # Raised ValueError before, now matched as a hostname
+        self.assertTrue(contains_ip('web-01-a', ['10.0.0.0/8', 'web-01-a']))
+        self.assertFalse(contains_ip('web-01-b', ['web-01-a']))
+
+    def test_ignore_not_str_entries(self):
+        self.assertTrue(contains_ip('10.0.0.1', [None, 1, '10.0.0.0/8']))
+        self.assertFalse(contains_ip('10.0.0.1', [None]))
+
+    def test_compile_memoized(self):
+        group = IPGroup.compile(['10.0.0.0/8'])
+        self.assertIs(IPGroup.compile(['10.0.0.0/8']), group)
+        self.assertIs(IPGroup.compile(group), group)
@@ -10,4 +10,6 @@ app_name = 'common'
 urlpatterns = [
     path('resources/cache/',
          api.ResourcesIDCacheApi.as_view(), name='resources-cache'),
+    path('import-tasks/<uuid:pk>/',
+         api.ImportTaskApi.as_view(), name='import-task'),
 ]
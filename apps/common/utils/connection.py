@@ -95,3 +95,279 @@ class RedisPubSub:
         data_json = json.dumps(data)
         self.redis.publish(self.ch, data_json)
         return True
+
+
+class VersionedLocalCache:
+    """
+    In-process cache of values, kept fresh by versions in the shared cache
+
+    Every key has a version in the shared cache. A process changed the data
+    calls `expire(key)` or `publish_delta(key, delta)`, changes of a key in
+    the debounce window are coalesced into one version bump and one message
+    `{'key': key, 'version': version, 'deltas': [delta, ] or None}`.
+
+    Subscribers apply the deltas if their value is of the previous version,
+    otherwise only record the latest version and drop the value, it is
+    reloaded on next `get` by one thread, not by every worker at once.
+
+    The writer applies its deltas (or drops the value on expire) at once and
+    takes the new version on flush. A failed flush is retried as an expire,
+    so that no worker keeps a stale value.
+
+    Subclasses can override `load`, `apply_deltas` and `commit` to keep the
+    value and its version in the shared cache.
+    """
+    VERSION_CACHE_KEY = 'COMMON_LOCAL_CACHE_VERSION_{}_{}'
+    CHANNEL = 'fm.local_cache.{}'
+    RETRY_DELAY = 1
+
+    def __init__(self, name, loader=None, apply_delta=None, debounce=0.5):
+        self.name = name
+        self.loader = loader
+        self.apply_delta = apply_delta
+        self.debounce = debounce
+
+        # { key: (version, value) }
+        self._values = {}
+        # { key: version } latest version known from messages
+        self._latest_versions = {}
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        # { key: value } values changed locally, not flushed yet
+        self._local_changes = {}
+        # { key: [delta, ] or None }, None means expire
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._timer = None
+        self._pub_sub = None
+        self._subscription = None
+
+    def __str__(self):
+        return 'VersionedLocalCache({})'.format(self.name)
+
+    @property
+    def pub_sub(self):
+        if self._pub_sub is None:
+            self._pub_sub = RedisPubSub(self.CHANNEL.format(self.name))
+        return self._pub_sub
+
+    def _get_key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    # Shared version
+    def get_version_cache_key(self, key):
+        return self.VERSION_CACHE_KEY.format(self.name, key)
+
+    def get_shared_version(self, key):
+        return cache.get(self.get_version_cache_key(key)) or 0
+
+    def incr_shared_version(self, key):
+        version_key = self.get_version_cache_key(key)
+        cache.add(version_key, 0, None)
+        try:
+            return cache.incr(version_key)
+        except ValueError:
+            cache.set(version_key, 1, None)
+            return 1
+
+    # Read
+    def _is_fresh(self, key, item):
+        return item is not None and item[0] >= self._latest_versions.get(key, 0)
+
+    def load(self, key):
+        """
+        :return: (value, version), read the version first, a change during
+            loading makes the value stale instead of lost
+        """
+        version = self.get_shared_version(key)
+        return self.loader(key), version
+
+    def get(self, key):
+        item = self._values.get(key)
+        if self._is_fresh(key, item):
+            return item[1]
+
+        with self._get_key_lock(key):
+            item = self._values.get(key)
+            if self._is_fresh(key, item):
+                return item[1]
+            value, version = self.load(key)
+            with self._lock:
+                self._values[key] = (version, value)
+            return value
+
+    def get_local_version(self, key):
+        item = self._values.get(key)
+        return item[0] if item else None
+
+    def evict(self, key):
+        """ Drop the value of this process only """
+        with self._lock:
+            self._values.pop(key, None)
+            self._local_changes.pop(key, None)
+
+    # Write
+    def expire(self, key):
+        self._add_pending(key, None)
+
+    def publish_delta(self, key, delta):
+        self._add_pending(key, delta)
+
+    def _add_pending(self, key, delta):
+        with self._pending_lock:
+            was_pending = key in self._pending
+            self._merge_pending(key, None if delta is None else [delta])
+        self._apply_local(key, delta, was_pending)
+        self._schedule_flush(self.debounce)
+
+    def _merge_pending(self, key, deltas):
+        """ Must be called in the pending lock """
+        if deltas is None or key not in self._pending:
+            self._pending[key] = deltas
+        elif self._pending[key] is not None:
+            self._pending[key].extend(deltas)
+        # else: expire is pending, the deltas are covered
+
+    def _schedule_flush(self, delay):
+        with self._pending_lock:
+            if not self._pending or self._timer is not None:
+                return
+            if delay > 0:
+                self._timer = threading.Timer(delay, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+                return
+        self.flush()
+
+    def _apply_local(self, key, delta, was_pending):
+        """
+        Change the value of this process at once, not wait for the message
+        to loop back. The value is tracked in `_local_changes` until flushed,
+        a value not carrying the former pending deltas is left to the message.
+        """
+        if delta is None:
+            self.evict(key)
+            return
+
+        with self._get_key_lock(key):
+            item = self._values.get(key)
+            if item is None:
+                return
+            if was_pending and self._local_changes.get(key) is not item[1]:
+                return
+            try:
+                value = self.apply_deltas(item[1], [delta])
+            except Exception as e:
+                logger.error('{} apply delta of key {} error: {}'.format(self, key, e))
+                value = None
+            with self._lock:
+                if value is None:
+                    self._values.pop(key, None)
+                    self._local_changes.pop(key, None)
+                else:
+                    self._values[key] = (item[0], value)
+                    self._local_changes[key] = value
+
+    def _on_committed(self, key, version, deltas):
+        """ Take the version for the value changed locally, or drop it """
+        with self._get_key_lock(key):
+            with self._pending_lock:
+                still_pending = key in self._pending
+            with self._lock:
+                item = self._values.get(key)
+                changed = self._local_changes.get(key)
+                if deltas is None:
+                    # Loaded during committing may be stale
+                    self._values.pop(key, None)
+                    self._local_changes.pop(key, None)
+                    return
+                if item is None or changed is not item[1]:
+                    return
+                if item[0] + 1 == version:
+                    self._values[key] = (version, item[1])
+                else:
+                    self._values.pop(key, None)
+                if not still_pending:
+                    self._local_changes.pop(key, None)
+
+    def commit(self, key, deltas):
+        """
+        Save the change to the shared cache
+
+        :return: the new version
+        """
+        return self.incr_shared_version(key)
+
+    def flush(self):
+        with self._pending_lock:
+            pending, self._pending = self._pending, {}
+            self._timer = None
+
+        failed = []
+        for key, deltas in pending.items():
+            try:
+                version = self.commit(key, deltas)
+                if version is None:
+                    # Nothing in the shared cache, others only need to expire
+                    version = self.incr_shared_version(key)
+                    deltas = None
+                self._on_committed(key, version, deltas)
+                data = {'key': key, 'version': version, 'deltas': deltas}
+                self.pub_sub.publish(data)
+            except Exception as e:
+                logger.error('{} flush key {} error: {}'.format(self, key, e))
+                self.evict(key)
+                failed.append(key)
+
+        if not failed:
+            return
+        # Shared cache may be changed partly, or others were not told,
+        # retry as expire, then all workers reload it
+        with self._pending_lock:
+            for key in failed:
+                self._merge_pending(key, None)
+        self._schedule_flush(max(self.debounce, self.RETRY_DELAY))
+
+    # Subscribe
+    def apply_deltas(self, value, deltas):
+        """ :return: the new value, or None if can't apply """
+        if self.apply_delta is None:
+            return None
+        for delta in deltas:
+            value = self.apply_delta(value, delta)
+        return value
+
+    def on_message(self, data):
+        key, version, deltas = data['key'], data['version'], data.get('deltas')
+        with self._get_key_lock(key):
+            with self._lock:
+                latest = max(self._latest_versions.get(key, 0), version)
+                self._latest_versions[key] = latest
+                item = self._values.get(key)
+            if item is None or item[0] >= version:
+                return
+
+            value = None
+            if deltas is not None and item[0] + 1 == version:
+                try:
+                    value = self.apply_deltas(item[1], deltas)
+                except Exception as e:
+                    logger.error('{} apply deltas of key {} error: {}'.format(self, key, e))
+
+            with self._lock:
+                changed = self._local_changes.pop(key, None)
+                if value is None:
+                    # Stale, reload when used
+                    self._values.pop(key, None)
+                else:
+                    self._values[key] = (version, value)
+                    if changed is item[1]:
+                        # Still carries the local changes not flushed
+                        self._local_changes[key] = value
+
+    def subscribe(self):
+        """ Start once in a process, usually on django ready """
+        if self._subscription is None:
+            self._subscription = self.pub_sub.subscribe(self.on_message)
+        return self._subscription
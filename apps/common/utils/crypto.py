@@ -141,30 +141,84 @@ class Crypto:
         'gm_sm4_ecb': gm_sm4_ecb_crypto,
         'gm': gm_sm4_ecb_crypto,
     }
-
-    def __init__(self):
-        cryptoes = self.__class__.cryptoes.copy()
-        crypto = cryptoes.pop(settings.SECURITY_DATA_CRYPTO_ALGO, None)
+    # Ciphertext is prefixed with the algorithm, `$aes_gcm$<ciphertext>`,
+    # `$` is not in base64 alphabet. Values without prefix are encrypted by
+    # the old version, which are decrypted by trying all algorithms.
+    prefix_sep = '$'
+    prefix_algos = {
+        'aes_ecb': 'aes_ecb',
+        'aes_gcm': 'aes_gcm',
+        'aes': 'aes_gcm',
+        'gm_sm4_ecb': 'gm_sm4_ecb',
+        'gm': 'gm_sm4_ecb',
+    }
+    decrypt_errors = (TypeError, ValueError, UnicodeDecodeError, IndexError)
+
+    def __init__(self, algo=None, key=None):
+        """
+        :param algo: algorithm to encrypt, default `SECURITY_DATA_CRYPTO_ALGO`
+        :param key: default `SECRET_KEY`
+        """
+        algo = algo or settings.SECURITY_DATA_CRYPTO_ALGO
+        if key is None:
+            algo_cryptoes = self.__class__.cryptoes
+        else:
+            algo_cryptoes = self.get_cryptoes(key)
+        cryptoes = algo_cryptoes.copy()
+        crypto = cryptoes.pop(algo, None)
         if crypto is None:
             raise ImproperlyConfigured(
-                f'Crypto method not supported {settings.SECURITY_DATA_CRYPTO_ALGO}'
+                f'Crypto method not supported {algo}'
             )
+        self.algo = self.prefix_algos[algo]
+        self.algo_cryptoes = algo_cryptoes
         self.cryptoes = [crypto, *cryptoes.values()]
 
+    @staticmethod
+    def get_cryptoes(key):
+        aes_gcm = get_aes_crypto(key, mode='GCM')
+        gm_sm4_ecb = get_gm_sm4_ecb_crypto(key)
+        return {
+            'aes_ecb': get_aes_crypto(key, mode='ECB'),
+            'aes_gcm': aes_gcm,
+            'aes': aes_gcm,
+            'gm_sm4_ecb': gm_sm4_ecb,
+            'gm': gm_sm4_ecb,
+        }
+
     @property
     def encryptor(self):
         return self.cryptoes[0]
 
+    def add_prefix(self, algo, ciphertext):
+        return f'{self.prefix_sep}{algo}{self.prefix_sep}{ciphertext}'
+
+    def split_prefix(self, text):
+        """ :return: (algo, ciphertext), algo is None if no prefix """
+        if not isinstance(text, str) or not text.startswith(self.prefix_sep):
+            return None, text
+        algo, sep, ciphertext = text[1:].partition(self.prefix_sep)
+        if not sep or algo not in self.algo_cryptoes:
+            return None, text
+        return algo, ciphertext
+
     def encrypt(self, text):
-        return self.encryptor.encrypt(text)
+        return self.add_prefix(self.algo, self.encryptor.encrypt(text))
 
     def decrypt(self, text):
+        algo, ciphertext = self.split_prefix(text)
+        if algo is not None:
+            try:
+                return self.algo_cryptoes[algo].decrypt(ciphertext)
+            except self.decrypt_errors:
+                return None
+
         for decryptor in self.cryptoes:
             try:
                 origin_text = decryptor.decrypt(text)
                 if origin_text:
                     return origin_text
-            except (TypeError, ValueError, UnicodeDecodeError, IndexError):
+            except self.decrypt_errors:
                 continue
 
 
@@ -18,8 +18,8 @@ def encrypt_and_compress_zip_file(filename, secret_password, encrypted_filenames
     ) as zf:
         zf.setpassword(secret_password)
         for encrypted_filename in encrypted_filenames:
-            with open(encrypted_filename, 'rb') as f:
-                zf.writestr(os.path.basename(encrypted_filename), f.read())
+            # Compress and encrypt by chunks, the file is not read to memory
+            zf.write(encrypted_filename, os.path.basename(encrypted_filename))
 
 
 def download_file(src, path):
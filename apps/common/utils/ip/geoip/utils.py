@@ -2,22 +2,36 @@
 #
 import os
 import ipaddress
+import threading
 
 import geoip2.database
 from geoip2.errors import GeoIP2Error
+from maxminddb import MODE_MMAP, MODE_MMAP_EXT
 from django.utils.translation import gettext_lazy as _
 from django.conf import settings
 
 __all__ = ['get_ip_city_by_geoip']
 reader = None
+reader_lock = threading.Lock()
 
 
-def get_ip_city_by_geoip(ip):
+def get_reader():
+    """ Open the database once in a process, it's memory mapped, not read in """
     global reader
-    if reader is None:
-        path = os.path.join(os.path.dirname(__file__), 'GeoLite2-City.mmdb')
-        reader = geoip2.database.Reader(path)
+    if reader is not None:
+        return reader
+    with reader_lock:
+        if reader is None:
+            path = os.path.join(os.path.dirname(__file__), 'GeoLite2-City.mmdb')
+            try:
+                reader = geoip2.database.Reader(path, mode=MODE_MMAP_EXT)
+            except ValueError:
+                # The C extension is not installed
+                reader = geoip2.database.Reader(path, mode=MODE_MMAP)
+    return reader
+
 
+def get_ip_city_by_geoip(ip):
     try:
         is_private = ipaddress.ip_address(ip.strip()).is_private
         if is_private:
@@ -26,7 +40,7 @@ def get_ip_city_by_geoip(ip):
         return _("Invalid ip")
 
     try:
-        response = reader.city(ip)
+        response = get_reader().city(ip)
     except GeoIP2Error:
         return _("Unknown")
 
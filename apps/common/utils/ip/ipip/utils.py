@@ -1,22 +1,32 @@
 # -*- coding: utf-8 -*-
 #
 import os
+import threading
 
 import ipdb
 
 __all__ = ['get_ip_city_by_ipip']
 ipip_db = None
+ipip_db_lock = threading.Lock()
 
 
-def get_ip_city_by_ipip(ip):
+def get_ipip_db():
+    """ Load the database once in a process """
     global ipip_db
-    if ipip_db is None:
-        ipip_db_path = os.path.join(os.path.dirname(__file__), 'ipipfree.ipdb')
-        ipip_db = ipdb.City(ipip_db_path)
+    if ipip_db is not None:
+        return ipip_db
+    with ipip_db_lock:
+        if ipip_db is None:
+            ipip_db_path = os.path.join(os.path.dirname(__file__), 'ipipfree.ipdb')
+            ipip_db = ipdb.City(ipip_db_path)
+    return ipip_db
+
+
+def get_ip_city_by_ipip(ip):
     try:
-        info = ipip_db.find_info(ip, 'CN')
+        info = get_ipip_db().find_info(ip, 'CN')
     except ValueError:
         return None
     if not info:
-        raise None
+        return None
     return {'city': info.city_name, 'country': info.country_name}
@@ -1,3 +1,5 @@
+from bisect import bisect_right
+from functools import lru_cache
 from ipaddress import ip_network, ip_address
 from django.conf import settings
 from django.utils.translation import gettext_lazy as _
@@ -42,40 +44,119 @@ def in_ip_segment(ip, ip_segment):
     return min(ip1, ip2) <= ip <= max(ip1, ip2)
 
 
+IPV4_MAX = 2 ** 32 - 1
+
+
+def parse_ip_entry(entry):
+    """
+    Parse a network or segment entry of ip group to integer intervals
+
+    The same rules as `contains_ip` always had: a network contains the ips
+    of its version, a segment compares the integer value of an ip of any
+    version. Addresses and hostnames are not parsed, they match as strings.
+
+    :return: [(version, start, end), ], or None if it's not a network or segment
+    """
+    if is_ip_address(entry):
+        return None
+    try:
+        network = ip_network(entry)
+        return [(network.version, int(network.network_address), int(network.broadcast_address))]
+    except ValueError:
+        pass
+    if entry.count('-') != 1:
+        return None
+    try:
+        start, end = sorted(int(ip_address(i)) for i in entry.split('-'))
+    except ValueError:
+        return None
+    intervals = [(6, start, end)]
+    if start <= IPV4_MAX:
+        intervals.append((4, start, min(end, IPV4_MAX)))
+    return intervals
+
+
+class IPGroup:
+    """
+    Compiled ip group, parsed once
+
+    Networks and segments are merged into sorted disjoint intervals of each
+    ip version, a lookup is one bisect. Every entry also matches the same
+    string, that is how addresses and hostnames match. Use `IPGroup.compile`
+    to get the memoized group of the same content.
+    """
+
+    def __init__(self, ip_group):
+        self.match_all = False
+        self.entries = set()
+        intervals = {4: [], 6: []}
+        for entry in ip_group or ():
+            if not isinstance(entry, str):
+                continue
+            if entry == '*':
+                self.match_all = True
+                continue
+            self.entries.add(entry)
+            for version, start, end in parse_ip_entry(entry) or ():
+                intervals[version].append((start, end))
+
+        # { version: ([start, ], [end, ]) }
+        self.intervals = {
+            version: self._merge(items) for version, items in intervals.items()
+        }
+
+    @staticmethod
+    def _merge(intervals):
+        starts, ends = [], []
+        for start, end in sorted(intervals):
+            if ends and start <= ends[-1] + 1:
+                ends[-1] = max(ends[-1], end)
+                continue
+            starts.append(start)
+            ends.append(end)
+        return starts, ends
+
+    @classmethod
+    def compile(cls, ip_group):
+        if isinstance(ip_group, cls):
+            return ip_group
+        return _compile_ip_group(tuple(ip_group or ()))
+
+    def contains(self, ip):
+        if self.match_all or ip in self.entries:
+            return True
+        try:
+            address = ip_address(ip)
+        except ValueError:
+            return False
+        starts, ends = self.intervals[address.version]
+        value = int(address)
+        i = bisect_right(starts, value) - 1
+        return i >= 0 and value <= ends[i]
+
+    def __contains__(self, ip):
+        return self.contains(ip)
+
+
+@lru_cache(maxsize=4096)
+def _compile_ip_group(ip_group):
+    return IPGroup(ip_group)
+
+
 def contains_ip(ip, ip_group):
     """
     ip_group:
     [192.168.10.1, 192.168.1.0/24, 10.1.1.1-10.1.1.20, 2001:db8:2de::e13, 2001:db8:1a:1110::/64.]
 
     """
+    return IPGroup.compile(ip_group).contains(ip)
 
-    if '*' in ip_group:
-        return True
 
-    for _ip in ip_group:
-        if is_ip_address(_ip):
-            # 192.168.10.1
-            if ip == _ip:
-                return True
-        elif is_ip_network(_ip) and is_ip_address(ip):
-            # 192.168.1.0/24
-            if ip_address(ip) in ip_network(_ip):
-                return True
-        elif is_ip_segment(_ip) and is_ip_address(ip):
-            # 10.1.1.1-10.1.1.20
-            if in_ip_segment(ip, _ip):
-                return True
-        else:
-            # is domain name
-            if ip == _ip:
-                return True
-
-    return False
+IP_CITY_CACHE_SIZE = 10240
 
 
-def get_ip_city(ip):
-    if not ip or not isinstance(ip, str):
-        return _("Invalid ip")
+@lru_cache(maxsize=IP_CITY_CACHE_SIZE)
+def _get_ip_city(ip):
     if ':' in ip:
         return 'IPv6'
 
@@ -88,3 +169,19 @@ def get_ip_city(ip):
         if country == 'Китай' and is_zh:
             return city
     return get_ip_city_by_geoip(ip)
+
+
+def get_ip_city(ip):
+    """ Results are cached by ip in a bounded lru of the process """
+    if not ip or not isinstance(ip, str):
+        return _("Invalid ip")
+    return _get_ip_city(ip)
+
+
+def get_ip_cities(ips):
+    """
+    Cities of a batch of ips, every distinct ip is looked up once
+
+    :return: { ip: city }
+    """
+    return {ip: get_ip_city(ip) for ip in set(ips)}
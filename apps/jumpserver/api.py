@@ -3,16 +3,14 @@ import time
 from django.core.cache import cache
 from django.utils import timezone
 from django.utils.timesince import timesince
-from django.db.models import Count, Max
 from django.http.response import JsonResponse, HttpResponse
 from rest_framework.views import APIView
 from rest_framework.permissions import AllowAny
-from collections import Counter
 from rest_framework.response import Response
 
 from users.models import User
 from assets.models import Asset
-from terminal.models import Session
+from terminal.models import Session, SessionRollup
 from terminal.utils import ComponentsPrometheusMetricsUtil
 from orgs.utils import current_org
 from common.utils import lazyproperty
@@ -38,99 +36,40 @@ class DatesLoginMetricMixin:
 
     @lazyproperty
     def session_dates_list(self):
-        now = timezone.now()
+        now = timezone.localtime()
         dates = [(now - timezone.timedelta(days=i)).date() for i in range(self.days)]
         dates.reverse()
-        # dates = self.sessions_queryset.dates('date_start', 'day')
         return dates
 
+    @lazyproperty
+    def date_from(self):
+        """ Local midnight of the first day, rollup rows of days start from it """
+        date_start = timezone.datetime.combine(self.session_dates_list[0], timezone.datetime.min.time())
+        return timezone.make_aware(date_start)
+
+    @lazyproperty
+    def dates_metrics(self):
+        return SessionRollup.get_daily_metrics(self.date_from)
+
     def get_dates_metrics_date(self):
         dates_metrics_date = [d.strftime('%m-%d') for d in self.session_dates_list] or ['0']
         return dates_metrics_date
 
-    @staticmethod
-    def get_cache_key(date, tp):
-        date_str = date.strftime("%Y%m%d")
-        key = "SESSION_DATE_{}_{}_{}".format(current_org.id, tp, date_str)
-        return key
-
-    def __get_data_from_cache(self, date, tp):
-        if date == timezone.now().date():
-            return None
-        cache_key = self.get_cache_key(date, tp)
-        count = cache.get(cache_key)
-        return count
-
-    def __set_data_to_cache(self, date, tp, count):
-        cache_key = self.get_cache_key(date, tp)
-        cache.set(cache_key, count, 3600*24*7)
-
-    @staticmethod
-    def get_date_start_2_end(d):
-        time_min = timezone.datetime.min.time()
-        time_max = timezone.datetime.max.time()
-        tz = timezone.get_current_timezone()
-        ds = timezone.datetime.combine(d, time_min).replace(tzinfo=tz)
-        de = timezone.datetime.combine(d, time_max).replace(tzinfo=tz)
-        return ds, de
-
-    def get_date_login_count(self, date):
-        tp = "LOGIN"
-        count = self.__get_data_from_cache(date, tp)
-        if count is not None:
-            return count
-        ds, de = self.get_date_start_2_end(date)
-        count = Session.objects.filter(date_start__range=(ds, de)).count()
-        self.__set_data_to_cache(date, tp, count)
-        return count
+    def get_dates_metrics(self, tp):
+        return [self.dates_metrics.get(d, {}).get(tp, 0) for d in self.session_dates_list]
 
     def get_dates_metrics_total_count_login(self):
-        data = []
-        for d in self.session_dates_list:
-            count = self.get_date_login_count(d)
-            data.append(count)
-        if len(data) == 0:
-            data = [0]
-        return data
-
-    def get_date_user_count(self, date):
-        tp = "USER"
-        count = self.__get_data_from_cache(date, tp)
-        if count is not None:
-            return count
-        ds, de = self.get_date_start_2_end(date)
-        count = len(set(Session.objects.filter(date_start__range=(ds, de)).values_list('user_id', flat=True)))
-        self.__set_data_to_cache(date, tp, count)
-        return count
+        return self.get_dates_metrics('login') or [0]
 
     def get_dates_metrics_total_count_active_users(self):
-        data = []
-        for d in self.session_dates_list:
-            count = self.get_date_user_count(d)
-            data.append(count)
-        return data
-
-    def get_date_asset_count(self, date):
-        tp = "ASSET"
-        count = self.__get_data_from_cache(date, tp)
-        if count is not None:
-            return count
-        ds, de = self.get_date_start_2_end(date)
-        count = len(set(Session.objects.filter(date_start__range=(ds, de)).values_list('asset', flat=True)))
-        self.__set_data_to_cache(date, tp, count)
-        return count
+        return self.get_dates_metrics(SessionRollup.Dimension.user)
 
     def get_dates_metrics_total_count_active_assets(self):
-        data = []
-        for d in self.session_dates_list:
-            count = self.get_date_asset_count(d)
-            data.append(count)
-        return data
+        return self.get_dates_metrics(SessionRollup.Dimension.asset)
 
     @lazyproperty
     def dates_total_count_active_users(self):
-        count = len(set(self.sessions_queryset.values_list('user_id', flat=True)))
-        return count
+        return SessionRollup.get_distinct_count(self.date_from, SessionRollup.Dimension.user)
 
     @lazyproperty
     def dates_total_count_inactive_users(self):
@@ -147,7 +86,7 @@ class DatesLoginMetricMixin:
 
     @lazyproperty
     def dates_total_count_active_assets(self):
-        return len(set(self.sessions_queryset.values_list('asset', flat=True)))
+        return SessionRollup.get_distinct_count(self.date_from, SessionRollup.Dimension.asset)
 
     @lazyproperty
     def dates_total_count_inactive_assets(self):
@@ -163,35 +102,34 @@ class DatesLoginMetricMixin:
         return Asset.objects.filter(is_active=False).count()
 
     def get_dates_login_times_top5_users(self):
-        users = self.sessions_queryset.values_list('user_id', flat=True)
-        users = [
-            {'user': user, 'total': total}
-            for user, total in Counter(users).most_common(5)
-        ]
+        users = SessionRollup.get_top(self.date_from, SessionRollup.Dimension.user, 5)
+        users = [{'user': user['key'], 'total': user['total']} for user in users]
         return users
 
     def get_dates_total_count_login_users(self):
-        return len(set(self.sessions_queryset.values_list('user_id', flat=True)))
+        return self.dates_total_count_active_users
 
     def get_dates_total_count_login_times(self):
-        return self.sessions_queryset.count()
+        return SessionRollup.get_total_count(self.date_from)
 
     def get_dates_login_times_top10_assets(self):
-        assets = self.sessions_queryset.values("asset") \
-                     .annotate(total=Count("asset")) \
-                     .annotate(last=Max("date_start")).order_by("-total")[:10]
-        for asset in assets:
-            asset['last'] = str(asset['last'])
-        return list(assets)
+        assets = SessionRollup.get_top(self.date_from, SessionRollup.Dimension.asset, 10)
+        assets = [
+            {'asset': asset['key'], 'total': asset['total'], 'last': str(asset['last'])}
+            for asset in assets
+        ]
+        return assets
 
     def get_dates_login_times_top10_users(self):
-        users = self.sessions_queryset.values("user_id") \
-                    .annotate(total=Count("user_id")) \
-                    .annotate(user=Max('user')) \
-                    .annotate(last=Max("date_start")).order_by("-total")[:10]
-        for user in users:
-            user['last'] = str(user['last'])
-        return list(users)
+        users = SessionRollup.get_top(self.date_from, SessionRollup.Dimension.user, 10)
+        users = [
+            {
+                'user_id': user['key'], 'user': user['name'],
+                'total': user['total'], 'last': str(user['last'])
+            }
+            for user in users
+        ]
+        return users
 
     def get_dates_login_record_top10_sessions(self):
         sessions = self.sessions_queryset.order_by('-date_start')[:10]
@@ -373,6 +373,10 @@ class Config(dict):
         'PERM_SINGLE_ASSET_TO_UNGROUP_NODE': False,
         'WINDOWS_SSH_DEFAULT_SHELL': 'cmd',
         'PERIOD_TASK_ENABLED': True,
+        # Hosts pushed in parallel by one ansible play
+        'PUSH_SYSTEM_USER_FORKS': 50,
+        # Account backup file format: xlsx, csv
+        'ACCOUNT_BACKUP_FILE_FORMAT': 'xlsx',
 
         # Справка в панели навигации
         'HELP_DOCUMENT_URL': 'http://docs.jumpserver.org',
@@ -90,6 +90,8 @@ FLOWER_URL = CONFIG.FLOWER_URL
 
 # Enable internal period task
 PERIOD_TASK_ENABLED = CONFIG.PERIOD_TASK_ENABLED
+PUSH_SYSTEM_USER_FORKS = CONFIG.PUSH_SYSTEM_USER_FORKS
+ACCOUNT_BACKUP_FILE_FORMAT = CONFIG.ACCOUNT_BACKUP_FILE_FORMAT
 
 # only allow single machine login with the same account
 USER_LOGIN_SINGLE_MACHINE_ENABLED = CONFIG.USER_LOGIN_SINGLE_MACHINE_ENABLED
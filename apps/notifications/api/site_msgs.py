@@ -38,8 +38,8 @@ class SiteMessageViewSet(ListModelMixin, RetrieveModelMixin, JMSGenericViewSet):
     @action(methods=[GET], detail=False, url_path='unread-total')
     def unread_total(self, request, **kwargs):
         user = request.user
-        msgs = SiteMessageUtil.filter_user_msgs(user.id, has_read=False)
-        return Response(data={'total': msgs.count()})
+        total = SiteMessageUtil.get_user_unread_msgs_count(user.id)
+        return Response(data={'total': total})
 
     @action(methods=[PATCH], detail=False, url_path='mark-as-read')
     def mark_as_read(self, request, **kwargs):
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.12 on 2022-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0002_auto_20210909_1946'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='sitemessage',
+            index=models.Index(fields=['is_broadcast', 'date_created'], name='site_msg_broadcast_idx'),
+        ),
+    ]
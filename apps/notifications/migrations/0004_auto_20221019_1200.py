@@ -0,0 +1,35 @@
+# Generated by Django 3.2.12 on 2022-10-19 12:00
+
+from django.db import migrations
+from django.db.models import Count
+
+
+def remove_duplicate_site_msg_users(apps, schema_editor):
+    """ Keep one row of a message and a user, a read one if any """
+    site_msg_users_model = apps.get_model('notifications', 'SiteMessageUsers')
+    duplicates = site_msg_users_model.objects \
+        .values('sitemessage_id', 'user_id') \
+        .annotate(total=Count('id')) \
+        .filter(total__gt=1)
+
+    for item in duplicates:
+        rows = site_msg_users_model.objects.filter(
+            sitemessage_id=item['sitemessage_id'], user_id=item['user_id']
+        ).order_by('-has_read', 'date_created')
+        ids = list(rows.values_list('id', flat=True)[1:])
+        site_msg_users_model.objects.filter(id__in=ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0003_auto_20221018_1200'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_site_msg_users, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='sitemessageusers',
+            unique_together={('sitemessage', 'user')},
+        ),
+    ]
@@ -11,6 +11,9 @@ class SiteMessageUsers(JMSModel):
     has_read = models.BooleanField(default=False)
     read_at = models.DateTimeField(default=None, null=True)
 
+    class Meta:
+        unique_together = [('sitemessage', 'user')]
+
 
 class SiteMessage(JMSModel):
     subject = models.CharField(max_length=1024)
@@ -27,3 +30,8 @@ class SiteMessage(JMSModel):
 
     has_read = False
     read_at = None
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['is_broadcast', 'date_created'], name='site_msg_broadcast_idx'),
+        ]
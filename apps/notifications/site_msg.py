@@ -1,15 +1,92 @@
-from django.db.models import F, Q
+from django.db.models import Q, OuterRef, Subquery, Value, BooleanField
+from django.db.models.functions import Coalesce
 from django.db import transaction
 
 from common.utils.timezone import local_now
 from common.utils import get_logger
+from common.utils.connection import get_redis_client
+from common.decorator import on_transaction_commit
 from users.models import User
 from .models import SiteMessage as SiteMessageModel, SiteMessageUsers
 
 logger = get_logger(__file__)
 
+# Only increase an existing counter, a missing one is counted from db
+INCR_IF_EXISTS_SCRIPT = """
+if redis.call('exists', KEYS[1]) == 1 then
+    return redis.call('hincrby', KEYS[1], 'count', ARGV[1])
+end
+return nil
+"""
+
+
+class SiteMessageUnreadCounter:
+    """
+    Unread site messages of users in redis
+
+    Hash of a user: `count` - unread direct messages minus read broadcasts,
+    `base` - the broadcasts counter when it was counted. A broadcast only
+    increases the broadcasts counter, unread = count + broadcasts - base.
+    """
+    user_key = 'notifications.site_msg.unread.{}'
+    broadcast_key = 'notifications.site_msg.broadcasts'
+    ttl = 3600
+    _incr_script = None
+
+    @classmethod
+    def get_client(cls):
+        return get_redis_client()
+
+    @classmethod
+    def get_incr_script(cls, client):
+        if cls._incr_script is None:
+            cls._incr_script = client.register_script(INCR_IF_EXISTS_SCRIPT)
+        return cls._incr_script
+
+    @classmethod
+    def incr(cls, user_ids, amount=1):
+        if not user_ids or not amount:
+            return
+        client = cls.get_client()
+        script = cls.get_incr_script(client)
+        with client.pipeline(transaction=False) as p:
+            for user_id in user_ids:
+                script(keys=[cls.user_key.format(user_id)], args=[amount], client=p)
+            p.execute()
+
+    @classmethod
+    def decr(cls, user_id, amount=1):
+        cls.incr([user_id], -amount)
+
+    @classmethod
+    def incr_broadcast(cls):
+        cls.get_client().incr(cls.broadcast_key)
+
+    @classmethod
+    def get(cls, user_id, count_from_db):
+        """
+        :param count_from_db: function to count, if the user has no counter
+        """
+        client = cls.get_client()
+        key = cls.user_key.format(user_id)
+        with client.pipeline() as p:
+            p.hmget(key, 'count', 'base')
+            p.get(cls.broadcast_key)
+            (count, base), broadcasts = p.execute()
+        broadcasts = int(broadcasts or 0)
+        if count is not None and base is not None:
+            return max(int(count) + broadcasts - int(base), 0)
+
+        count = count_from_db()
+        with client.pipeline() as p:
+            p.hset(key, mapping={'count': count, 'base': broadcasts})
+            p.expire(key, cls.ttl)
+            p.execute()
+        return count
+
 
 class SiteMessageUtil:
+    chunk_size = 1000
 
     @classmethod
     def send_msg(cls, subject, message, user_ids=(), group_ids=(),
@@ -28,67 +105,136 @@ class SiteMessageUtil:
                 is_broadcast=is_broadcast, sender=sender,
             )
 
+            # A broadcast is one row, the read marker of a user is created
+            # when the user reads it
             if is_broadcast:
-                user_ids = User.objects.all().values_list('id', flat=True)
-            else:
-                if group_ids:
-                    site_msg.groups.add(*group_ids)
+                on_transaction_commit(cls.on_msg_sent)(site_msg, [])
+                return
+
+            if group_ids:
+                site_msg.groups.add(*group_ids)
 
-                    user_ids_from_group = User.groups.through.objects.filter(
-                        usergroup_id__in=group_ids
-                    ).values_list('user_id', flat=True)
-                    user_ids = [*user_ids, *user_ids_from_group]
+                user_ids_from_group = User.groups.through.objects.filter(
+                    usergroup_id__in=group_ids
+                ).values_list('user_id', flat=True)
+                user_ids = [*user_ids, *user_ids_from_group]
 
-            site_msg.users.add(*user_ids)
+            user_ids = list({str(i) for i in user_ids})
+            cls.bulk_add_users(site_msg, user_ids)
+            on_transaction_commit(cls.on_msg_sent)(site_msg, user_ids)
 
     @classmethod
-    def get_user_all_msgs(cls, user_id):
-        site_msgs = SiteMessageModel.objects.filter(
-            m2m_sitemessageusers__user_id=user_id
-        ).distinct().annotate(
-            has_read=F('m2m_sitemessageusers__has_read'),
-            read_at=F('m2m_sitemessageusers__read_at')
-        ).order_by('-date_created')
+    def bulk_add_users(cls, site_msg, user_ids):
+        for i in range(0, len(user_ids), cls.chunk_size):
+            site_msg_users = [
+                SiteMessageUsers(sitemessage=site_msg, user_id=user_id)
+                for user_id in user_ids[i:i + cls.chunk_size]
+            ]
+            SiteMessageUsers.objects.bulk_create(site_msg_users)
+
+    @staticmethod
+    def on_msg_sent(site_msg, user_ids):
+        """ Counters first, subscribers read them when the message comes """
+        from .signal_handlers import new_site_msg_chan
+
+        if site_msg.is_broadcast:
+            SiteMessageUnreadCounter.incr_broadcast()
+        else:
+            SiteMessageUnreadCounter.incr(user_ids)
+
+        logger.debug('New site msg created, publish it')
+        new_site_msg_chan.publish({
+            'id': str(site_msg.id),
+            'subject': site_msg.subject,
+            'message': site_msg.message,
+            'users': user_ids,
+            'is_broadcast': site_msg.is_broadcast,
+        })
+
+    @classmethod
+    def get_user_unread_broadcasts(cls, user_id):
+        """ Broadcasts created after the user joined, not read yet """
+        date_joined = User.objects.filter(id=user_id).values_list('date_joined', flat=True).first()
+        if not date_joined:
+            return SiteMessageModel.objects.none()
+        read_msg_ids = SiteMessageUsers.objects.filter(user_id=user_id).values('sitemessage_id')
+        return SiteMessageModel.objects \
+            .filter(is_broadcast=True, date_created__gte=date_joined) \
+            .exclude(id__in=read_msg_ids)
 
+    @classmethod
+    def get_user_msgs_queryset(cls, user_id, has_read=None):
+        """
+        Direct messages of the user and broadcasts after the user joined
+
+        Rows of the user in SiteMessageUsers (direct messages and read
+        broadcasts) OR the broadcasts not read yet, both as subqueries
+        """
+        user_msgs = SiteMessageUsers.objects.filter(user_id=user_id)
+        if has_read is not None:
+            user_msgs = user_msgs.filter(has_read=has_read)
+        q = Q(id__in=user_msgs.values('sitemessage_id'))
+        if not has_read:
+            q |= Q(id__in=cls.get_user_unread_broadcasts(user_id).values('id'))
+
+        user_msg = SiteMessageUsers.objects.filter(sitemessage=OuterRef('pk'), user_id=user_id)
+        site_msgs = SiteMessageModel.objects.filter(q).annotate(
+            has_read=Coalesce(
+                Subquery(user_msg.values('has_read')[:1], output_field=BooleanField()),
+                Value(False)
+            ),
+            read_at=Subquery(user_msg.values('read_at')[:1]),
+        )
+        return site_msgs
+
+    @classmethod
+    def get_user_all_msgs(cls, user_id):
+        site_msgs = cls.get_user_msgs_queryset(user_id).order_by('-date_created')
         return site_msgs
 
     @classmethod
     def get_user_all_msgs_count(cls, user_id):
-        site_msgs_count = SiteMessageModel.objects.filter(
-            m2m_sitemessageusers__user_id=user_id
-        ).distinct().count()
-        return site_msgs_count
+        count = SiteMessageUsers.objects.filter(user_id=user_id).count()
+        return count + cls.get_user_unread_broadcasts(user_id).count()
 
     @classmethod
     def filter_user_msgs(cls, user_id, has_read=False):
-        site_msgs = SiteMessageModel.objects.filter(
-            m2m_sitemessageusers__user_id=user_id,
-            m2m_sitemessageusers__has_read=has_read
-        ).distinct().annotate(
-            has_read=F('m2m_sitemessageusers__has_read'),
-            read_at=F('m2m_sitemessageusers__read_at')
-        ).order_by('-date_created')
-
+        site_msgs = cls.get_user_msgs_queryset(user_id, has_read=has_read).order_by('-date_created')
         return site_msgs
 
+    @classmethod
+    def get_user_unread_msgs_count_from_db(cls, user_id):
+        # Read markers of broadcasts are always read
+        count = SiteMessageUsers.objects.filter(user_id=user_id, has_read=False).count()
+        return count + cls.get_user_unread_broadcasts(user_id).count()
+
     @classmethod
     def get_user_unread_msgs_count(cls, user_id):
-        site_msgs_count = SiteMessageModel.objects.filter(
-            m2m_sitemessageusers__user_id=user_id,
-            m2m_sitemessageusers__has_read=False
-        ).distinct().count()
-        return site_msgs_count
+        return SiteMessageUnreadCounter.get(
+            user_id, lambda: cls.get_user_unread_msgs_count_from_db(user_id)
+        )
 
     @classmethod
     def mark_msgs_as_read(cls, user_id, msg_ids=None):
+        read_at = local_now()
         q = Q(user_id=user_id) & Q(has_read=False)
         if msg_ids is not None:
             q &= Q(sitemessage_id__in=msg_ids)
-        site_msg_users = SiteMessageUsers.objects.filter(q)
-
-        for site_msg_user in site_msg_users:
-            site_msg_user.has_read = True
-            site_msg_user.read_at = local_now()
+        count = SiteMessageUsers.objects.filter(q).update(has_read=True, read_at=read_at)
 
-        SiteMessageUsers.objects.bulk_update(
-            site_msg_users, fields=('has_read', 'read_at'))
+        broadcasts = cls.get_user_unread_broadcasts(user_id)
+        if msg_ids is not None:
+            broadcasts = broadcasts.filter(id__in=msg_ids)
+        broadcast_ids = list(broadcasts.values_list('id', flat=True))
+        for i in range(0, len(broadcast_ids), cls.chunk_size):
+            site_msg_users = [
+                SiteMessageUsers(sitemessage_id=msg_id, user_id=user_id, has_read=True, read_at=read_at)
+                for msg_id in broadcast_ids[i:i + cls.chunk_size]
+            ]
+            # Markers created by a concurrent request are ignored, count
+            # only the created ones, or the counter is decreased twice
+            SiteMessageUsers.objects.bulk_create(site_msg_users, ignore_conflicts=True)
+            created_ids = [m.id for m in site_msg_users]
+            count += SiteMessageUsers.objects.filter(id__in=created_ids).count()
+
+        on_transaction_commit(SiteMessageUnreadCounter.decr)(user_id, count)
@@ -52,7 +52,7 @@ class SiteMsgWebsocket(JsonWebsocketConsumer):
         def handle_new_site_msg_recv(msg):
             users = msg.get('users', [])
             logger.debug('New site msg recv, message users: {}'.format(users))
-            if user_id in users:
+            if msg.get('is_broadcast') or user_id in users:
                 ws.send_unread_msg_count()
 
         return new_site_msg_chan.subscribe(handle_new_site_msg_recv)
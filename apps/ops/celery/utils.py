@@ -5,6 +5,7 @@ import json
 import redis_lock
 import redis
 from django.conf import settings
+from django.core.cache import cache
 from django.utils.timezone import get_current_timezone
 from django.db.utils import ProgrammingError, OperationalError
 from django_celery_beat.models import (
@@ -110,6 +111,36 @@ def get_celery_task_log_path(task_id):
     return get_task_log_path(settings.CELERY_LOG_DIR, task_id)
 
 
+TASK_LOG_END_CACHE_KEY = 'OPS_TASK_LOG_END_{}'
+TASK_LOG_END_CACHE_TTL = 3600 * 24
+
+
+def get_task_log_group_name(task_id):
+    return 'task_log_{}'.format(task_id)
+
+
+def mark_task_log_end(task_id):
+    """
+    Task log won't be written any more, tell the log viewers
+    """
+    from asgiref.sync import async_to_sync
+    from channels.layers import get_channel_layer
+
+    task_id = str(task_id)
+    cache.set(TASK_LOG_END_CACHE_KEY.format(task_id), 1, TASK_LOG_END_CACHE_TTL)
+    try:
+        channel_layer = get_channel_layer()
+        async_to_sync(channel_layer.group_send)(
+            get_task_log_group_name(task_id), {'type': 'task.end', 'task': task_id}
+        )
+    except Exception as e:
+        logger.error('Send task log end event error: {}'.format(e))
+
+
+def is_task_log_end_marked(task_id):
+    return bool(cache.get(TASK_LOG_END_CACHE_KEY.format(task_id)))
+
+
 def get_celery_status():
     from . import app
     i = app.control.inspect()
@@ -321,6 +321,8 @@ class AdHocExecution(OrgModelMixin):
             timedelta=time.time() - time_start,
             summary=summary
         )
+        from ..celery.utils import mark_task_log_end
+        mark_task_log_end(self.id)
 
     @property
     def success_hosts(self):
@@ -91,13 +91,13 @@ class CommandExecution(OrgModelMixin):
         return rules
 
     def is_command_can_run(self, command, asset_id=None):
-        for rule in self.cmd_filter_rules(asset_id=asset_id):
-            action, matched_cmd = rule.match(command)
-            if action == rule.ActionChoices.allow:
-                return True, None
-            elif action == rule.ActionChoices.deny:
-                return False, matched_cmd
-        return True, None
+        from assets.models import CommandFilterRule
+        return CommandFilterRule.check_command(
+            command,
+            user_id=self.user.id,
+            system_user_id=self.run_as.id,
+            asset_id=asset_id,
+        )
 
     @property
     def allow_assets(self):
@@ -3,6 +3,7 @@ from django.core.cache import cache
 from celery.signals import task_prerun, task_postrun, before_task_publish
 
 from common.db.utils import close_old_connections
+from .celery.utils import mark_task_log_end
 
 
 TASK_LANG_CACHE_KEY = 'TASK_LANG_{}'
@@ -28,5 +29,7 @@ def on_celery_task_pre_run(task_id='', **kwargs):
 
 
 @task_postrun.connect()
-def on_celery_task_post_run(**kwargs):
+def on_celery_task_post_run(task_id='', **kwargs):
     close_old_connections()
+    if task_id:
+        mark_task_log_end(task_id)
@@ -1,89 +1,177 @@
-import time
 import os
-import threading
 import json
-from channels.generic.websocket import JsonWebsocketConsumer
+import uuid
+import asyncio
+
+from celery.result import AsyncResult
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
 
 from common.utils import get_logger
-from common.db.utils import close_old_connections
-from .celery.utils import get_celery_task_log_path
+from .celery.utils import (
+    get_celery_task_log_path, get_task_log_group_name, is_task_log_end_marked
+)
 from .ansible.utils import get_ansible_task_log_path
 
 logger = get_logger(__name__)
 
 
-class TaskLogWebsocket(JsonWebsocketConsumer):
-    disconnected = False
+def is_celery_task_end(task_id):
+    return is_task_log_end_marked(task_id) or AsyncResult(task_id).ready()
+
+
+def is_ansible_task_end(task_id):
+    from .models import AdHocExecution
+
+    if is_task_log_end_marked(task_id):
+        return True
+    return AdHocExecution.objects.filter(id=task_id, is_finished=True).exists()
+
+
+class TaskLogWebsocket(AsyncJsonWebsocketConsumer):
+    """
+    Tail the task log file in the event loop, one coroutine for a viewer
 
+    The stream ends when the task end event is received from channel layer,
+    which is sent by the celery worker, or the end is found by checking the
+    task state when the log keeps idle.
+    """
     log_types = {
-        'celery': get_celery_task_log_path,
-        'ansible': get_ansible_task_log_path
+        'celery': (get_celery_task_log_path, is_celery_task_end),
+        'ansible': (get_ansible_task_log_path, is_ansible_task_end),
     }
+    read_size = 4096
+    # Read at most this size then give way to other viewers
+    read_size_per_loop = 4096 * 16
+    min_interval = 0.1
+    max_interval = 1
+    check_end_interval = 3
 
-    def connect(self):
+    task_id = None
+    group_name = None
+    tail_task = None
+    task_end_event = None
+
+    async def connect(self):
         user = self.scope["user"]
         if user.is_authenticated:
-            self.accept()
+            await self.accept()
         else:
-            self.close()
-
-    def get_log_path(self, task_id):
-        func = self.log_types.get(self.log_type)
-        if func:
-            return func(task_id)
+            await self.close()
 
-    def receive(self, text_data=None, bytes_data=None, **kwargs):
+    async def receive(self, text_data=None, bytes_data=None, **kwargs):
         data = json.loads(text_data)
         task_id = data.get('task')
-        self.log_type = data.get('type', 'celery')
-        if task_id:
-            self.handle_task(task_id)
-
-    def wait_util_log_path_exist(self, task_id):
-        log_path = self.get_log_path(task_id)
-        while not self.disconnected:
-            if not os.path.exists(log_path):
-                self.send_json({'message': '.', 'task': task_id})
-                time.sleep(0.5)
-                continue
-            self.send_json({'message': '\r\n'})
-            try:
-                logger.debug('Task log path: {}'.format(log_path))
-                task_log_f = open(log_path, 'rb')
-                return task_log_f
-            except OSError:
+        log_type = data.get('type', 'celery')
+        if not task_id or log_type not in self.log_types:
+            return
+        try:
+            task_id = str(uuid.UUID(str(task_id)))
+        except ValueError:
+            return
+        await self.handle_task(task_id, log_type)
+
+    async def handle_task(self, task_id, log_type):
+        logger.info("Task id: {}".format(task_id))
+        await self.stop_tail()
+        self.task_id = str(task_id)
+        self.task_end_event = asyncio.Event()
+        self.group_name = get_task_log_group_name(self.task_id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        self.tail_task = asyncio.ensure_future(self.tail_log(self.task_id, log_type))
+
+    async def task_end(self, event):
+        """ Handle `task.end` event from channel layer """
+        if event.get('task') == self.task_id and self.task_end_event:
+            self.task_end_event.set()
+
+    async def wait_task_end(self, timeout):
+        try:
+            await asyncio.wait_for(self.task_end_event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.task_end_event.is_set()
+
+    async def check_task_end(self, is_end_func, task_id):
+        try:
+            ended = await database_sync_to_async(is_end_func)(task_id)
+        except Exception as e:
+            logger.error('Check task end error: {}'.format(e))
+            return False
+        if ended:
+            self.task_end_event.set()
+        return ended
+
+    async def wait_util_log_path_exist(self, task_id, log_path, is_end_func):
+        loop = asyncio.get_running_loop()
+        last_check_time = loop.time()
+        while not os.path.exists(log_path):
+            await self.send_json({'message': '.', 'task': task_id})
+            if await self.wait_task_end(0.5) and not os.path.exists(log_path):
                 return None
+            if loop.time() - last_check_time > self.check_end_interval:
+                last_check_time = loop.time()
+                await self.check_task_end(is_end_func, task_id)
+
+        await self.send_json({'message': '\r\n'})
+        try:
+            logger.debug('Task log path: {}'.format(log_path))
+            return open(log_path, 'rb')
+        except OSError:
+            return None
 
-    def read_log_file(self, task_id):
-        task_log_f = self.wait_util_log_path_exist(task_id)
+    async def send_log_data(self, task_log_f, task_id):
+        """ :return: size of data sent """
+        size = 0
+        while size < self.read_size_per_loop:
+            data = task_log_f.read(self.read_size)
+            if not data:
+                break
+            size += len(data)
+            data = data.replace(b'\n', b'\r\n')
+            await self.send_json(
+                {'message': data.decode(errors='ignore'), 'task': task_id}
+            )
+        return size
+
+    async def tail_log(self, task_id, log_type):
+        get_log_path, is_end_func = self.log_types[log_type]
+        log_path = get_log_path(task_id)
+        task_log_f = await self.wait_util_log_path_exist(task_id, log_path, is_end_func)
         if not task_log_f:
             logger.debug('Task log file is None: {}'.format(task_id))
             return
 
-        task_end_mark = []
-        while not self.disconnected:
-            data = task_log_f.read(4096)
-            if data:
-                data = data.replace(b'\n', b'\r\n')
-                self.send_json(
-                    {'message': data.decode(errors='ignore'), 'task': task_id}
-                )
-                if data.find(b'succeeded in') != -1:
-                    task_end_mark.append(1)
-                if data.find(bytes(task_id, 'utf8')) != -1:
-                    task_end_mark.append(1)
-            elif len(task_end_mark) == 2:
-                logger.debug('Task log end: {}'.format(task_id))
-                break
-            time.sleep(0.2)
-        task_log_f.close()
+        loop = asyncio.get_running_loop()
+        interval = self.min_interval
+        last_check_time = loop.time()
+        try:
+            while True:
+                if await self.send_log_data(task_log_f, task_id):
+                    interval = self.min_interval
+                    await asyncio.sleep(0)
+                    continue
 
-    def handle_task(self, task_id):
-        logger.info("Task id: {}".format(task_id))
-        thread = threading.Thread(target=self.read_log_file, args=(task_id,))
-        thread.start()
+                # Read to the end after the task end
+                if self.task_end_event.is_set():
+                    logger.debug('Task log end: {}'.format(task_id))
+                    break
+                await self.wait_task_end(interval)
+                interval = min(interval * 2, self.max_interval)
+
+                if loop.time() - last_check_time > self.check_end_interval:
+                    last_check_time = loop.time()
+                    await self.check_task_end(is_end_func, task_id)
+        finally:
+            task_log_f.close()
+
+    async def stop_tail(self):
+        if self.tail_task and not self.tail_task.done():
+            self.tail_task.cancel()
+        self.tail_task = None
+        if self.group_name:
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+            self.group_name = None
 
-    def disconnect(self, close_code):
-        self.disconnected = True
-        self.close()
-        close_old_connections()
+    async def disconnect(self, close_code):
+        await self.stop_tail()
@@ -3,7 +3,7 @@
 from rest_framework.viewsets import ModelViewSet, GenericViewSet
 from rest_framework_bulk import BulkModelViewSet
 
-from common.mixins import CommonApiMixin, RelationMixin
+from common.mixins import CommonApiMixin, RelationMixin, ChunkedImportMixin
 from orgs.utils import current_org
 
 from ..utils import set_to_root_org
@@ -52,7 +52,7 @@ class OrgGenericViewSet(CommonApiMixin, OrgViewSetMixin, GenericViewSet):
     pass
 
 
-class OrgBulkModelViewSet(CommonApiMixin, OrgViewSetMixin, BulkModelViewSet):
+class OrgBulkModelViewSet(CommonApiMixin, ChunkedImportMixin, OrgViewSetMixin, BulkModelViewSet):
     def allow_bulk_destroy(self, qs, filtered):
         qs_count = qs.count()
         filtered_count = filtered.count()
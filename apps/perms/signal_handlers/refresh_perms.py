@@ -60,7 +60,14 @@ def on_asset_perm_pre_save(sender, instance, **kwargs):
     try:
         old = AssetPermission.objects.get(id=instance.id)
 
-        if old.is_valid != instance.is_valid:
+        # Actions and validity period are also materialized in user asset perm index
+        changed = (
+            old.is_valid != instance.is_valid,
+            old.actions != instance.actions,
+            old.date_start != instance.date_start,
+            old.date_expired != instance.date_expired,
+        )
+        if any(changed):
             with tmp_to_org(instance.org):
                 UserGrantedTreeRefreshController.add_need_refresh_by_asset_perm_ids([instance.id])
     except AssetPermission.DoesNotExist:
@@ -102,6 +109,17 @@ def on_permission_assets_changed(sender, instance, action, reverse, pk_set, mode
         UserGrantedTreeRefreshController.add_need_refresh_by_asset_perm_ids([instance.id])
 
 
+@receiver(m2m_changed, sender=AssetPermission.system_users.through)
+def on_asset_permission_system_users_changed(sender, instance, action, reverse, **kwargs):
+    if reverse:
+        raise M2MReverseNotAllowed
+
+    if not need_rebuild_mapping_node(action):
+        return
+    with tmp_to_org(instance.org):
+        UserGrantedTreeRefreshController.add_need_refresh_by_asset_perm_ids([instance.id])
+
+
 @receiver(m2m_changed, sender=AssetPermission.users.through)
 def on_asset_permission_users_changed(sender, action, reverse, instance, pk_set, **kwargs):
     if reverse:
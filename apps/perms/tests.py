@@ -1,3 +1,56 @@
-from django.test import TestCase
+import uuid
+
+from django.test import TestCase, SimpleTestCase
 
 from django.contrib.sessions.backends import file, db, cache
+
+from perms.utils.asset.user_permission import UserAssetPermIndex
+
+
+class FakeRedisHash:
+    def __init__(self, data):
+        self.data = data
+
+    def hmget(self, key, *fields):
+        return [self.data.get(f) for f in fields]
+
+
+class UserAssetPermIndexTestCase(SimpleTestCase):
+    def setUp(self):
+        self.asset1, self.asset2 = uuid.uuid4(), uuid.uuid4()
+        self.su1, self.su2 = uuid.uuid4(), uuid.uuid4()
+        # MySQL returns char uuids in the hex form
+        self.index = UserAssetPermIndex.merge_index(
+            perm_attrs={'p1': (1, 100.0), 'p2': (2, 200.0)},
+            perm_system_user_ids={'p1': {self.su1.hex}, 'p2': {self.su1.hex, self.su2.hex}},
+            perm_asset_ids={'p1': {self.asset1.hex}, 'p2': {self.asset1.hex, self.asset2.hex}},
+        )
+
+    def get_perm_index(self):
+        data = {
+            UserAssetPermIndex.BUILT_FIELD: b'1',
+            UserAssetPermIndex.EXPIRE_AT_FIELD: b'0',
+        }
+        for asset_id, system_users in self.index.items():
+            data[asset_id] = UserAssetPermIndex._dumps(system_users).encode()
+        perm_index = UserAssetPermIndex.__new__(UserAssetPermIndex)
+        perm_index.key = 'test'
+        perm_index.client = FakeRedisHash(data)
+        return perm_index
+
+    def test_merge_index_with_hex_ids(self):
+        self.assertEqual(dict(self.index), {
+            str(self.asset1): {str(self.su1): (3, 200.0), str(self.su2): (2, 200.0)},
+            str(self.asset2): {str(self.su1): (2, 200.0), str(self.su2): (2, 200.0)},
+        })
+
+    def test_lookup_by_any_form(self):
+        perm_index = self.get_perm_index()
+        for asset_id in (self.asset1, str(self.asset1), self.asset1.hex):
+            for system_user_id in (self.su2, str(self.su2), self.su2.hex):
+                self.assertEqual(
+                    perm_index.get_asset_system_user_actions(asset_id, system_user_id),
+                    (2, 200.0)
+                )
+        self.assertEqual(perm_index.get_asset_system_user_actions(uuid.uuid4(), self.su1), (0, 0))
+        self.assertEqual(perm_index.get_asset_system_user_actions(self.asset2, uuid.uuid4()), (0, 0))
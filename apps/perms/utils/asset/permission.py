@@ -6,7 +6,7 @@ from django.db.models import Q
 from common.utils import get_logger
 from perms.models import AssetPermission, Action
 from perms.hands import Asset, User, UserGroup, SystemUser, Node
-from perms.utils.asset.user_permission import get_user_all_asset_perm_ids
+from perms.utils.asset.user_permission import get_user_all_asset_perm_ids, UserAssetPermIndex
 
 logger = get_logger(__file__)
 
@@ -16,49 +16,11 @@ def validate_permission(user, asset, system_user, action='connect'):
     if not system_user.protocol in asset.protocols_as_dict.keys():
         return False, time.time()
 
-    asset_perm_ids = get_user_all_asset_perm_ids(user)
-
-    asset_perm_ids_from_asset = AssetPermission.assets.through.objects.filter(
-        assetpermission_id__in=asset_perm_ids,
-        asset_id=asset.id
-    ).values_list('assetpermission_id', flat=True)
-
-    nodes = asset.get_nodes()
-    node_keys = set()
-    for node in nodes:
-        ancestor_keys = node.get_ancestor_keys(with_self=True)
-        node_keys.update(ancestor_keys)
-    node_ids = Node.objects.filter(key__in=node_keys).values_list('id', flat=True)
-
-    node_ids = set(node_ids)
-
-    asset_perm_ids_from_node = AssetPermission.nodes.through.objects.filter(
-        assetpermission_id__in=asset_perm_ids,
-        node_id__in=node_ids
-    ).values_list('assetpermission_id', flat=True)
-
-    asset_perm_ids = {*asset_perm_ids_from_asset, *asset_perm_ids_from_node}
-
-    asset_perm_ids = AssetPermission.system_users.through.objects.filter(
-        assetpermission_id__in=asset_perm_ids,
-        systemuser_id=system_user.id
-    ).values_list('assetpermission_id', flat=True)
-
-    asset_perm_ids = set(asset_perm_ids)
-
-    asset_perms = AssetPermission.objects.filter(
-        id__in=asset_perm_ids
-    ).order_by('-date_expired')
+    actions_value, expire_at = UserAssetPermIndex(user, asset.org_id) \
+        .get_asset_system_user_actions(asset.id, system_user.id)
 
-    if asset_perms:
-        actions = set()
-        actions_values = asset_perms.values_list('actions', flat=True)
-        for value in actions_values:
-            _actions = Action.value_to_choices(value)
-            actions.update(_actions)
-        asset_perm: AssetPermission = asset_perms.first()
-        actions = list(actions)
-        expire_at = asset_perm.date_expired.timestamp()
+    if actions_value:
+        actions = Action.value_to_choices(actions_value)
     else:
         actions = []
         expire_at = time.time()
@@ -96,8 +58,12 @@ def get_asset_system_user_ids_with_actions_by_user(user: User, asset: Asset):
 
 
 def has_asset_system_permission(user: User, asset: Asset, system_user: SystemUser):
-    systemuser_actions_mapper = get_asset_system_user_ids_with_actions_by_user(user, asset)
-    actions = systemuser_actions_mapper.get(system_user.id, 0)
+    # The index doesn't know protocols, `get_asset_system_user_ids_with_actions`
+    # only returned system users of the asset protocols
+    if system_user.protocol not in asset.protocols_as_dict.keys():
+        return False
+    actions, __ = UserAssetPermIndex(user, asset.org_id) \
+        .get_asset_system_user_actions(asset.id, system_user.id)
     if actions:
         return True
     return False
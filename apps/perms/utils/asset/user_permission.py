@@ -1,11 +1,14 @@
 from collections import defaultdict
 from typing import List, Tuple
 import time
+import uuid
 
 from django.core.cache import cache
 from django.conf import settings
 from django.db.models import Q, QuerySet
+from django.utils import timezone
 from django.utils.translation import gettext as _
+from redis.exceptions import WatchError
 
 from common.db.models import output_as_string, UnionQuerySet
 from common.utils.common import lazyproperty, timeit
@@ -14,7 +17,7 @@ from common.utils import get_logger
 from common.decorator import on_transaction_commit
 from orgs.utils import tmp_to_org, current_org, ensure_in_real_or_default_org, tmp_to_root_org
 from assets.models import (
-    Asset, FavoriteAsset, AssetQuerySet, NodeQuerySet
+    Asset, FavoriteAsset, AssetQuerySet, NodeQuerySet, Node
 )
 from orgs.models import Organization
 from perms.models import (
@@ -30,6 +33,15 @@ logger = get_logger(__name__)
 
 
 def get_user_all_asset_perm_ids(user) -> set:
+    asset_perm_ids = get_user_related_asset_perm_ids(user)
+    asset_perm_ids = AssetPermission.objects.filter(
+        id__in=asset_perm_ids).valid().values_list('id', flat=True)
+    asset_perm_ids = set(asset_perm_ids)
+    return asset_perm_ids
+
+
+def get_user_related_asset_perm_ids(user) -> set:
+    """ Permissions granted to user or user groups, including invalid ones """
     asset_perm_ids = set()
     user_perm_id = AssetPermission.users.through.objects \
         .filter(user_id=user.id) \
@@ -47,10 +59,6 @@ def get_user_all_asset_perm_ids(user) -> set:
         .values_list('assetpermission_id', flat=True) \
         .distinct()
     asset_perm_ids.update(groups_perm_id)
-
-    asset_perm_ids = AssetPermission.objects.filter(
-        id__in=asset_perm_ids).valid().values_list('id', flat=True)
-    asset_perm_ids = set(asset_perm_ids)
     return asset_perm_ids
 
 
@@ -71,6 +79,7 @@ class UserGrantedTreeRefreshController:
             for key in keys:
                 p.delete(key)
             p.execute()
+        UserAssetPermIndex.clean_all()
 
     @classmethod
     def get_redis_client(cls):
@@ -115,6 +124,7 @@ class UserGrantedTreeRefreshController:
             for user_id in user_ids:
                 key = cls.key_template.format(user_id=user_id)
                 p.srem(key, *org_ids)
+                UserAssetPermIndex.expire_in_pipeline(p, user_id, org_ids)
             p.execute()
         logger.info(f'Remove orgs from users built tree: users:{user_ids} '
                     f'orgs:{org_ids}')
@@ -216,12 +226,238 @@ class UserGrantedTreeRefreshController:
                         logger.info(f'Rebuild user tree: user={self.user} org={current_org}')
                         utils = UserGrantedTreeBuildUtils(user)
                         utils.rebuild_user_granted_tree()
+                        UserAssetPermIndex(user, org.id).build()
                         logger.info(
                             f'Rebuild user tree ok: cost={time.time() - t_start} '
                             f'user={self.user} org={current_org}'
                         )
 
 
+class UserAssetPermIndex:
+    """
+    Materialized user granted assets of an org, stored in a redis hash:
+
+        { asset_id: 'system_user_id:actions:expire_at;...' }
+
+    So permission check of a connection is one `HMGET`. It is built with
+    the user granted tree or on first access, expired together with the
+    built tree mark of the org (`remove_built_orgs_from_users`), and
+    rebuilt when the first permission of it expired or started.
+    """
+    key_template = 'perms.user.asset_perm_index.user_id:{user_id}.org_id:{org_id}'
+    version_key_template = 'perms.user.asset_perm_index.version.user_id:{user_id}.org_id:{org_id}'
+    BUILT_FIELD = '__built__'
+    EXPIRE_AT_FIELD = '__expire_at__'
+    KEY_TTL = 3600 * 24
+    CHUNK_SIZE = 10000
+
+    def __init__(self, user, org_id=None):
+        self.user = user
+        self.org_id = str(org_id or current_org.id)
+        self.key = self.key_template.format(user_id=user.id, org_id=self.org_id)
+        self.version_key = self.version_key_template.format(user_id=user.id, org_id=self.org_id)
+        self.client = UserGrantedTreeRefreshController.get_redis_client()
+
+    @classmethod
+    def expire_in_pipeline(cls, pipeline, user_id, org_ids):
+        for org_id in org_ids:
+            pipeline.delete(cls.key_template.format(user_id=user_id, org_id=org_id))
+            pipeline.incr(cls.version_key_template.format(user_id=user_id, org_id=org_id))
+
+    @classmethod
+    def clean_all(cls):
+        client = UserGrantedTreeRefreshController.get_redis_client()
+        key_match = cls.key_template.format(user_id='*', org_id='*')
+        keys = client.keys(key_match)
+        if not keys:
+            return
+        with client.pipeline() as p:
+            for key in keys:
+                p.delete(key)
+            p.execute()
+
+    @staticmethod
+    def _dumps(system_users):
+        return ';'.join(
+            f'{system_user_id}:{actions}:{expire_at}'
+            for system_user_id, (actions, expire_at) in system_users.items()
+        )
+
+    @staticmethod
+    def _loads(value):
+        if isinstance(value, bytes):
+            value = value.decode()
+        system_users = {}
+        for item in value.split(';'):
+            if not item:
+                continue
+            system_user_id, actions, expire_at = item.split(':')
+            system_users[system_user_id] = (int(actions), float(expire_at))
+        return system_users
+
+    @staticmethod
+    def normalize_id(value):
+        """ Dashed form of an uuid, MySQL returns char uuids in the hex form """
+        if isinstance(value, uuid.UUID):
+            return str(value)
+        return str(uuid.UUID(str(value)))
+
+    def get_asset_system_users(self, asset_id) -> dict:
+        """
+        :return: { system_user_id: (actions, expire_at) }
+        """
+        asset_id = self.normalize_id(asset_id)
+        built, expire_at, value = self.client.hmget(
+            self.key, self.BUILT_FIELD, self.EXPIRE_AT_FIELD, asset_id
+        )
+        expire_at = float(expire_at or 0)
+        if not built or (expire_at and expire_at <= time.time()):
+            index = self.build()
+            return index.get(asset_id, {})
+        if not value:
+            return {}
+        return self._loads(value)
+
+    def get_asset_system_user_actions(self, asset_id, system_user_id):
+        """ :return: (actions, expire_at) """
+        system_users = self.get_asset_system_users(asset_id)
+        return system_users.get(self.normalize_id(system_user_id), (0, 0))
+
+    def compute(self):
+        """
+        :return: ({ asset_id: { system_user_id: (actions, expire_at) } }, expire_at)
+        """
+        perm_ids = get_user_related_asset_perm_ids(self.user)
+        now = timezone.now()
+        perms = AssetPermission.objects.filter(id__in=perm_ids).active() \
+            .filter(date_expired__gt=now) \
+            .values_list('id', 'actions', 'date_start', 'date_expired')
+
+        # The index is stale when the first valid permission expired or
+        # the first not yet valid permission started
+        boundaries = []
+        perm_attrs = {}
+        for perm_id, actions, date_start, date_expired in perms:
+            if date_start > now:
+                boundaries.append(date_start.timestamp())
+                continue
+            boundaries.append(date_expired.timestamp())
+            perm_attrs[perm_id] = (actions, date_expired.timestamp())
+        expire_at = min(boundaries) if boundaries else 0
+
+        index = defaultdict(dict)
+        if not perm_attrs:
+            return index, expire_at
+
+        perm_system_user_ids = defaultdict(set)
+        pairs = AssetPermission.system_users.through.objects \
+            .filter(assetpermission_id__in=perm_attrs.keys()) \
+            .annotate(char_system_user_id=output_as_string('systemuser_id')) \
+            .values_list('assetpermission_id', 'char_system_user_id')
+        for perm_id, system_user_id in pairs:
+            perm_system_user_ids[perm_id].add(system_user_id)
+
+        perm_asset_ids = defaultdict(set)
+        pairs = AssetPermission.assets.through.objects \
+            .filter(assetpermission_id__in=perm_system_user_ids.keys()) \
+            .annotate(char_asset_id=output_as_string('asset_id')) \
+            .values_list('assetpermission_id', 'char_asset_id')
+        for perm_id, asset_id in pairs:
+            perm_asset_ids[perm_id].add(asset_id)
+
+        perm_node_keys = defaultdict(set)
+        pairs = AssetPermission.nodes.through.objects \
+            .filter(assetpermission_id__in=perm_system_user_ids.keys()) \
+            .values_list('assetpermission_id', 'node__key')
+        for perm_id, node_key in pairs:
+            perm_node_keys[perm_id].add(node_key)
+        if perm_node_keys:
+            node_asset_ids = self.get_nodes_all_asset_ids(set().union(*perm_node_keys.values()))
+            for perm_id, node_keys in perm_node_keys.items():
+                for node_key in node_keys:
+                    perm_asset_ids[perm_id].update(node_asset_ids[node_key])
+
+        index = self.merge_index(perm_attrs, perm_system_user_ids, perm_asset_ids)
+        return index, expire_at
+
+    @classmethod
+    def merge_index(cls, perm_attrs, perm_system_user_ids, perm_asset_ids):
+        """
+        :param perm_attrs: { perm_id: (actions, expire_at) }
+        :param perm_system_user_ids: { perm_id: { system_user_id, } }
+        :param perm_asset_ids: { perm_id: { asset_id, } }
+        :return: { asset_id: { system_user_id: (actions, expire_at) } },
+            ids are in the dashed form, whatever form the db returned
+        """
+        normalized = {}
+
+        def normalize(value):
+            if value not in normalized:
+                normalized[value] = cls.normalize_id(value)
+            return normalized[value]
+
+        index = defaultdict(dict)
+        for perm_id, system_user_ids in perm_system_user_ids.items():
+            actions, date_expired = perm_attrs[perm_id]
+            system_user_ids = [normalize(i) for i in system_user_ids]
+            for asset_id in perm_asset_ids.get(perm_id, ()):
+                system_users = index[normalize(asset_id)]
+                for system_user_id in system_user_ids:
+                    _actions, _expire_at = system_users.get(system_user_id, (0, 0))
+                    system_users[system_user_id] = (_actions | actions, max(_expire_at, date_expired))
+        return index
+
+    @staticmethod
+    def get_nodes_all_asset_ids(node_keys):
+        """
+        Read from db, not the node asset mapping, which lags behind the
+        changes by the broadcast delay and would be kept in the index for
+        `KEY_TTL`
+
+        :return: { node_key: { asset_id, } } of the nodes and their children
+        """
+        q = Q(key__in=node_keys)
+        for key in node_keys:
+            q |= Q(key__startswith=f'{key}:')
+        node_ids = Node.objects.filter(q).values_list('id', flat=True)
+        pairs = Asset.nodes.through.objects \
+            .filter(node_id__in=node_ids) \
+            .annotate(char_asset_id=output_as_string('asset_id')) \
+            .values_list('node__key', 'char_asset_id')
+
+        node_asset_ids = defaultdict(set)
+        for key, asset_id in pairs:
+            for ancestor_key in Node.get_node_ancestor_keys(key, with_self=True):
+                if ancestor_key in node_keys:
+                    node_asset_ids[ancestor_key].add(asset_id)
+        return node_asset_ids
+
+    @timeit
+    def build(self):
+        with self.client.pipeline() as p:
+            # Drop the result if the index expired during building
+            p.watch(self.version_key)
+            with tmp_to_org(self.org_id):
+                index, expire_at = self.compute()
+            try:
+                p.multi()
+                p.delete(self.key)
+                items = list(index.items())
+                for i in range(0, len(items), self.CHUNK_SIZE):
+                    mapping = {
+                        asset_id: self._dumps(system_users)
+                        for asset_id, system_users in items[i:i + self.CHUNK_SIZE]
+                    }
+                    p.hset(self.key, mapping=mapping)
+                p.hset(self.key, mapping={self.BUILT_FIELD: 1, self.EXPIRE_AT_FIELD: expire_at})
+                p.expire(self.key, self.KEY_TTL)
+                p.execute()
+            except WatchError:
+                logger.info(f'User asset perm index expired when building: '
+                            f'user={self.user} org={self.org_id}')
+        return index
+
+
 class UserGrantedUtilsBase:
     user: User
 
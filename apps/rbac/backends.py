@@ -1,3 +1,5 @@
+from functools import lru_cache
+
 from django.core.exceptions import PermissionDenied
 
 from authentication.backends.base import JMSBaseAuthBackend
@@ -14,16 +16,43 @@ class RBACBackend(JMSBaseAuthBackend):
     def username_allow_authenticate(self, username):
         return False
 
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def parse_perm(perm) -> frozenset:
+        return frozenset(i.strip() for i in perm.split('|'))
+
+    @classmethod
+    def match_perm(cls, user_perms, perm):
+        if perm == '*':
+            return True
+        return not user_perms.isdisjoint(cls.parse_perm(perm))
+
     def has_perm(self, user_obj, perm, obj=None):
         if not user_obj.is_active or not perm:
             raise PermissionDenied()
-        if perm == '*':
-            return True
-        perm_set = set(i.strip() for i in perm.split('|'))
-        has_perm = bool(perm_set & set(user_obj.perms))
+        has_perm = self.match_perm(user_obj.perms, perm)
         if not has_perm:
             raise PermissionDenied()
         return has_perm
 
     # def has_module_perms(self, user_obj, app_label):
     #     return True
+
+
+def has_perms_batch(user, perms):
+    """
+    Check lots of perms with only one lookup of the user perms
+
+    :return: { perm: bool }
+    """
+    if not hasattr(user, 'perms'):
+        return {perm: user.has_perm(perm) for perm in perms}
+    if not user.is_active:
+        return {perm: False for perm in perms}
+    if user.is_superuser:
+        return {perm: True for perm in perms}
+    user_perms = user.perms
+    return {
+        perm: bool(perm) and RBACBackend.match_perm(user_perms, perm)
+        for perm in perms
+    }
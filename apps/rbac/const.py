@@ -94,6 +94,7 @@ exclude_permissions = (
     ('terminal', 'sessionjoinrecord', 'delete', 'sessionjoinrecord'),
     ('terminal', 'sessionreplay', 'add,change,delete', 'sessionreplay'),
     ('terminal', 'sessionsharing', 'view,add,change,delete', 'sessionsharing'),
+    ('terminal', 'sessionrollup', '*', '*'),
     ('terminal', 'session', 'delete,share', 'session'),
     ('terminal', 'session', 'delete,change', 'command'),
 )
@@ -1,5 +1,8 @@
+import time
+
 from django.utils.translation import gettext_lazy as _, gettext
 from django.db import models
+from django.core.cache import cache
 
 from common.db.models import JMSModel
 from common.utils import lazyproperty
@@ -36,6 +39,9 @@ class Role(JMSModel):
     comment = models.TextField(max_length=128, default='', blank=True, verbose_name=_('Comment'))
 
     BuiltinRole = BuiltinRole
+    PERMS_CACHE_KEY = 'RBAC_ROLE_PERMS_{}_{}'
+    PERMS_VERSION_CACHE_KEY = 'RBAC_ROLE_PERMS_VERSION'
+    PERMS_CACHE_TTL = 3600 * 24
     objects = models.Manager()
     org_roles = OrgRoleManager()
     system_roles = SystemRoleManager()
@@ -86,6 +92,50 @@ class Role(JMSModel):
         permissions = cls.get_roles_permissions(roles)
         return Permission.to_perms(permissions)
 
+    @staticmethod
+    def get_cache_version(key):
+        # Start from timestamp, so lost version never matches old cached values
+        cache.add(key, int(time.time() * 1000), None)
+        return cache.get(key)
+
+    @staticmethod
+    def bump_cache_version(key):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, int(time.time() * 1000), None)
+
+    @classmethod
+    def get_perms_version(cls):
+        return cls.get_cache_version(cls.PERMS_VERSION_CACHE_KEY)
+
+    @classmethod
+    def expire_perms_cache(cls):
+        cls.bump_cache_version(cls.PERMS_VERSION_CACHE_KEY)
+
+    @classmethod
+    def get_roles_compiled_perms(cls, roles, version=None) -> frozenset:
+        """
+        Perms of every role are compiled once and cached with the roles
+        version, which is bumped when any role or its permissions change
+        """
+        if version is None:
+            version = cls.get_perms_version()
+        keys = {cls.PERMS_CACHE_KEY.format(role.id, version): role for role in roles}
+        cached = cache.get_many(keys.keys())
+
+        perms = set()
+        to_cache = {}
+        for key, role in keys.items():
+            role_perms = cached.get(key)
+            if role_perms is None:
+                role_perms = frozenset(Permission.to_perms(role.get_permissions()))
+                to_cache[key] = role_perms
+            perms.update(role_perms)
+        if to_cache:
+            cache.set_many(to_cache, cls.PERMS_CACHE_TTL)
+        return frozenset(perms)
+
     def get_permissions(self):
         if self.is_admin():
             permissions = Permission.objects.all()
@@ -46,6 +46,7 @@ class RoleBinding(JMSModel):
         'orgs.Organization', related_name='role_bindings', blank=True, null=True,
         on_delete=models.CASCADE, verbose_name=_('Organization')
     )
+    BINDINGS_VERSION_CACHE_KEY = 'RBAC_ROLE_BINDINGS_VERSION'
     objects = RoleBindingManager()
 
     class Meta:
@@ -76,6 +77,19 @@ class RoleBinding(JMSModel):
         roles = cls.get_user_roles(user)
         return Role.get_roles_perms(roles)
 
+    @classmethod
+    def get_user_compiled_perms(cls, user, version=None) -> frozenset:
+        roles = cls.get_user_roles(user)
+        return Role.get_roles_compiled_perms(roles, version=version)
+
+    @classmethod
+    def get_bindings_version(cls):
+        return Role.get_cache_version(cls.BINDINGS_VERSION_CACHE_KEY)
+
+    @classmethod
+    def expire_bindings_cache(cls):
+        Role.bump_cache_version(cls.BINDINGS_VERSION_CACHE_KEY)
+
     @classmethod
     def get_role_users(cls, role):
         from users.models import User
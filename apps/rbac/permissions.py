@@ -1,6 +1,7 @@
 from rest_framework import permissions, exceptions
 
 from common.utils import get_logger
+from .backends import has_perms_batch
 
 logger = get_logger(__name__)
 
@@ -122,6 +123,6 @@ class RBACPermission(permissions.DjangoModelPermissions):
         perms = self.get_require_perms(request, view)
         if isinstance(perms, str):
             perms = [perms]
-        has = request.user.has_perms(perms)
+        has = all(has_perms_batch(request.user, perms).values())
         logger.debug('View require perms: {}, result: {}'.format(perms, has))
         return has
@@ -1,8 +1,8 @@
 from django.dispatch import receiver
-from django.db.models.signals import post_migrate, post_save
+from django.db.models.signals import post_migrate, post_save, post_delete, m2m_changed
 from django.apps import apps
 
-from .models import SystemRole, OrgRole
+from .models import Role, SystemRole, OrgRole, RoleBinding, SystemRoleBinding, OrgRoleBinding
 from .builtin import BuiltinRole
 
 
@@ -17,10 +17,31 @@ def after_migrate_update_builtin_role_permissions(sender, app_config, **kwargs):
 @receiver(post_save, sender=SystemRole)
 def on_system_role_update(sender, instance, created, **kwargs):
     from users.models import User
+    Role.expire_perms_cache()
     User.expire_users_rbac_perms_cache()
 
 
 @receiver(post_save, sender=OrgRole)
 def on_org_role_update(sender, instance, created, **kwargs):
     from users.models import User
+    Role.expire_perms_cache()
     User.expire_users_rbac_perms_cache()
+
+
+@receiver([post_save, post_delete], sender=Role)
+def on_role_change(sender, instance, **kwargs):
+    Role.expire_perms_cache()
+
+
+@receiver(m2m_changed, sender=Role.permissions.through)
+def on_role_permissions_change(sender, action, **kwargs):
+    if not action.startswith('post'):
+        return
+    Role.expire_perms_cache()
+
+
+@receiver([post_save, post_delete], sender=RoleBinding)
+@receiver([post_save, post_delete], sender=SystemRoleBinding)
+@receiver([post_save, post_delete], sender=OrgRoleBinding)
+def on_role_binding_change(sender, instance, **kwargs):
+    RoleBinding.expire_bindings_cache()
@@ -17,6 +17,7 @@ from ..backends import (
     get_command_storage, get_multi_command_storage,
     SessionCommandSerializer,
 )
+from ..backends.command.multi import MergedCommandQuerySet
 from ..notifications import CommandAlertMessage
 
 logger = get_logger(__name__)
@@ -104,27 +105,28 @@ class CommandViewSet(JMSBulkModelViewSet):
     ordering_fields = ('timestamp', )
 
     def merge_all_storage_list(self, request, *args, **kwargs):
-        merged_commands = []
+        order = self.request.query_params.get('order', None)
+        reverse = order != 'timestamp'
+        ordering = '-timestamp' if reverse else 'timestamp'
 
+        querysets = []
         storages = CommandStorage.objects.all()
         for storage in storages:
             if not storage.is_valid():
                 continue
 
             qs = storage.get_command_queryset()
-            commands = self.filter_queryset(qs)
-            merged_commands.extend(commands[:])
-        order = self.request.query_params.get('order', None)
-        if order == 'timestamp':
-            merged_commands.sort(key=lambda command: command.timestamp)
-        else:
-            merged_commands.sort(key=lambda command: command.timestamp, reverse=True)
+            commands = self.filter_queryset(qs).order_by(ordering)
+            querysets.append(commands)
+        # Storages are queried concurrently, a page only fetches
+        # `offset + limit` commands of each storage
+        merged_commands = MergedCommandQuerySet(querysets, reverse=reverse)
         page = self.paginate_queryset(merged_commands)
         if page is not None:
             serializer = self.get_serializer(page, many=True)
             return self.get_paginated_response(serializer.data)
 
-        serializer = self.get_serializer(merged_commands, many=True)
+        serializer = self.get_serializer(merged_commands[:], many=True)
         return Response(serializer.data)
 
     def list(self, request, *args, **kwargs):
@@ -172,7 +174,9 @@ class CommandViewSet(JMSBulkModelViewSet):
     def create(self, request, *args, **kwargs):
         serializer = self.serializer_class(data=request.data, many=True)
         if serializer.is_valid():
-            ok = self.command_store.bulk_save(serializer.validated_data)
+            # Es storage indexes in background, don't block the terminal
+            bulk_save = getattr(self.command_store, 'buffered_bulk_save', self.command_store.bulk_save)
+            ok = bulk_save(serializer.validated_data)
             if ok:
                 return Response("ok", status=201)
             else:
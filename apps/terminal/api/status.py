@@ -1,17 +1,15 @@
 # -*- coding: utf-8 -*-
 #
 
-import datetime
 import logging
-from django.utils import timezone
 from django.shortcuts import get_object_or_404
 from rest_framework import viewsets, generics
 from rest_framework.views import Response
 from rest_framework import status
 
-from ..models import Terminal, Status, Session
+from ..models import Terminal, Status
 from .. import serializers
-from ..utils import TypedComponentsStatusMetricsUtil
+from ..utils import TypedComponentsStatusMetricsUtil, TerminalHeartbeatUtil
 
 logger = logging.getLogger(__file__)
 
@@ -26,27 +24,25 @@ class StatusViewSet(viewsets.ModelViewSet):
     task_serializer_class = serializers.TaskSerializer
 
     def create(self, request, *args, **kwargs):
+        """ Heartbeat of components, redis writes are in one round trip """
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        self.handle_sessions()
-        self.perform_create(serializer)
-        task_serializer = self.get_task_serializer()
-        return Response(task_serializer.data, status=201)
-
-    def handle_sessions(self):
-        session_ids = self.request.data.get('sessions', [])
-        Session.set_sessions_active(session_ids)
-
-    def perform_create(self, serializer):
-        serializer.validated_data.pop('sessions', None)
-        serializer.validated_data["terminal"] = self.request.user.terminal
-        return super().perform_create(serializer)
-
-    def get_task_serializer(self):
-        critical_time = timezone.now() - datetime.timedelta(minutes=10)
-        tasks = self.request.user.terminal.task_set.filter(is_finished=False, date_created__gte=critical_time)
-        serializer = self.task_serializer_class(tasks, many=True)
-        return serializer
+        validated_data = dict(serializer.validated_data)
+        session_ids = validated_data.pop('sessions', None) or []
+        terminal = self.request.user.terminal
+        stat = Status(terminal=terminal, **validated_data)
+        tasks = TerminalHeartbeatUtil(terminal).handle(stat, session_ids)
+        return Response(tasks, status=201)
+
+    def list(self, request, *args, **kwargs):
+        terminal_id = self.kwargs.get("terminal", None)
+        if not terminal_id:
+            return super().list(request, *args, **kwargs)
+        terminal = get_object_or_404(Terminal, id=terminal_id)
+        limit = request.query_params.get('limit', '')
+        limit = int(limit) if limit.isdigit() else TerminalHeartbeatUtil.SERIES_MAX_LENGTH
+        series = TerminalHeartbeatUtil.get_status_series(terminal.id, limit=limit)
+        return Response(series)
 
     def get_queryset(self):
         terminal_id = self.kwargs.get("terminal", None)
@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+#
+import os
+import json
+import glob
+import time
+import queue
+import atexit
+import socket
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+
+from common.utils import get_logger
+
+logger = get_logger(__file__)
+
+__all__ = ['BufferedBulkWriter']
+
+
+class BufferedBulkWriter:
+    """
+    Write-behind buffer of a bulk write function
+
+    Items are put to a memory queue and return at once, a daemon thread
+    flushes them by `flush_func(items)` when `batch_size` items buffered or
+    `flush_interval` seconds passed. Failed flushes are retried with backoff,
+    then the items are appended to a local journal file, which is replayed
+    after a later flush succeeds. When the queue is full, items go to the
+    journal directly. Items must be json serializable.
+    """
+    METRICS_CACHE_KEY = 'TERMINAL_BULK_WRITER_METRICS_{}_{}_{}'
+    METRICS_CACHE_KEY_PATTERN = 'TERMINAL_BULK_WRITER_METRICS_*'
+    METRICS_CACHE_TTL = 60
+    METRICS_PUBLISH_INTERVAL = 10
+    REPLAYING_MARK = '.replaying.'
+
+    def __init__(self, name, flush_func, batch_size=500, flush_interval=1.0,
+                 max_queue_size=20000, max_retries=3, retry_backoff=0.5,
+                 journal_dir=None):
+        self.name = name
+        self.flush_func = flush_func
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue_size = max_queue_size
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.journal_dir = journal_dir or os.path.join(settings.DATA_DIR, 'bulk_writer_journal')
+
+        self._lock = threading.Lock()
+        self._journal_lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._thread = None
+        self._metrics_published_at = 0
+        self.metrics = {
+            'queue_depth': 0,
+            'flushed_total': 0,
+            'flush_failed_total': 0,
+            'journal_written_total': 0,
+            'journal_replayed_total': 0,
+            'last_flush_latency': 0,
+            'max_flush_latency': 0,
+            'last_flush_time': 0,
+        }
+
+    def __str__(self):
+        return 'BufferedBulkWriter({})'.format(self.name)
+
+    # Put
+    def _ensure_started(self):
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            # New process after fork, the thread of parent not exists
+            self._queue = queue.Queue(maxsize=self.max_queue_size)
+            self._thread = threading.Thread(
+                target=self._run, name='bulk_writer_{}'.format(self.name), daemon=True
+            )
+            self._thread.start()
+            self._pid = pid
+            atexit.register(self.close)
+
+    def put(self, item):
+        self.put_many([item])
+
+    def put_many(self, items):
+        self._ensure_started()
+        overflowed = []
+        for item in items:
+            try:
+                self._queue.put_nowait(item)
+            except queue.Full:
+                overflowed.append(item)
+        if overflowed:
+            logger.warning('{} queue full, write {} items to journal'.format(self, len(overflowed)))
+            self.write_journal(overflowed)
+
+    def close(self):
+        """ Save the buffered items to journal at exit, don't wait the remote """
+        items = self._drain()
+        if items:
+            self.write_journal(items)
+
+    def _drain(self):
+        items = []
+        if self._queue is None:
+            return items
+        while True:
+            try:
+                items.append(self._queue.get_nowait())
+            except queue.Empty:
+                return items
+
+    # Flush
+    def _run(self):
+        while True:
+            try:
+                items = self._get_batch()
+                if items:
+                    self.flush(items)
+                elif self.has_journal():
+                    self.replay_journal()
+                self.publish_metrics()
+            except Exception as e:
+                logger.error('{} error: {}'.format(self, e), exc_info=True)
+                time.sleep(self.flush_interval)
+
+    def _get_batch(self):
+        items = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(items) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                items.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return items
+
+    def _flush_with_retry(self, items):
+        for i in range(self.max_retries + 1):
+            start = time.monotonic()
+            try:
+                self.flush_func(items)
+            except Exception as e:
+                self.metrics['flush_failed_total'] += 1
+                logger.warning('{} flush {} items error: {}'.format(self, len(items), e))
+                if i < self.max_retries:
+                    time.sleep(self.retry_backoff * 2 ** i)
+                continue
+
+            latency = time.monotonic() - start
+            self.metrics['flushed_total'] += len(items)
+            self.metrics['last_flush_latency'] = latency
+            self.metrics['max_flush_latency'] = max(self.metrics['max_flush_latency'], latency)
+            self.metrics['last_flush_time'] = time.time()
+            return True
+        return False
+
+    def flush(self, items):
+        if not self._flush_with_retry(items):
+            self.write_journal(items)
+            return False
+        if self.has_journal():
+            self.replay_journal()
+        return True
+
+    # Journal
+    def _get_journal_path(self):
+        filename = '{}.{}.{}.jsonl'.format(self.name, socket.gethostname(), os.getpid())
+        return os.path.join(self.journal_dir, filename)
+
+    def _get_journal_paths(self):
+        """ Journals, and journals left by a process died in replaying """
+        pattern = os.path.join(self.journal_dir, '{}.*.jsonl'.format(self.name))
+        paths = glob.glob(pattern)
+        pattern = os.path.join(self.journal_dir, '{}.*.jsonl{}*'.format(self.name, self.REPLAYING_MARK))
+        for path in glob.glob(pattern):
+            host, __, pid = path.rpartition(self.REPLAYING_MARK)[2].rpartition('.')
+            if host == socket.gethostname() and pid.isdigit() and not self._is_pid_alive(int(pid)):
+                paths.append(path)
+        return paths
+
+    @staticmethod
+    def _is_pid_alive(pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+
+    def has_journal(self):
+        return bool(self._get_journal_paths())
+
+    def write_journal(self, items):
+        os.makedirs(self.journal_dir, exist_ok=True)
+        lines = ''.join(json.dumps(item, default=str) + '\n' for item in items)
+        with self._journal_lock:
+            with open(self._get_journal_path(), 'a') as f:
+                f.write(lines)
+        self.metrics['journal_written_total'] += len(items)
+
+    def replay_journal(self):
+        """ Replay journals of all processes, every file is taken by rename """
+        for path in self._get_journal_paths():
+            journal_path = path.partition(self.REPLAYING_MARK)[0]
+            replaying_path = '{}{}{}.{}'.format(
+                journal_path, self.REPLAYING_MARK, socket.gethostname(), os.getpid()
+            )
+            try:
+                with self._journal_lock:
+                    os.rename(path, replaying_path)
+            except OSError:
+                # Taken by another process
+                continue
+            if not self._replay_file(replaying_path):
+                return False
+        return True
+
+    def _replay_file(self, path):
+        items = []
+        with open(path) as f:
+            for n, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    items.append(json.loads(line))
+                except ValueError as e:
+                    # Half written by a process died in writing
+                    logger.error('{} skip bad journal line {} of {}: {}'.format(self, n, path, e))
+        for i in range(0, len(items), self.batch_size):
+            batch = items[i:i + self.batch_size]
+            if not self._flush_with_retry(batch):
+                # Remote is still unavailable, keep the rest
+                self.write_journal(items[i:])
+                os.remove(path)
+                return False
+            self.metrics['journal_replayed_total'] += len(batch)
+        os.remove(path)
+        return True
+
+    # Metrics
+    def get_metrics(self):
+        metrics = dict(self.metrics)
+        metrics['queue_depth'] = self._queue.qsize() if self._queue is not None else 0
+        return metrics
+
+    def publish_metrics(self):
+        now = time.monotonic()
+        if now - self._metrics_published_at < self.METRICS_PUBLISH_INTERVAL:
+            return
+        self._metrics_published_at = now
+        key = self.METRICS_CACHE_KEY.format(self.name, socket.gethostname(), os.getpid())
+        metrics = self.get_metrics()
+        metrics['name'] = self.name
+        cache.set(key, metrics, self.METRICS_CACHE_TTL)
+
+    @classmethod
+    def get_all_metrics(cls):
+        """ Metrics published by all processes """
+        keys = cache.keys(cls.METRICS_CACHE_KEY_PATTERN)
+        return [m for m in cache.get_many(keys).values() if m]
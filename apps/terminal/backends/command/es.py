@@ -1,12 +1,15 @@
 # -*- coding: utf-8 -*-
 #
+import json
 import pytz
 import inspect
+import hashlib
+import threading
 
 from datetime import datetime
 from functools import reduce, partial
 from itertools import groupby
-from uuid import UUID
+from uuid import UUID, uuid4
 
 from django.utils.translation import gettext_lazy as _
 from django.db.models import QuerySet as DJQuerySet
@@ -19,9 +22,13 @@ from common.utils import get_logger
 from common.utils.timezone import local_now_date_display, utc_now
 from common.exceptions import JMSException
 from terminal.models import Command
+from .buffer import BufferedBulkWriter
 
 logger = get_logger(__file__)
 
+_writers = {}
+_writers_lock = threading.Lock()
+
 
 class InvalidElasticsearch(JMSException):
     default_code = 'invalid_elasticsearch'
@@ -155,9 +162,48 @@ class CommandStore(object):
                 _type=self.doc_type,
                 _source=self.make_data(command),
             )
+            # Same id makes retrying a batch idempotent
+            if command.get('id'):
+                data['_id'] = str(command['id'])
             actions.append(data)
         return bulk(self.es, actions, index=self.index, raise_on_error=raise_on_error)
 
+    @lazyproperty
+    def writer_name(self):
+        hosts = json.dumps(self.es.transport.hosts, sort_keys=True, default=str)
+        digest = hashlib.md5('{}@{}'.format(self.index, hosts).encode()).hexdigest()[:16]
+        return 'es_command_{}'.format(digest)
+
+    def get_writer(self):
+        """ Writers are shared in process by es hosts and index """
+        name = self.writer_name
+        writer = _writers.get(name)
+        if writer is not None:
+            return writer
+        with _writers_lock:
+            writer = _writers.get(name)
+            if writer is None:
+                writer = BufferedBulkWriter(name, self.bulk_save)
+                _writers[name] = writer
+        return writer
+
+    def buffered_bulk_save(self, command_set):
+        """
+        Put commands to the write-behind buffer and return at once,
+        they are indexed in background by batch
+        """
+        fields = (
+            'user', 'asset', 'system_user', 'input', 'output',
+            'risk_level', 'session', 'timestamp', 'org_id'
+        )
+        commands = []
+        for command in command_set:
+            data = {k: command[k] for k in fields}
+            data['id'] = str(uuid4())
+            commands.append(data)
+        self.get_writer().put_many(commands)
+        return True
+
     def save(self, command):
         data = self.make_data(command)
         return self.es.index(index=self.index, doc_type=self.doc_type, body=data)
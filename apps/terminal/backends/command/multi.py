@@ -1,8 +1,118 @@
 # -*- coding: utf-8 -*-
 #
+import time
+import heapq
+from itertools import islice
+from operator import attrgetter
+from concurrent.futures import TimeoutError as FutureTimeoutError
 
+from django.db import close_old_connections
+
+from common.utils import get_logger
+from common.thread_pools import SingletonThreadPoolExecutor
+from orgs.utils import get_current_org, tmp_to_org
 from .base import CommandBase
 
+logger = get_logger(__file__)
+
+__all__ = ['CommandStore', 'MergedCommandQuerySet', 'run_on_storages']
+
+
+class CommandStorageThreadPoolExecutor(SingletonThreadPoolExecutor):
+    pass
+
+
+STORAGE_TIMEOUT = 10
+STORAGE_MAX_WORKERS = 10
+
+get_timestamp = attrgetter('timestamp')
+
+
+def _run_in_org(org, func, storage):
+    try:
+        with tmp_to_org(org):
+            return func(storage)
+    finally:
+        close_old_connections()
+
+
+def run_on_storages(func, storages, timeout=STORAGE_TIMEOUT):
+    """
+    Call `func(storage)` of all storages concurrently
+
+    A storage which raises or does not return in `timeout` seconds is skipped,
+    so one slow storage doesn't block the others
+    :return: [result, ]
+    """
+    storages = list(storages)
+    if len(storages) == 1:
+        return [func(storages[0])]
+
+    executor = CommandStorageThreadPoolExecutor(
+        max_workers=STORAGE_MAX_WORKERS, thread_name_prefix='command_storage'
+    )
+    org = get_current_org()
+    futures = [
+        (storage, executor.submit(_run_in_org, org, func, storage))
+        for storage in storages
+    ]
+    deadline = time.monotonic() + timeout
+    results = []
+    for storage, future in futures:
+        try:
+            result = future.result(timeout=max(deadline - time.monotonic(), 0))
+        except FutureTimeoutError:
+            future.cancel()
+            logger.warning('Command storage query timeout: storage={}'.format(storage))
+            continue
+        except Exception as e:
+            logger.error('Command storage query error: storage={} {}'.format(storage, e))
+            continue
+        results.append(result)
+    return results
+
+
+class MergedCommandQuerySet:
+    """
+    Commands of multiple storages ordered by timestamp, works with paginator
+
+    Every queryset must be ordered by timestamp in the same direction, a
+    slice `[start:stop]` only fetches `stop` commands of each storage and
+    merges them
+    """
+
+    def __init__(self, querysets, reverse=True, timeout=STORAGE_TIMEOUT):
+        self.querysets = list(querysets)
+        self.reverse = reverse
+        self.timeout = timeout
+
+    def count(self):
+        counts = run_on_storages(lambda qs: qs.count(), self.querysets, self.timeout)
+        return sum(counts)
+
+    def __len__(self):
+        return self.count()
+
+    def merge(self, start=0, stop=None):
+        def fetch(qs):
+            if stop is None:
+                return list(qs[:])
+            return list(qs[:stop])
+
+        results = run_on_storages(fetch, self.querysets, self.timeout)
+        merged = heapq.merge(*results, key=get_timestamp, reverse=self.reverse)
+        return list(islice(merged, start, stop))
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            if item.step is not None:
+                return self.merge()[item]
+            return self.merge(item.start or 0, item.stop)
+        return self.merge(item, item + 1)[0]
+
+    def __iter__(self):
+        return iter(self.merge())
+
 
 class CommandStore(CommandBase):
     def __init__(self, storage_list):
@@ -14,16 +124,17 @@ class CommandStore(CommandBase):
             queryset = storage.filter(**kwargs)
             return queryset
 
-        queryset = []
-        for storage in self.storage_list:
-            queryset.extend(storage.filter(**kwargs))
-        return sorted(queryset, key=lambda command: command.timestamp, reverse=True)
+        def fetch(storage):
+            commands = list(storage.filter(**kwargs))
+            commands.sort(key=get_timestamp, reverse=True)
+            return commands
+
+        results = run_on_storages(fetch, self.storage_list)
+        return list(heapq.merge(*results, key=get_timestamp, reverse=True))
 
     def count(self, **kwargs):
-        amount = 0
-        for storage in self.storage_list:
-            amount += storage.count(**kwargs)
-        return amount
+        counts = run_on_storages(lambda storage: storage.count(**kwargs), self.storage_list)
+        return sum(counts)
 
     def save(self, command):
         pass
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from terminal.models import SessionRollup
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the session rollup of the last days from sessions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help='Days to rebuild, default 30')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        date_from = now - timezone.timedelta(days=options['days'])
+        total = SessionRollup.rebuild(date_from, now)
+        self.stdout.write('Rebuild session rollup done, sessions: {}'.format(total))
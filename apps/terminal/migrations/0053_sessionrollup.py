@@ -0,0 +1,34 @@
+# Generated by Django 3.2.12 on 2022-07-20 10:12
+
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('terminal', '0052_auto_20220713_1417'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SessionRollup',
+            fields=[
+                ('org_id', models.CharField(blank=True, db_index=True, default='', max_length=36, verbose_name='Organization')),
+                ('id', models.UUIDField(default=uuid.uuid4, primary_key=True, serialize=False)),
+                ('period', models.CharField(choices=[('day', 'Day'), ('hour', 'Hour')], max_length=8, verbose_name='Period')),
+                ('date_start', models.DateTimeField(verbose_name='Date start')),
+                ('dimension', models.CharField(choices=[('user', 'User'), ('asset', 'Asset')], max_length=8, verbose_name='Dimension')),
+                ('key', models.CharField(max_length=128, verbose_name='Key')),
+                ('name', models.CharField(blank=True, default='', max_length=128, verbose_name='Name')),
+                ('count', models.IntegerField(default=0, verbose_name='Count')),
+                ('duration', models.BigIntegerField(default=0, verbose_name='Duration')),
+                ('date_last', models.DateTimeField(null=True, verbose_name='Date last')),
+            ],
+            options={
+                'verbose_name': 'Session rollup',
+                'unique_together': {('org_id', 'period', 'date_start', 'dimension', 'key')},
+                'index_together': {('period', 'dimension', 'date_start')},
+            },
+        ),
+    ]
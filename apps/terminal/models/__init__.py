@@ -7,3 +7,4 @@ from .terminal import *
 from .sharing import *
 from .replay import *
 from .endpoint import *
+from .rollup import *
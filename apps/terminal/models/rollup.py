@@ -0,0 +1,202 @@
+import uuid
+import datetime
+from collections import defaultdict
+
+from django.db import models, transaction, IntegrityError
+from django.db.models import F, Value, Sum, Max, Count
+from django.db.models.functions import Greatest, Coalesce
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+from orgs.mixins.models import OrgModelMixin
+from .session import Session
+
+__all__ = ['SessionRollup']
+
+
+class SessionRollup(OrgModelMixin):
+    """
+    Sessions of an org aggregated by the start day or hour, a row for a user
+    or an asset
+
+    Logins of a day is the sum of counts of the user rows, active users and
+    assets are the amount of the rows, top users and assets are ordered by
+    the sum of counts. Rows are increased when a session is created or
+    finished, and rebuilt from sessions by `rebuild`.
+    """
+
+    class Period(models.TextChoices):
+        day = 'day', _('Day')
+        hour = 'hour', _('Hour')
+
+    class Dimension(models.TextChoices):
+        user = 'user', _('User')
+        asset = 'asset', _('Asset')
+
+    id = models.UUIDField(default=uuid.uuid4, primary_key=True)
+    period = models.CharField(max_length=8, choices=Period.choices, verbose_name=_('Period'))
+    date_start = models.DateTimeField(verbose_name=_('Date start'))
+    dimension = models.CharField(max_length=8, choices=Dimension.choices, verbose_name=_('Dimension'))
+    # User id, or asset display as `Session.asset`
+    key = models.CharField(max_length=128, verbose_name=_('Key'))
+    name = models.CharField(max_length=128, blank=True, default='', verbose_name=_('Name'))
+    count = models.IntegerField(default=0, verbose_name=_('Count'))
+    # Seconds of the finished sessions
+    duration = models.BigIntegerField(default=0, verbose_name=_('Duration'))
+    date_last = models.DateTimeField(null=True, verbose_name=_('Date last'))
+
+    class Meta:
+        verbose_name = _('Session rollup')
+        unique_together = [('org_id', 'period', 'date_start', 'dimension', 'key')]
+        index_together = [('period', 'dimension', 'date_start')]
+
+    @classmethod
+    def get_period_start(cls, dt, period):
+        dt = timezone.localtime(dt)
+        if period == cls.Period.day:
+            return dt.replace(hour=0, minute=0, second=0, microsecond=0)
+        return dt.replace(minute=0, second=0, microsecond=0)
+
+    @classmethod
+    def aggregate(cls, sessions, count=True, duration=True):
+        """
+        :param sessions: [Session, ] or values with the same attributes
+        :return: { (org_id, period, date_start, dimension, key): [name, count, duration, date_last] }
+        """
+        rows = defaultdict(lambda: ['', 0, 0, None])
+        for session in sessions:
+            seconds = 0
+            if duration and session.is_finished and session.date_end:
+                seconds = max(int((session.date_end - session.date_start).total_seconds()), 0)
+            dimensions = (
+                (cls.Dimension.user, session.user_id or session.user, session.user),
+                (cls.Dimension.asset, session.asset, session.asset),
+            )
+            for period in cls.Period.values:
+                date_start = cls.get_period_start(session.date_start, period)
+                for dimension, key, name in dimensions:
+                    row = rows[(str(session.org_id), period, date_start, dimension, str(key)[:128])]
+                    row[0] = name[:128] if name else row[0]
+                    if count:
+                        row[1] += 1
+                        row[3] = max(row[3], session.date_start) if row[3] else session.date_start
+                    row[2] += seconds
+        return rows
+
+    @classmethod
+    def incr(cls, rows):
+        """ Add the aggregated rows to the table, insert if not exists """
+        manager = cls._base_manager
+        for (org_id, period, date_start, dimension, key), row in rows.items():
+            name, count, duration, date_last = row
+            lookup = {
+                'org_id': org_id, 'period': period, 'date_start': date_start,
+                'dimension': dimension, 'key': key,
+            }
+            updates = {'count': F('count') + count, 'duration': F('duration') + duration}
+            if date_last:
+                date_last_value = Value(date_last, output_field=models.DateTimeField())
+                updates['date_last'] = Greatest(Coalesce('date_last', date_last_value), date_last_value)
+            if manager.filter(**lookup).update(**updates):
+                continue
+            obj = cls(name=name, count=count, duration=duration, date_last=date_last, **lookup)
+            try:
+                # Not by `save`, it sets org_id to the current org
+                with transaction.atomic():
+                    manager.bulk_create([obj])
+            except IntegrityError:
+                manager.filter(**lookup).update(**updates)
+
+    @classmethod
+    def on_session_created(cls, session):
+        cls.incr(cls.aggregate([session], duration=session.is_finished))
+
+    @classmethod
+    def on_session_finished(cls, session):
+        cls.incr(cls.aggregate([session], count=False))
+
+    @classmethod
+    def rebuild(cls, date_from, date_to):
+        """
+        Rebuild the rows of the days in [date_from, date_to) from sessions of
+        all orgs, day by day, rows of a day are replaced in a transaction
+        :return: amount of sessions
+        """
+        fields = (
+            'org_id', 'user', 'user_id', 'asset', 'is_finished',
+            'date_start', 'date_end',
+        )
+        total = 0
+        day = cls.get_period_start(date_from, cls.Period.day)
+        while day < date_to:
+            next_day = cls.get_period_start(day + datetime.timedelta(days=1, hours=1), cls.Period.day)
+            sessions = Session._base_manager.filter(
+                date_start__gte=day, date_start__lt=next_day
+            ).values_list(*fields)
+            sessions = [SessionValues(*values) for values in sessions]
+            rows = cls.aggregate(sessions)
+            objs = [
+                cls(
+                    org_id=org_id, period=period, date_start=date_start,
+                    dimension=dimension, key=key, name=name, count=count,
+                    duration=duration, date_last=date_last
+                )
+                for (org_id, period, date_start, dimension, key), (name, count, duration, date_last)
+                in rows.items()
+            ]
+            with transaction.atomic():
+                cls._base_manager.filter(date_start__gte=day, date_start__lt=next_day).delete()
+                cls._base_manager.bulk_create(objs, batch_size=1000)
+            total += len(sessions)
+            day = next_day
+        return total
+
+    @classmethod
+    def get_daily_metrics(cls, date_from):
+        """
+        Logins, active users and assets of days since `date_from` in one query
+        :return: { date: {'login': n, 'user': n, 'asset': n} }
+        """
+        queryset = cls.objects.filter(period=cls.Period.day, date_start__gte=date_from) \
+            .values('date_start', 'dimension') \
+            .annotate(rows=Count('key', distinct=True), total=Sum('count'))
+        metrics = defaultdict(lambda: {'login': 0, 'user': 0, 'asset': 0})
+        for item in queryset:
+            date = timezone.localtime(item['date_start']).date()
+            metrics[date][item['dimension']] += item['rows']
+            if item['dimension'] == cls.Dimension.user:
+                metrics[date]['login'] += item['total']
+        return metrics
+
+    @classmethod
+    def get_days_queryset(cls, date_from, dimension):
+        return cls.objects.filter(
+            period=cls.Period.day, date_start__gte=date_from, dimension=dimension
+        )
+
+    @classmethod
+    def get_distinct_count(cls, date_from, dimension):
+        return cls.get_days_queryset(date_from, dimension).values('key').distinct().count()
+
+    @classmethod
+    def get_total_count(cls, date_from):
+        queryset = cls.get_days_queryset(date_from, cls.Dimension.user)
+        return queryset.aggregate(total=Sum('count'))['total'] or 0
+
+    @classmethod
+    def get_top(cls, date_from, dimension, limit):
+        """ :return: [{'key', 'name', 'total', 'last'}, ] """
+        return list(
+            cls.get_days_queryset(date_from, dimension)
+            .values('key')
+            .annotate(name=Max('name'), total=Sum('count'), last=Max('date_last'))
+            .order_by('-total')[:limit]
+        )
+
+
+class SessionValues:
+    __slots__ = ('org_id', 'user', 'user_id', 'asset', 'is_finished', 'date_start', 'date_end')
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
@@ -165,6 +165,13 @@ class Session(OrgModelMixin):
         key = self.ACTIVE_CACHE_KEY_PREFIX.format(self.id)
         return bool(cache.get(key))
 
+    @classmethod
+    def get_active_session_ids(cls, session_ids):
+        """ Which of the sessions are active, one `MGET` """
+        keys = {cls.ACTIVE_CACHE_KEY_PREFIX.format(i): str(i) for i in session_ids}
+        values = cache.get_many(keys.keys())
+        return {keys[k] for k, v in values.items() if v}
+
     @property
     def command_amount(self):
         command_store = get_multi_command_storage()
@@ -1,2 +1,26 @@
 # -*- coding: utf-8 -*-
 #
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from common.decorator import on_transaction_commit
+from .models import Task, Session, SessionRollup
+from .utils import TerminalHeartbeatUtil
+
+
+@receiver([post_save, post_delete], sender=Task)
+def on_task_change(sender, instance, **kwargs):
+    if not instance.terminal_id:
+        return
+    on_transaction_commit(TerminalHeartbeatUtil.expire_pending_tasks)(instance.terminal_id)
+
+
+@receiver(post_save, sender=Session)
+def on_session_saved_update_rollup(sender, instance, created, **kwargs):
+    if created:
+        on_transaction_commit(SessionRollup.on_session_created)(instance)
+        return
+    # `_signal_old_is_finished` is set by the pre save handler of org caches
+    old_is_finished = getattr(instance, '_signal_old_is_finished', None)
+    if instance.is_finished and old_is_finished is False:
+        on_transaction_commit(SessionRollup.on_session_finished)(instance)
@@ -2,21 +2,22 @@
 #
 
 import os
-import subprocess
 import datetime
 
 from celery import shared_task
 from celery.utils.log import get_task_logger
 from django.utils import timezone
+from django.db.models.signals import post_save
 from django.core.files.storage import default_storage
 
 from common.utils import get_log_keep_day
+from common.db.retention import RetentionPurger, purge_dated_dirs
 from ops.celery.decorator import (
     register_as_period_task, after_app_ready_start, after_app_shutdown_clean_periodic
 )
-from .models import Status, Session, Command, Task
+from .models import Status, Session, Command, Task, SessionRollup
 from .backends import server_replay_storage
-from .utils import find_session_replay_local
+from .utils import find_session_replay_local, TerminalHeartbeatUtil
 
 CACHE_REFRESH_INTERVAL = 10
 RUNNING = False
@@ -32,23 +33,57 @@ def delete_terminal_status_period():
     Status.objects.filter(date_created__lt=yesterday).delete()
 
 
+ORPHAN_SESSION_BATCH_SIZE = 1000
+
+
+def finish_orphan_sessions(session_ids):
+    """
+    Finish tasks of the unfinished sessions, and finish the sessions not
+    active, with one update of each
+    """
+    session_ids = [str(i) for i in session_ids]
+    now = timezone.now()
+
+    tasks = Task.objects.filter(args__in=session_ids, is_finished=False)
+    terminal_ids = set(tasks.values_list('terminal_id', flat=True))
+    tasks.update(is_finished=True, date_finished=now)
+    for terminal_id in terminal_ids:
+        if terminal_id:
+            TerminalHeartbeatUtil.expire_pending_tasks(terminal_id)
+
+    active_ids = Session.get_active_session_ids(session_ids)
+    orphan_ids = set(session_ids) - active_ids
+    if not orphan_ids:
+        return 0
+
+    sessions = list(Session.objects.filter(id__in=orphan_ids, is_finished=False))
+    Session.objects.filter(id__in=[s.id for s in sessions]).update(
+        is_finished=True, date_end=now
+    )
+    update_fields = ['is_finished', 'date_end']
+    for session in sessions:
+        session.is_finished = True
+        session.date_end = now
+        # What `pre_save` sets, it's not sent
+        session._signal_old_is_finished = False
+        post_save.send(
+            sender=Session, instance=session, created=False,
+            update_fields=update_fields, raw=False, using=Session.objects.db
+        )
+    return len(sessions)
+
+
 @shared_task
 @register_as_period_task(interval=600)
 @after_app_ready_start
 @after_app_shutdown_clean_periodic
 def clean_orphan_session():
-    active_sessions = Session.objects.filter(is_finished=False)
-    for session in active_sessions:
-        # finished task
-        Task.objects.filter(args=str(session.id), is_finished=False).update(
-            is_finished=True, date_finished=timezone.now()
-        )
-        # finished session
-        if session.is_active():
-            continue
-        session.is_finished = True
-        session.date_end = timezone.now()
-        session.save()
+    session_ids = list(Session.objects.filter(is_finished=False).values_list('id', flat=True))
+    finished = 0
+    for i in range(0, len(session_ids), ORPHAN_SESSION_BATCH_SIZE):
+        finished += finish_orphan_sessions(session_ids[i:i + ORPHAN_SESSION_BATCH_SIZE])
+    if finished:
+        logger.info('Finish orphan sessions: {}'.format(finished))
 
 
 @shared_task
@@ -64,16 +99,15 @@ def clean_expired_session_period():
     expired_commands = Command.objects.filter(timestamp__lt=timestamp)
     replay_dir = os.path.join(default_storage.base_location, 'replay')
 
-    expired_sessions.delete()
+    RetentionPurger('terminal_session', expired_sessions).run()
     logger.info("Clean session item done")
-    expired_commands.delete()
+    RetentionPurger('terminal_command', expired_commands).run()
     logger.info("Clean session command done")
-    command = "find %s -mtime +%s \\( -name '*.json' -o -name '*.tar' -o -name '*.gz' \\) -exec rm -f {} \\;" % (
-        replay_dir, days
+    expired_rollups = SessionRollup.objects.filter(date_start__lt=expire_date)
+    RetentionPurger('terminal_session_rollup', expired_rollups).run()
+    purge_dated_dirs(
+        'terminal_replay', replay_dir, expire_date, suffixes=('.json', '.tar', '.gz')
     )
-    subprocess.call(command, shell=True)
-    command = "find %s -type d -empty -delete;" % replay_dir
-    subprocess.call(command, shell=True)
     logger.info("Clean session replay done")
 
 
@@ -1,16 +1,22 @@
 # -*- coding: utf-8 -*-
 #
 import os
+import json
+import time
+import datetime
 from itertools import groupby, chain
 
 from django.conf import settings
+from django.core.cache import cache
 from django.core.files.storage import default_storage
+from django.forms.models import model_to_dict
+from django.utils import timezone
 
 import jms_storage
 
 from common.utils import get_logger
 from . import const
-from .models import ReplayStorage
+from .models import ReplayStorage, Session, Status, Task
 from tickets.models import TicketSession, TicketStep, TicketAssignee
 from tickets.const import StepState
 
@@ -231,12 +237,40 @@ class ComponentsPrometheusMetricsUtil(TypedComponentsStatusMetricsUtil):
                 prometheus_metrics.append(old_metric_text)
         return prometheus_metrics
 
+    @staticmethod
+    def get_command_writer_metrics():
+        from .backends.command.buffer import BufferedBulkWriter
+
+        prometheus_metrics = list()
+        prometheus_metrics.append('# JumpServer command storage write buffer')
+        metric_text = 'jumpserver_command_writer_%s{writer="%s"} %s'
+        metrics_keys = [
+            'queue_depth', 'flushed_total', 'flush_failed_total',
+            'journal_written_total', 'journal_replayed_total',
+            'last_flush_latency', 'max_flush_latency',
+        ]
+        summary = {}
+        for metrics in BufferedBulkWriter.get_all_metrics():
+            writer_summary = summary.setdefault(metrics['name'], {})
+            for key in metrics_keys:
+                value = metrics.get(key, 0)
+                if key.endswith('latency'):
+                    writer_summary[key] = max(writer_summary.get(key, 0), value)
+                else:
+                    writer_summary[key] = writer_summary.get(key, 0) + value
+
+        for name, writer_summary in summary.items():
+            for key, value in writer_summary.items():
+                prometheus_metrics.append(metric_text % (key, name, value))
+        return prometheus_metrics
+
     def get_prometheus_metrics_text(self):
         prometheus_metrics = list()
         for method in [
             self.get_component_status_metrics,
             self.get_component_session_metrics,
-            self.get_component_stat_metrics
+            self.get_component_stat_metrics,
+            self.get_command_writer_metrics,
         ]:
             prometheus_metrics.extend(method())
             prometheus_metrics.append('\n')
@@ -250,3 +284,89 @@ def is_session_approver(session_id, user_id):
         return False
     ok = ticket.has_all_assignee(user_id)
     return ok
+
+
+class TerminalHeartbeatUtil:
+    """
+    Handle a heartbeat of a component in one redis round trip
+
+    Marks sessions active, sets the terminal alive, saves the latest stat,
+    appends the stat to a rolling series, and reads the cached pending tasks
+    of the terminal. Tasks are queried from db only if the cache is missed,
+    the cache is deleted when a task of the terminal saved.
+    """
+    TASKS_CACHE_KEY = 'TERMINAL_PENDING_TASKS_{}'
+    TASKS_CACHE_TTL = 60
+    TASK_PENDING_MINUTES = 10
+    SERIES_KEY = 'TERMINAL_STATUS_SERIES_{}'
+    SERIES_MAX_LENGTH = 720
+    SERIES_TTL = 3600 * 24
+    SESSION_ACTIVE_TTL = 5 * 60
+    ALIVE_TTL = 120
+    STATUS_TTL = 60 * 3
+
+    def __init__(self, terminal):
+        self.terminal = terminal
+        self.cache_client = cache.client
+        self.redis = cache.client.get_client(write=True)
+
+    def _set(self, pipe, key, value, ttl):
+        pipe.set(cache.make_key(key), self.cache_client.encode(value), ex=ttl)
+
+    @classmethod
+    def get_series_key(cls, terminal_id):
+        return cache.make_key(cls.SERIES_KEY.format(terminal_id))
+
+    def handle(self, stat, session_ids):
+        """ :return: pending tasks data """
+        terminal_id = str(self.terminal.id)
+        data = model_to_dict(stat)
+        point = {k: data.get(k) for k in ('cpu_load', 'memory_used', 'disk_used', 'session_online')}
+        point['date_created'] = time.time()
+        series_key = self.get_series_key(terminal_id)
+
+        pipe = self.redis.pipeline(transaction=False)
+        for session_id in session_ids:
+            key = Session.ACTIVE_CACHE_KEY_PREFIX.format(session_id)
+            self._set(pipe, key, session_id, self.SESSION_ACTIVE_TTL)
+        self._set(pipe, self.terminal.ALIVE_KEY.format(terminal_id), True, self.ALIVE_TTL)
+        self._set(pipe, Status.CACHE_KEY.format(terminal_id), data, self.STATUS_TTL)
+        pipe.rpush(series_key, json.dumps(point, default=str))
+        pipe.ltrim(series_key, -self.SERIES_MAX_LENGTH, -1)
+        pipe.expire(series_key, self.SERIES_TTL)
+        pipe.get(cache.make_key(self.TASKS_CACHE_KEY.format(terminal_id)))
+        results = pipe.execute()
+
+        tasks = results[-1]
+        if tasks is None:
+            tasks = self.refresh_pending_tasks()
+        else:
+            tasks = self.cache_client.decode(tasks)
+        critical_time = time.time() - self.TASK_PENDING_MINUTES * 60
+        return [task for date_created, task in tasks if date_created >= critical_time]
+
+    def refresh_pending_tasks(self):
+        """ :return: [(date_created_timestamp, task_data), ] """
+        from .serializers import TaskSerializer
+
+        critical_time = timezone.now() - datetime.timedelta(minutes=self.TASK_PENDING_MINUTES)
+        tasks = Task.objects.filter(
+            terminal=self.terminal, is_finished=False, date_created__gte=critical_time
+        )
+        tasks = [
+            (task.date_created.timestamp(), TaskSerializer(task).data)
+            for task in tasks
+        ]
+        cache.set(self.TASKS_CACHE_KEY.format(self.terminal.id), tasks, self.TASKS_CACHE_TTL)
+        return tasks
+
+    @classmethod
+    def expire_pending_tasks(cls, terminal_id):
+        cache.delete(cls.TASKS_CACHE_KEY.format(terminal_id))
+
+    @classmethod
+    def get_status_series(cls, terminal_id, limit=SERIES_MAX_LENGTH):
+        """ :return: [{'cpu_load':, 'memory_used':, 'disk_used':, 'session_online':, 'date_created': }, ] """
+        redis = cache.client.get_client()
+        points = redis.lrange(cls.get_series_key(terminal_id), -limit, -1)
+        return [json.loads(p) for p in points]
@@ -7,7 +7,7 @@ from rest_framework import generics
 from rest_framework.response import Response
 from rest_framework_bulk import BulkModelViewSet
 
-from common.mixins import CommonApiMixin
+from common.mixins import CommonApiMixin, ChunkedImportMixin
 from common.utils import get_logger
 from common.mixins.api import SuggestionMixin
 from orgs.utils import current_org, tmp_to_root_org
@@ -31,7 +31,7 @@ __all__ = [
 ]
 
 
-class UserViewSet(CommonApiMixin, UserQuerysetMixin, SuggestionMixin, BulkModelViewSet):
+class UserViewSet(CommonApiMixin, ChunkedImportMixin, UserQuerysetMixin, SuggestionMixin, BulkModelViewSet):
     filterset_class = UserFilter
     search_fields = ('username', 'email', 'name')
     serializer_classes = {
@@ -54,6 +54,8 @@ class UserViewSet(CommonApiMixin, UserQuerysetMixin, SuggestionMixin, BulkModelV
 
     def paginate_queryset(self, queryset):
         page = super().paginate_queryset(queryset)
+        if self.is_stream_exporting:
+            return page
 
         if page:
             page = self.set_users_roles_for_cache(page)
@@ -61,6 +63,9 @@ class UserViewSet(CommonApiMixin, UserQuerysetMixin, SuggestionMixin, BulkModelV
             self.set_users_roles_for_cache(queryset)
         return page
 
+    def process_stream_export_objects(self, objs):
+        return self.set_users_roles_for_cache(objs)
+
     @action(methods=['get'], detail=False, url_path='suggestions')
     def match(self, request, *args, **kwargs):
         with tmp_to_root_org():
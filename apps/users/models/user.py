@@ -328,6 +328,7 @@ class RoleMixin:
     _org_roles = None
     _system_roles = None
     PERM_CACHE_KEY = 'USER_PERMS_{}_{}'
+    _perms_memo = None
     _is_superuser = None
     _update_superuser = False
 
@@ -343,23 +344,50 @@ class RoleMixin:
     def system_roles(self):
         return SystemRoleManager(self)
 
-    @lazyproperty
-    def perms(self):
-        key = self.PERM_CACHE_KEY.format(self.id, current_org.id)
-        perms = cache.get(key)
-        if not perms or settings.DEBUG:
-            perms = self.get_all_permissions()
-            cache.set(key, perms, 3600)
+    @property
+    def perms(self) -> frozenset:
+        """
+        Memoized on the instance per org, a request checks perms with at most
+        one cache round-trip. The cache is stamped with the roles and role
+        bindings versions, bumped when roles or bindings change.
+        """
+        from rbac.models import Role, RoleBinding
+
+        org_id = str(current_org.id)
+        if self._perms_memo is None:
+            self._perms_memo = {}
+        if org_id in self._perms_memo:
+            return self._perms_memo[org_id]
+
+        key = self.PERM_CACHE_KEY.format(self.id, org_id)
+        version_keys = [Role.PERMS_VERSION_CACHE_KEY, RoleBinding.BINDINGS_VERSION_CACHE_KEY]
+        values = cache.get_many([key, *version_keys])
+        versions = tuple(values.get(k) for k in version_keys)
+
+        cached = values.get(key)
+        if cached and cached[0] == versions and not settings.DEBUG:
+            perms = cached[1]
+        else:
+            if None in versions:
+                versions = (Role.get_perms_version(), RoleBinding.get_bindings_version())
+            perms = RoleBinding.get_user_compiled_perms(self, version=versions[0])
+            cache.set(key, (versions, perms), 3600)
+        self._perms_memo[org_id] = perms
         return perms
 
     def expire_rbac_perms_cache(self):
         key = self.PERM_CACHE_KEY.format(self.id, '*')
         cache.delete_pattern(key)
+        self._perms_memo = None
 
     @classmethod
     def expire_users_rbac_perms_cache(cls):
-        key = cls.PERM_CACHE_KEY.format('*', '*')
-        cache.delete_pattern(key)
+        from rbac.models import RoleBinding
+        RoleBinding.expire_bindings_cache()
+
+    def has_perms_batch(self, perm_list):
+        from rbac.backends import has_perms_batch
+        return has_perms_batch(self, perm_list)
 
     @property
     def is_superuser(self):
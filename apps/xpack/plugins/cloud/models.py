@@ -50,6 +50,10 @@ class Account(CommonModelMixin, OrgModelMixin):
 
     @lazyproperty
     def provider_instance(self) -> BaseProvider:
+        return self.new_provider_instance()
+
+    def new_provider_instance(self) -> BaseProvider:
+        """ Clients of a provider keep the region, use one in a thread """
         path = f'xpack.plugins.cloud.providers.{self.provider}.Provider'
         provider_class = import_string(path)
         provider = provider_class(account=self)
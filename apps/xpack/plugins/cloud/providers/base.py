@@ -31,18 +31,26 @@ class BaseProvider:
             asset_id = asset_id[:18] + org_id[:18]
         return uuid.UUID(asset_id)
 
-    def build_asset_hostname(self, instance, hostname_strategy, asset_ip):
-        asset_id = self.build_asset_id(instance)
+    def build_asset_base_hostname(self, instance, hostname_strategy, asset_ip):
         instance_name = self.get_instance_name(instance) or 'untitled'
         if hostname_strategy == const.HostnameStrategyChoices.instance_name_partial_ip:
             asset_ip_last_two_bit = '.'.join(asset_ip.split('.')[2:])
             hostname = '{}-{}'.format(instance_name, asset_ip_last_two_bit)
         else:
             hostname = instance_name
+        return hostname
+
+    def build_asset_unique_hostname(self, instance, hostname):
+        """ Used when the base hostname is taken by another asset """
+        instance_id = self.get_instance_id(instance)
+        instance_id_last_four_bit = instance_id[-4:]
+        return '{}-{}'.format(hostname, instance_id_last_four_bit)
+
+    def build_asset_hostname(self, instance, hostname_strategy, asset_ip):
+        asset_id = self.build_asset_id(instance)
+        hostname = self.build_asset_base_hostname(instance, hostname_strategy, asset_ip)
         if Asset.objects.exclude(id=asset_id).filter(hostname=hostname).exists():
-            instance_id = self.get_instance_id(instance)
-            instance_id_last_four_bit = instance_id[-4:]
-            hostname = '{}-{}'.format(hostname, instance_id_last_four_bit)
+            hostname = self.build_asset_unique_hostname(instance, hostname)
         return hostname
 
     def build_asset_ip(self, instance, ip_network_segment_group):
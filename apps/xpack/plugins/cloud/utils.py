@@ -1,15 +1,21 @@
 # -*- coding: utf-8 -*-
 #
 import json
+import uuid
+from collections import defaultdict
 
-from django.db import transaction
-from django.utils import translation
+from django.db import transaction, close_old_connections
+from django.utils import translation, timezone
 from django.utils.translation import gettext as _
 
 from termcolor import colored
 from common.utils import get_logger, get_object_or_none
 from common.utils.ip import contains_ip
+from common.thread_pools import SingletonThreadPoolExecutor
+from orgs.utils import get_current_org, tmp_to_org
+from orgs.signal_handlers.cache import OrgResourceStatisticsRefreshUtil
 from assets.models import Asset, ProtocolsMixin, Domain, Node
+from assets.tasks import update_assets_hardware_info_util, test_asset_connectivity_util
 from . import const
 
 logger = get_logger(__name__)
@@ -37,7 +43,21 @@ class ColoredPrinter(object):
 colored_printer = ColoredPrinter()
 
 
+class CloudSyncThreadPoolExecutor(SingletonThreadPoolExecutor):
+    pass
+
+
 class SyncTaskManager:
+    """
+    Instances of regions are fetched concurrently, a provider for a region.
+    Instances of a region are diffed with the assets and sync instances in
+    memory and written by bulk, the nodes relation by one add of a node.
+    If the bulk write of a region fails, its instances are synced one by one.
+    """
+    region_workers = 10
+    batch_size = 1000
+    asset_update_fields = ['ip', 'public_ip', 'hostname', 'admin_user', 'created_by']
+
     def __init__(self, execution):
         self.execution = execution
         self.task = execution.task
@@ -45,6 +65,11 @@ class SyncTaskManager:
         self.provider = execution.task.account.provider_instance
         self.cloud_instance_ids = []
         self.result = {'new': [], 'sync': [], 'unsync': [], 'released': []}
+        # { instance_id: SyncInstanceDetail }
+        self.sync_instances = {}
+        # { (node_name, ): Node }
+        self.nodes = {}
+        self.domains = {}
 
     def run(self):
         print("Начинается выполнение задачи: {}\n".format(self.task))
@@ -91,12 +116,17 @@ class SyncTaskManager:
         print("Выполнение задачи заканчивается!\n")
 
     def sync(self):
+        from .models import SyncInstanceDetail
+
         region_ids = self.task.regions
         print("Список регионов синхронизации: {}\n".format(region_ids))
-        for region_id in region_ids:
+        self.sync_instances = {
+            i.instance_id: i for i in SyncInstanceDetail.objects.filter(task=self.task)
+        }
+        for region_id, instances in self.fetch_regions_instances(region_ids):
             print("\n{}".format("="*50))
             print("Регион: {}".format(region_id))
-            self.sync_instances_of_region(region_id=region_id)
+            self.sync_instances_of_region(region_id, instances)
 
         released_instances = self._get_released_instances()
         released_instances.update(status=const.InstanceStatusChoices.released)
@@ -105,27 +135,274 @@ class SyncTaskManager:
 
     def _get_released_instances(self):
         from .models import SyncInstanceDetail
-        instances_saved = SyncInstanceDetail.objects.filter(task=self.task)
-        instance_ids_saved = instances_saved.values_list('instance_id', flat=True)
-        instance_ids_absent = set(instance_ids_saved) - set(self.cloud_instance_ids)
-        instances_absent = instances_saved.filter(instance_id__in=instance_ids_absent)
-        return instances_absent
+        instance_ids_absent = set(self.sync_instances.keys()) - set(self.cloud_instance_ids)
+        ids = [self.sync_instances[i].id for i in instance_ids_absent]
+        return SyncInstanceDetail.objects.filter(id__in=ids)
 
-    def sync_instances_of_region(self, region_id):
+    def fetch_instances_of_region(self, org, region_id):
+        # Provider clients keep the region, not shared between threads
         try:
-            instances = self.provider.get_instances_of_region(region_id)
-        except Exception as e:
-            error = 'Get instances of region error, region: {}, error: {}'.format(region_id, str(e))
-            colored_printer.red(error)
-            logger.error(error, exc_info=True)
-            instances = []
+            with tmp_to_org(org):
+                provider = self.account.new_provider_instance()
+                instances = provider.get_instances_of_region(region_id)
+                for instance in instances:
+                    properties = {'region_id': region_id}
+                    provider.preset_instance_properties(instance, properties)
+                return instances
+        finally:
+            close_old_connections()
+
+    def fetch_regions_instances(self, region_ids):
+        """ :return: (region_id, instances) in the order of region_ids """
+        executor = CloudSyncThreadPoolExecutor(
+            max_workers=self.region_workers, thread_name_prefix='cloud_sync'
+        )
+        org = get_current_org()
+        futures = [
+            (region_id, executor.submit(self.fetch_instances_of_region, org, region_id))
+            for region_id in region_ids
+        ]
+        for region_id, future in futures:
+            try:
+                instances = future.result()
+            except Exception as e:
+                error = 'Get instances of region error, region: {}, error: {}'.format(region_id, str(e))
+                colored_printer.red(error)
+                logger.error(error, exc_info=True)
+                instances = []
+            yield region_id, instances
+
+    def sync_instances_of_region(self, region_id, instances):
+        items = []
+        unsync_items = []
         for instance in instances:
-            properties = {'region_id': region_id}
-            self.provider.preset_instance_properties(instance, properties)
-
             if not self.can_sync(instance):
                 continue
-            self.sync_instance(instance=instance, region_id=region_id)
+            try:
+                items.append(self.build_instance_item(instance))
+            except Exception as e:
+                unsync_items.append((instance, e))
+
+        try:
+            with translation.override('en'):
+                self.prepare_items(items)
+            with transaction.atomic():
+                plan = self.bulk_sync_items(region_id, items, unsync_items)
+        except Exception as e:
+            logger.error(e, exc_info=True)
+            colored_printer.red("Пакетная синхронизация региона не удалась, синхронизация по одному: {}".format(e))
+            for instance in [item['instance'] for item in items] + [i for i, __ in unsync_items]:
+                self.sync_instance(instance=instance, region_id=region_id)
+            return
+        self.on_region_synced(region_id, plan)
+
+    def build_instance_item(self, instance):
+        ip = self.provider.build_asset_ip(instance, self.task.ip_network_segment_group)
+        return {
+            'instance': instance,
+            'instance_id': self.provider.get_instance_id(instance),
+            'instance_uuid': uuid.UUID(self.provider.get_instance_uuid(instance)),
+            'asset_id': self.provider.build_asset_id(instance),
+            'ip': ip,
+            'public_ip': self.provider.build_asset_public_ip(instance),
+            'hostname': self.provider.build_asset_base_hostname(
+                instance, self.task.hostname_strategy, ip
+            ),
+            'platform': self.provider.build_asset_platform(instance),
+        }
+
+    def prepare_items(self, items):
+        """ Match the assets, and get or create nodes and domains of new assets """
+        asset_ids = set()
+        for item in items:
+            asset_ids.update([item['instance_uuid'], item['asset_id']])
+        assets = Asset.objects.filter(id__in=asset_ids).select_related('platform').in_bulk()
+
+        for item in items:
+            asset = assets.get(item['instance_uuid']) or assets.get(item['asset_id'])
+            item['asset'] = asset
+            if asset:
+                continue
+            instance = item['instance']
+            item['node'] = self.get_asset_node(instance)
+            item['domain'] = self.get_asset_domain(instance)
+
+    def get_asset_node(self, instance):
+        nodes_name = tuple(self.provider.build_asset_nodes_name(instance=instance))
+        node = self.nodes.get(nodes_name)
+        if node:
+            return node
+        node = self.task.node
+        for node_name in nodes_name:
+            node, created = node.get_or_create_child(node_name)
+        self.nodes[nodes_name] = node
+        return node
+
+    def get_asset_domain(self, instance):
+        domain_id = self.provider.build_asset_domain_id(instance)
+        domain = self.domains.get(domain_id)
+        if domain:
+            return domain
+        domain_name = self.provider.build_asset_domain_name(instance)
+        defaults = {'id': domain_id, 'name': domain_name, 'comment': domain_name}
+        domain, created = Domain.objects.get_or_create(id=domain_id, defaults=defaults)
+        self.domains[domain_id] = domain
+        return domain
+
+    def get_hostnames_taken(self, items):
+        """ :return: { hostname: {asset_id, } } """
+        hostnames = set()
+        for item in items:
+            hostname = item['hostname']
+            hostnames.add(hostname)
+            hostnames.add(self.provider.build_asset_unique_hostname(item['instance'], hostname))
+        taken = defaultdict(set)
+        queryset = Asset.objects.filter(hostname__in=hostnames).values_list('hostname', 'id')
+        for hostname, asset_id in queryset:
+            taken[hostname].add(asset_id)
+        return taken
+
+    def bulk_sync_items(self, region_id, items, unsync_items):
+        """ Write the assets and sync instances of a region, results are returned """
+        unsync_items = list(unsync_items)
+        plan = {
+            'result': defaultdict(list), 'cloud_instance_ids': [],
+            'created': [], 'admin_user_changed': [], 'sync_instances': {},
+        }
+        # [(instance_id, status, asset), ]
+        statuses = []
+        to_update = []
+        node_assets = defaultdict(list)
+        taken = self.get_hostnames_taken(items)
+
+        for item in items:
+            instance_id = item['instance_id']
+            asset = item['asset']
+            hostname = item['hostname']
+            if taken[hostname] - {item['asset_id']}:
+                hostname = self.provider.build_asset_unique_hostname(item['instance'], hostname)
+
+            if asset and not self.task.is_always_update:
+                statuses.append((instance_id, const.InstanceStatusChoices.exist, asset))
+                plan['result']['sync'].append({'id': instance_id, 'region': region_id, 'asset': asset.hostname})
+                continue
+
+            owner_ids = {item['asset_id'], asset.id if asset else item['asset_id']}
+            if taken[hostname] - owner_ids:
+                error = 'Hostname exists: {}'.format(hostname)
+                unsync_items.append((item['instance'], error))
+                continue
+
+            platform = asset.platform if asset else item['platform']
+            attrs = {
+                'ip': item['ip'],
+                'public_ip': item['public_ip'],
+                'hostname': hostname,
+                'admin_user': self.get_asset_admin_user(platform),
+                'created_by': 'System'
+            }
+            if asset:
+                taken[asset.hostname].discard(asset.id)
+                admin_user_id = asset.admin_user_id
+                for attr, value in attrs.items():
+                    setattr(asset, attr, value)
+                if asset.admin_user_id != admin_user_id:
+                    plan['admin_user_changed'].append(asset)
+                to_update.append(asset)
+                status, result_key = const.InstanceStatusChoices.exist, 'sync'
+            else:
+                asset = Asset(
+                    id=item['asset_id'], platform=platform, protocols=self.task.protocols,
+                    domain=item['domain'], **attrs
+                )
+                node_assets[item['node']].append(asset)
+                plan['created'].append(asset)
+                status, result_key = const.InstanceStatusChoices.sync, 'new'
+            taken[hostname].add(asset.id)
+            statuses.append((instance_id, status, asset))
+            plan['result'][result_key].append({'id': instance_id, 'region': region_id, 'asset': hostname})
+
+        for instance, error in unsync_items:
+            try:
+                instance_id = self.provider.get_instance_id(instance)
+            except:
+                instance_id = ''
+            if instance_id is None:
+                instance_id = ''
+            colored_printer.red("Не удалось синхронизировать экземпляр! {} {}".format(instance_id, error))
+            statuses.append((instance_id, const.InstanceStatusChoices.unsync, None))
+            plan['result']['unsync'].append({'id': instance_id, 'region': region_id})
+
+        if plan['created']:
+            Asset.objects.bulk_create(plan['created'], batch_size=self.batch_size)
+        if to_update:
+            Asset.objects.bulk_update(to_update, self.asset_update_fields, batch_size=self.batch_size)
+        for node, assets in node_assets.items():
+            print("Добавить {} ресурсов к ноде: {}".format(len(assets), node.full_value))
+            node.assets.add(*assets)
+
+        plan['sync_instances'] = self.bulk_sync_instances(region_id, statuses)
+        plan['cloud_instance_ids'] = [instance_id for instance_id, __, __ in statuses]
+        return plan
+
+    def bulk_sync_instances(self, region_id, statuses):
+        from .models import SyncInstanceDetail
+
+        now = timezone.now()
+        sync_instances = {}
+        to_create = []
+        to_update = []
+        for instance_id, status, asset in statuses:
+            if instance_id in sync_instances:
+                continue
+            instance = self.sync_instances.get(instance_id)
+            if not instance:
+                instance = SyncInstanceDetail(
+                    task=self.task, execution=self.execution, instance_id=instance_id,
+                    region=region_id, asset=asset, status=status, date_sync=now
+                )
+                to_create.append(instance)
+            else:
+                if instance.status != status:
+                    instance.status = status
+                    instance.execution = self.execution
+                instance.asset = asset
+                instance.date_sync = now
+                to_update.append(instance)
+            sync_instances[instance_id] = instance
+
+        SyncInstanceDetail.objects.bulk_create(to_create, batch_size=self.batch_size)
+        SyncInstanceDetail.objects.bulk_update(
+            to_update, ['status', 'execution', 'asset', 'date_sync'], batch_size=self.batch_size
+        )
+        return sync_instances
+
+    def on_region_synced(self, region_id, plan):
+        """ Merge the results, and do what the asset signals do """
+        for key, results in plan['result'].items():
+            self.result[key].extend(results)
+        self.cloud_instance_ids.extend(plan['cloud_instance_ids'])
+        self.sync_instances.update(plan['sync_instances'])
+
+        for asset in plan['created'] + plan['admin_user_changed']:
+            try:
+                asset.set_admin_user_relation()
+            except Exception as e:
+                logger.error('Set asset admin user relation error: {} {}'.format(asset, e))
+
+        created = plan['created']
+        if created:
+            # Bulk created, no post_save to expire the amount
+            OrgResourceStatisticsRefreshUtil.refresh_if_need(created[0])
+        for i in range(0, len(created), self.batch_size):
+            assets = created[i:i + self.batch_size]
+            update_assets_hardware_info_util.delay(assets)
+            test_asset_connectivity_util.delay(assets)
+
+        print("Регион: {}, добавлено: {}, синхронизировано: {}, несинхронизировано: {}".format(
+            region_id, len(plan['result']['new']), len(plan['result']['sync']),
+            len(plan['result']['unsync'])
+        ))
 
     def can_sync(self, instance):
         ip = self.provider.build_asset_ip(instance, self.task.ip_network_segment_group)
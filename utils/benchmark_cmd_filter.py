@@ -0,0 +1,93 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Compare command filter matching:
+#   old: search compiled rules one by one
+#   new: CommandFilterMatcher, only search the rules hit by words of the command
+#
+# Usage: python benchmark_cmd_filter.py [rules_amount] [commands_amount]
+#
+import os
+import re
+import sys
+import time
+import random
+import string
+
+if os.path.exists('../apps'):
+    sys.path.insert(0, '../apps')
+elif os.path.exists('./apps'):
+    sys.path.insert(0, './apps')
+
+from assets.cmd_filter_matcher import CommandFilterMatcher, construct_command_regex
+
+DENY, ALLOW, CONFIRM = 0, 9, 2
+
+
+def random_word(length=8):
+    return ''.join(random.choice(string.ascii_lowercase) for __ in range(length))
+
+
+def generate_rules(amount):
+    random.seed(0)
+    rules = []
+    for i in range(amount):
+        if i % 10 == 0:
+            regex = r'^{}\s+(-\w+)?'.format(random_word())
+        else:
+            regex = construct_command_regex('\n'.join(random_word() for __ in range(3)))
+        action = random.choice([DENY, ALLOW, CONFIRM])
+        rules.append((str(i), regex, random.random() > 0.5, action))
+    rules.append(('rm', construct_command_regex('rm -rf\nreboot'), True, DENY))
+    return rules
+
+
+def generate_commands(amount):
+    random.seed(1)
+    commands = ['ls -al', 'cd /tmp', 'rm -rf /', 'REBOOT', 'cat /etc/hosts']
+    return [
+        random.choice(commands) + ' ' + random_word(4) for __ in range(amount)
+    ]
+
+
+def old_match(compiled_rules, command):
+    for rule_id, pattern, action in compiled_rules:
+        found = pattern.search(command)
+        if found:
+            return rule_id, action, found.group()
+    return None
+
+
+def measure(title, func, times=1):
+    start = time.perf_counter()
+    for __ in range(times):
+        result = func()
+    used = (time.perf_counter() - start) / times
+    print(f'  {title:<28} {used * 1000:>10.2f} ms')
+    return result
+
+
+def main():
+    rules_amount = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    commands_amount = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    print(f'Generate rules={rules_amount} commands={commands_amount}')
+    rules = generate_rules(rules_amount)
+    commands = generate_commands(commands_amount)
+
+    print('Old (one by one)')
+    compiled_rules = measure('compile', lambda: [
+        (rule_id, re.compile(regex, re.IGNORECASE if ignore_case else 0), action)
+        for rule_id, regex, ignore_case, action in rules
+    ])
+    old_results = measure('match', lambda: [old_match(compiled_rules, c) for c in commands])
+
+    print('New (CommandFilterMatcher)')
+    matcher = measure('build', lambda: CommandFilterMatcher(rules))
+    new_results = measure('match', lambda: matcher.match_many(commands))
+
+    for old, new in zip(old_results, new_results):
+        assert old == (tuple(new) if new else None), (old, new)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Compare list of models with encrypted fields:
+#   eager: decrypt all encrypted fields when rows load (the old way)
+#   lazy: decrypt at first access, list endpoints don't read secrets
+# And decrypt of prefixed ciphertext vs the old values without prefix.
+#
+# Usage: python benchmark_encrypt_fields.py [rows_limit]
+#
+import os
+import sys
+import time
+
+import django
+
+if os.path.exists('../apps'):
+    sys.path.insert(0, '../apps')
+elif os.path.exists('./apps'):
+    sys.path.insert(0, './apps')
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "jumpserver.settings")
+django.setup()
+
+from common.db.fields import EncryptMixin
+from common.utils import crypto
+from orgs.utils import tmp_to_root_org
+from assets.models import SystemUser, AuthBook, Gateway
+from assets.serializers import SystemUserSerializer, AccountSerializer, GatewaySerializer
+
+
+def measure(title, func, times=3):
+    cost = []
+    result = None
+    for __ in range(times):
+        start = time.perf_counter()
+        result = func()
+        cost.append(time.perf_counter() - start)
+    print(f'  {title:<28} {min(cost) * 1000:>10.2f} ms')
+    return result
+
+
+def get_encrypt_fields(model):
+    return [f.attname for f in model._meta.concrete_fields if isinstance(f, EncryptMixin)]
+
+
+def bench_list(model, serializer_class, limit):
+    fields = get_encrypt_fields(model)
+    queryset = model.objects.all()[:limit]
+    print(f'{model.__name__}: rows={len(queryset)} encrypt fields={fields}')
+
+    def eager():
+        objs = list(queryset.all())
+        for obj in objs:
+            for name in fields:
+                getattr(obj, name)
+        return serializer_class(objs, many=True).data
+
+    def lazy():
+        objs = list(queryset.all())
+        return serializer_class(objs, many=True).data
+
+    measure('eager list', eager)
+    measure('lazy list', lazy)
+
+
+def bench_decrypt(amount=10000):
+    secret = 'Password-123!' * 4
+    prefixed = [crypto.encrypt(secret) for __ in range(amount)]
+    legacy = [crypto.split_prefix(text)[1] for text in prefixed]
+    print(f'Decrypt: amount={amount} algo={crypto.algo}')
+    measure('prefixed', lambda: [crypto.decrypt(text) for text in prefixed])
+    measure('legacy (try in order)', lambda: [crypto.decrypt(text) for text in legacy])
+
+
+def main():
+    limit = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    with tmp_to_root_org():
+        bench_list(SystemUser, SystemUserSerializer, limit)
+        bench_list(AuthBook, AccountSerializer, limit)
+        bench_list(Gateway, GatewaySerializer, limit)
+    bench_decrypt()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Compare the node asset ids mapping cache formats:
+#   old: pickled defaultdict(set) of asset id strings
+#   new: NodeAssetIdsMapping binary blob
+#
+# The new format loads faster and takes less memory, a node lookup is slower
+# since it builds a set of decoded ids instead of copying a stored set.
+#
+# Usage: python benchmark_node_assets_mapping.py [assets_amount] [nodes_amount]
+#
+import os
+import sys
+import time
+import uuid
+import random
+import pickle
+import tracemalloc
+from collections import defaultdict
+
+if os.path.exists('../apps'):
+    sys.path.insert(0, '../apps')
+elif os.path.exists('./apps'):
+    sys.path.insert(0, './apps')
+
+from assets.node_mapping import NodeAssetIdsMapping
+
+
+def get_ancestor_keys(key):
+    parts = key.split(':')
+    return [':'.join(parts[:i]) for i in range(1, len(parts) + 1)]
+
+
+def generate_mapping(assets_amount, nodes_amount):
+    random.seed(0)
+    keys = ['1']
+    children_count = defaultdict(int)
+    while len(keys) < nodes_amount:
+        parent = random.choice(keys[-200:] + keys[:10])
+        children_count[parent] += 1
+        keys.append(f'{parent}:{children_count[parent]}')
+
+    mapping = defaultdict(set)
+    for __ in range(assets_amount):
+        asset_id = str(uuid.uuid4())
+        for node_key in random.sample(keys, random.randint(1, 2)):
+            for ancestor_key in get_ancestor_keys(node_key):
+                mapping[ancestor_key].add(asset_id)
+    return mapping, keys
+
+
+def measure(title, func, times=1):
+    start = time.perf_counter()
+    for __ in range(times):
+        result = func()
+    used = (time.perf_counter() - start) / times
+    print(f'  {title:<28} {used * 1000:>10.2f} ms')
+    return result
+
+
+def measure_memory(title, func):
+    tracemalloc.start()
+    result = func()
+    current, __ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'  {title:<28} {current / 1024 / 1024:>10.2f} MB')
+    return result
+
+
+def main():
+    assets_amount = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    nodes_amount = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    print(f'Generate mapping: assets={assets_amount} nodes={nodes_amount}')
+    mapping, keys = generate_mapping(assets_amount, nodes_amount)
+    random.seed(1)
+    lookup_keys = [random.sample(keys, 20) for __ in range(50)]
+
+    print('Old format (pickled dict of sets)')
+    old_data = measure('dumps', lambda: pickle.dumps(mapping))
+    print(f'  {"blob size":<28} {len(old_data) / 1024 / 1024:>10.2f} MB')
+    measure('loads', lambda: pickle.loads(old_data))
+    old_mapping = measure_memory('memory', lambda: pickle.loads(old_data))
+
+    def old_lookup():
+        for ks in lookup_keys:
+            for k in ks:
+                set(old_mapping.get(k, []))
+    measure('node lookup (20 keys)', old_lookup, times=5)
+
+    print('New format (NodeAssetIdsMapping)')
+    compact = measure('from_dict', lambda: NodeAssetIdsMapping.from_dict(mapping))
+    new_data = measure('to_bytes', compact.to_bytes)
+    print(f'  {"blob size":<28} {len(new_data) / 1024 / 1024:>10.2f} MB')
+    measure('from_bytes', lambda: NodeAssetIdsMapping.from_bytes(new_data))
+    new_mapping = measure_memory('memory', lambda: NodeAssetIdsMapping.from_bytes(new_data))
+
+    def new_lookup():
+        for ks in lookup_keys:
+            for k in ks:
+                new_mapping.get(k, set())
+    measure('node lookup (20 keys)', new_lookup, times=5)
+
+    for ks in lookup_keys[:5]:
+        for k in ks:
+            assert new_mapping.get(k, set()) == set(old_mapping.get(k, []))
+
+
+if __name__ == '__main__':
+    main()